@@ -0,0 +1,197 @@
+import queue
+import time
+import numpy as np
+import torch as th
+import torch.multiprocessing as mp
+
+def _actor(env_fn, policy, shared_params, version, lock, rollouts, stop, n_steps, gamma, total_steps):
+    """Actor process: step the environments with a stale policy copy and
+    queue finished rollouts (see ActorLearner)"""
+    th.set_num_threads(1)
+    env = env_fn()
+    policy.set_training_mode(False)
+    local_version = -1
+    obs = env.reset()
+    n_envs = env.num_envs
+    episode_starts = np.ones(n_envs, dtype=bool)
+    produced = 0
+    try:
+        while produced < total_steps and not stop.is_set():
+            # Pick up the latest published weights
+            if version.value != local_version:
+                with lock, th.no_grad():
+                    for param, shared in zip(policy.parameters(), shared_params):
+                        param.copy_(shared)
+                    local_version = version.value
+
+            rollout = {
+                "version": local_version,
+                "observations": np.zeros((n_steps, n_envs) + obs.shape[1:], dtype=np.float32),
+                "actions": np.zeros((n_steps, n_envs, 1), dtype=np.float32),
+                "rewards": np.zeros((n_steps, n_envs), dtype=np.float32),
+                "episode_starts": np.zeros((n_steps, n_envs), dtype=np.float32),
+                "values": np.zeros((n_steps, n_envs), dtype=np.float32),
+                "log_probs": np.zeros((n_steps, n_envs), dtype=np.float32),
+                "episodes": [],
+            }
+            started = time.perf_counter()
+            for step in range(n_steps):
+                # One batched inference call for every environment
+                with th.no_grad():
+                    actions, values, log_probs = policy(th.as_tensor(obs))
+                actions = actions.numpy()
+                new_obs, rewards, dones, infos = env.step(actions)
+
+                # Bootstrap time-limit truncations, as PPO.collect_rollouts does
+                done_indices = np.flatnonzero(dones)
+                truncated = [i for i in done_indices if infos[i].get("TimeLimit.truncated", False)]
+                if truncated:
+                    terminal = np.stack([infos[i]["terminal_observation"] for i in truncated])
+                    with th.no_grad():
+                        terminal_values = policy.predict_values(th.as_tensor(terminal)).numpy().ravel()
+                    rewards[truncated] += gamma * terminal_values
+
+                rollout["observations"][step] = obs
+                rollout["actions"][step, :, 0] = actions
+                rollout["rewards"][step] = rewards
+                rollout["episode_starts"][step] = episode_starts
+                rollout["values"][step] = values.numpy().ravel()
+                rollout["log_probs"][step] = log_probs.numpy()
+                rollout["episodes"].extend({"episode": infos[i]["episode"]} for i in done_indices
+                                           if "episode" in infos[i])
+                obs, episode_starts = new_obs, dones
+
+            with th.no_grad():
+                rollout["last_values"] = policy.predict_values(th.as_tensor(obs)).numpy().ravel()
+            rollout["dones"] = episode_starts
+            rollout["acting"] = time.perf_counter() - started
+            produced += n_steps * n_envs
+
+            while not stop.is_set():
+                try:
+                    rollouts.put(rollout, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+    finally:
+        # End-of-experience marker (dropped if the learner has stopped)
+        while not stop.is_set():
+            try:
+                rollouts.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        env.close()
+
+class ActorLearner:
+    """Asynchronous actor/learner training for an SB3 PPO model.
+
+    An actor process builds the environments with env_fn (for example a
+    SharedMemoryVecEnv, whose workers then step the games) and keeps stepping
+    them while the learner, in this process, runs PPO's optimization epochs.
+    Actions for every environment come from one batched forward pass of the
+    actor's copy of the policy. After each update the learner copies its
+    weights into shared-memory tensors and the actor loads them before its
+    next rollout, so experience is at most a few updates stale. Rollouts
+    (n_steps per environment, with the behaviour policy's values and
+    log-probs, as PPO expects) go through a bounded queue; queue_size bounds
+    both memory and the policy lag.
+
+    The model's own env only provides the spaces and the number of
+    environments, which must match env_fn's. Logged under actor_learner/:
+    queue depth, policy lag (learner updates between acting and training on
+    a rollout), learner utilization (share of wall time in train()) and actor
+    utilization (share of wall time spent stepping rather than waiting on a
+    full queue).
+    """
+
+    def __init__(self, model, env_fn, queue_size=2, start_method="forkserver"):
+        self.model = model
+        self.env_fn = env_fn
+        self.ctx = mp.get_context(start_method)
+        self.queue = self.ctx.Queue(maxsize=queue_size)
+
+        self.acting = 0.0
+        self.learner_busy = 0.0
+        self.lags = []
+        self.depths = []
+
+    def learn(self, total_timesteps, log_interval=1):
+        """Train on total_timesteps environment steps"""
+        model = self.model
+        total_timesteps, _ = model._setup_learn(total_timesteps, None, True, "ActorLearner", False)
+
+        # Weights the learner publishes, in shared memory
+        shared_params = [param.detach().clone().share_memory_() for param in model.policy.parameters()]
+        version = self.ctx.Value("l", 0)
+        lock = self.ctx.Lock()
+        stop = self.ctx.Event()
+        actor = self.ctx.Process(
+            target=_actor,
+            args=(self.env_fn, model.policy, shared_params, version, lock, self.queue, stop,
+                  model.n_steps, model.gamma, total_timesteps - model.num_timesteps),
+        )
+        started = time.perf_counter()
+        actor.start()
+
+        iteration = 0
+        try:
+            while True:
+                self.depths.append(self.queue.qsize())
+                rollout = self.queue.get()
+                if rollout is None:
+                    break
+                self.lags.append(version.value - rollout["version"])
+                self.acting += rollout["acting"]
+
+                train_from = time.perf_counter()
+                self._fill_buffer(rollout)
+                model._update_info_buffer(rollout["episodes"])
+                model.num_timesteps += rollout["rewards"].size
+                model._update_current_progress_remaining(model.num_timesteps, total_timesteps)
+                model.train()
+
+                # Publish the new weights to the actor
+                with lock, th.no_grad():
+                    for shared, param in zip(shared_params, model.policy.parameters()):
+                        shared.copy_(param)
+                    version.value += 1
+                self.learner_busy += time.perf_counter() - train_from
+
+                iteration += 1
+                if log_interval and iteration % log_interval == 0:
+                    for key, value in self.stats(time.perf_counter() - started).items():
+                        model.logger.record(f"actor_learner/{key}", value)
+                    model.dump_logs(iteration)
+        finally:
+            stop.set()
+            actor.join(timeout=30)
+            if actor.is_alive():
+                actor.terminate()
+        if actor.exitcode != 0 and iteration == 0:
+            raise RuntimeError(f"Actor process failed with exit code {actor.exitcode}")
+        return model
+
+    def _fill_buffer(self, rollout):
+        buffer = self.model.rollout_buffer
+        buffer.reset()
+        buffer.observations[:] = rollout["observations"]
+        buffer.actions[:] = rollout["actions"]
+        buffer.rewards[:] = rollout["rewards"]
+        buffer.episode_starts[:] = rollout["episode_starts"]
+        buffer.values[:] = rollout["values"]
+        buffer.log_probs[:] = rollout["log_probs"]
+        buffer.pos = buffer.buffer_size
+        buffer.full = True
+        buffer.compute_returns_and_advantage(
+            last_values=th.as_tensor(rollout["last_values"]), dones=rollout["dones"])
+
+    def stats(self, elapsed):
+        return {
+            "queue_depth": self.depths[-1] if self.depths else 0,
+            "mean_queue_depth": float(np.mean(self.depths)) if self.depths else 0.0,
+            "policy_lag": self.lags[-1] if self.lags else 0,
+            "mean_policy_lag": float(np.mean(self.lags)) if self.lags else 0.0,
+            "learner_utilization": self.learner_busy / elapsed,
+            "actor_utilization": self.acting / elapsed,
+        }
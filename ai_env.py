@@ -2,25 +2,32 @@ import gym
 from gym import spaces
 import numpy as np
 from game import CheckpointGatesGame
+from sensors import observation_bounds
 
 class CheckpointRacingEnv(gym.Env):
-    def __init__(self):
+    metadata = {"render_modes": ["human", "rgb_array"]}
+    
+    def __init__(self, render_mode=None, frame_skip=1, track=None, sensor=None):
         super(CheckpointRacingEnv, self).__init__()
         
-        self.game = CheckpointGatesGame()
+        # Headless by default: pygame is only loaded when rendering
+        self.render_mode = render_mode
+        # frame_skip > 1 repeats each action for that many game ticks
+        # track: a tracks.Track to drive instead of the default course
+        # sensor: a sensors.RaySensor whose readings extend the observation
+        self.game = CheckpointGatesGame(render_mode=render_mode, frame_skip=frame_skip, track=track, sensor=sensor)
+        self.env_kwargs = dict(frame_skip=frame_skip, track=track, sensor=sensor)  # For replay.ActionLog
         
         # Action space: 5 discrete actions
         # 0=nothing, 1=left, 2=right, 3=accelerate, 4=brake
         self.action_space = spaces.Discrete(5)
         
         # Observation space: [distance_to_checkpoint, angle_to_checkpoint, speed, car_angle, progress]
-        self.observation_space = spaces.Box(
-            low=np.array([0, -1, 0, 0, 0]),
-            high=np.array([1, 1, 1, 1, 1]),
-            dtype=np.float32
-        )
+        # followed by one distance per sensor ray
+        low, high = observation_bounds(sensor)
+        self.observation_space = spaces.Box(low=low, high=high, dtype=np.float32)
         
-        self.max_steps = 3000  # Enough time to complete the course
+        self.max_steps = 3000  # Enough time (in game ticks) to complete the course
         self.current_step = 0
         
     def seed(self, seed=None):
@@ -45,9 +52,9 @@ class CheckpointRacingEnv(gym.Env):
             return obs
     
     def step(self, action):
-        self.current_step += 1
-        
+        ticks_before = self.game.steps_taken
         state, reward, done = self.game.step(action)
+        self.current_step += self.game.steps_taken - ticks_before
         
         # End episode if max steps reached
         if self.current_step >= self.max_steps:
@@ -58,9 +65,28 @@ class CheckpointRacingEnv(gym.Env):
         
         return state.astype(np.float32), reward, terminated, truncated, {}
     
-    def render(self, mode='human'):
-        if mode == 'human':
-            self.game.render()
+    def get_state_snapshot(self):
+        """(game.GameState, step count) to hand back to restore()"""
+        return self.game.get_state_snapshot(), self.current_step
+    
+    def restore(self, snapshot):
+        """Return to a get_state_snapshot() state; returns the observation"""
+        game_state, self.current_step = snapshot
+        return self.game.restore(game_state).astype(np.float32)
+    
+    def render(self, mode=None):
+        """Draw the game in `mode` (default: the env's render_mode). A mode
+        the env was not built with takes effect from this call on, the
+        window or frame being created on first use."""
+        mode = mode or self.render_mode
+        if mode is None:
+            return None
+        if mode not in ('human', 'rgb_array'):
+            raise ValueError(f"Unsupported render mode {mode!r}: use 'human' or 'rgb_array'")
+        if mode != self.game.render_mode:
+            self.render_mode = self.game.render_mode = mode
+            self.game.screen = None  # render() sets up the new display
+        return self.game.render()
     
     def close(self):
         pass
\ No newline at end of file
@@ -0,0 +1,496 @@
+import warnings
+import numpy as np
+import kernels
+from collisions import SpatialHashCollider
+from sensors import observation_size
+from tracks import TrackBank, default_track
+
+_warned_fallback = False  # The no-Numba warning is given once per process
+
+# Per-car episode state, as stored by get_state_snapshot()
+CAR_STATE = np.dtype([
+    ("car_x", np.float64), ("car_y", np.float64), ("car_angle", np.float64), ("car_speed", np.float64),
+    ("current_gate", np.int64), ("gates_passed", np.int64), ("episode_reward", np.float64),
+    ("steps_taken", np.int64), ("wrong_way_crossings", np.int64), ("collisions", np.int64),
+    ("track_index", np.int64),
+])
+
+class BatchedCheckpointGatesGame:
+    """Vectorized physics core that advances N independent cars per call.
+
+    Mirrors CheckpointGatesGame step for step: for a single car it produces the
+    same poses, gate progress, rewards and done flags as the scalar game, and
+    the same float32 observations that CheckpointRacingEnv hands to the agent.
+    (np.arctan2 may differ from math.atan2 in the last float64 bit, which the
+    float32 cast removes.)
+
+    crossing="band" keeps the scalar game's rule (car within 20 px of the gate
+    line, between the posts). crossing="swept" instead tests the segment
+    travelled during the tick against that band, so fast cars cannot tunnel
+    through a gate, and flags the current or last passed gate being crossed
+    in the wrong direction. dt scales
+    the game time simulated per step and substeps splits it into smaller
+    physics ticks; the defaults (1.0, 1) reproduce the scalar game.
+    frame_skip repeats each action for that many ticks inside one step call.
+
+    step_into writes float32 results into preallocated buffers using the
+    compiled kernel from kernels.py when Numba is available (kernel="auto" or
+    "numba"), otherwise the NumPy code below (kernel="numpy"). Only the
+    kernel steps without allocating: install numba for that. kernel="auto"
+    without it warns once per process that the NumPy fallback is used.
+
+    track (a tracks.Track, default the original seven gates) supplies the
+    precomputed gate arrays; per-step gate work only touches each car's
+    current gate (and its predecessor), so it does not grow with the gate count.
+    Cars can drive different tracks of the same screen size (set_tracks); the
+    gate arrays then live in a TrackBank indexed by track_index. A
+    curriculum (curriculum.CurriculumScheduler) picks each car's next track
+    whenever it is reset. With a sensor (sensors.RaySensor) its ray readings
+    follow the 5 game values in every observation.
+
+    race_size groups consecutive cars into races of that many cars sharing
+    one track (car i is in race i // race_size). Cars of a race start on a
+    grid around the track's start and collide with each other: once per
+    step, after every car has moved, the collider (collisions.SpatialHashCollider
+    by default) pushes overlapping cars apart and slows them down. A car
+    leaves the race when its episode ends: after its auto-reset it drives
+    as a ghost that nobody collides with, so finished cars parked on the
+    grid do not block the others. When every car of a race has finished,
+    they all rejoin it. collisions counts each car's collisions in the
+    current episode.
+    """
+
+    def __init__(self, n_cars=1, width=800, height=600, crossing="band", dt=1.0, substeps=1,
+                 frame_skip=1, kernel="auto", track=None, curriculum=None, sensor=None,
+                 race_size=None, collider=None):
+        if crossing not in ("band", "swept"):
+            raise ValueError(f"Unknown crossing test: {crossing}")
+        if kernel not in ("auto", "numba", "numpy"):
+            raise ValueError(f"Unknown kernel: {kernel}")
+        if kernel == "numba" and not kernels.HAVE_NUMBA:
+            raise ImportError("kernel='numba' requires the numba package")
+        if race_size is not None and curriculum is not None:
+            raise ValueError("Cars of a race share one track, which a curriculum would change")
+        self.use_kernel = kernel != "numpy" and kernels.HAVE_NUMBA
+        if kernel == "auto" and not kernels.HAVE_NUMBA:
+            global _warned_fallback
+            if not _warned_fallback:
+                _warned_fallback = True
+                warnings.warn("numba is not installed: BatchedCheckpointGatesGame.step_into falls back to the "
+                              "NumPy engine, which allocates new arrays every step (pip install numba)",
+                              RuntimeWarning, stacklevel=2)
+        self.n_cars = n_cars
+        self.track = track if track is not None else default_track(width, height)
+        self.width = self.track.width
+        self.height = self.track.height
+        self.crossing = crossing
+        self.dt = dt
+        self.substeps = substeps
+        self.frame_skip = frame_skip
+        self.gate_tolerance = 20  # Half-height of the band around a gate line
+
+        # Car properties (shared by every car)
+        self.max_speed = 5
+        self.margin = 30
+
+        # Gate geometry precomputed by the tracks, stacked per track slot:
+        # (slots, G, 2) posts, tangents and normals (pointing in the course
+        # direction), (slots, G + 1, 2) centers where the extra row is the
+        # target used once every gate has been passed
+        self.gates = self.track.gates
+        self.total_gates = self.track.total_gates  # Of the default track
+        self.bank = TrackBank([self.track], capacity=1 if curriculum is None else n_cars + 1)
+        self.track_index = np.zeros(n_cars, dtype=np.int64)
+
+        # Per-car state
+        self.car_x = np.zeros(n_cars)
+        self.car_y = np.zeros(n_cars)
+        self.car_angle = np.zeros(n_cars)
+        self.car_speed = np.zeros(n_cars)
+        self.current_gate = np.zeros(n_cars, dtype=np.int64)
+        self.gates_passed = np.zeros(n_cars, dtype=np.int64)
+        self.episode_reward = np.zeros(n_cars)
+        self.steps_taken = np.zeros(n_cars, dtype=np.int64)
+        self.max_steps = 1000
+        self.ticks = np.zeros(n_cars, dtype=np.int64)  # Ticks run by the last step
+
+        # Gates crossed against the course direction (swept test only)
+        self.wrong_way = np.zeros(n_cars, dtype=bool)
+        self.wrong_way_crossings = np.zeros(n_cars, dtype=np.int64)
+
+        # Races: cars of the same race collide with each other
+        self.race_size = race_size
+        self.collider = None
+        self.collisions = np.zeros(n_cars, dtype=np.int64)
+        if race_size is not None:
+            self.collider = collider if collider is not None else SpatialHashCollider()
+            self.race_id = np.arange(n_cars) // race_size
+            self.grid_offset = self._start_grid(np.arange(n_cars) % race_size, race_size)
+            self.in_race = np.ones(n_cars, dtype=bool)
+
+        self.sensor = sensor
+        self.curriculum = curriculum
+        if curriculum is not None:
+            curriculum.attach(n_cars)
+        self.reset()
+
+    def set_tracks(self, indices, tracks):
+        """Put the given cars on new tracks (takes effect at their next reset)"""
+        for i, track in zip(indices, tracks):
+            if (track.width, track.height) != (self.width, self.height):
+                raise ValueError("All tracks of an engine must share its screen size")
+            others = np.delete(self.track_index, i)
+            self.track_index[i] = self.bank.slot(track, in_use=others)
+
+    def car_track(self, index):
+        """The Track car `index` is driving"""
+        return self.bank.tracks[self.track_index[index]]
+
+    def reset(self, indices=None):
+        """Reset the selected cars (all by default) and return the full state"""
+        self.reset_cars(indices)
+        if indices is None and self.collider is not None:
+            self.in_race[:] = True
+        return self.get_state()
+
+    def reset_cars(self, indices=None):
+        """Reset the selected cars (all by default) without computing the state"""
+        if indices is None:
+            indices = np.arange(self.n_cars)
+        if self.curriculum is not None:
+            # Report finished episodes, then deal out the next tracks
+            indices = np.asarray(indices)
+            finished = indices[self.steps_taken[indices] > 0]
+            self.curriculum.record(finished, self.gates_passed[finished] >= self.bank.total_gates[self.track_index[finished]])
+            self.set_tracks(indices, [self.curriculum.next_track(i) for i in indices])
+        slot = self.track_index[indices]
+        self.car_x[indices] = self.bank.start[slot, 0]
+        self.car_y[indices] = self.bank.start[slot, 1]  # Start at bottom
+        self.car_angle[indices] = self.bank.start_angle[slot]
+        self.car_speed[indices] = 0
+        self.current_gate[indices] = 0
+        self.gates_passed[indices] = 0
+        self.episode_reward[indices] = 0
+        self.steps_taken[indices] = 0
+        self.wrong_way[indices] = False
+        self.wrong_way_crossings[indices] = 0
+        self.collisions[indices] = 0
+        if self.collider is not None:
+            # Grid position in the race, in the car's frame at the start
+            angle = np.radians(self.car_angle[indices])
+            side = self.grid_offset[indices, 0]
+            back = self.grid_offset[indices, 1]
+            self.car_x[indices] += side * np.cos(angle) - back * np.sin(angle)
+            self.car_y[indices] += side * np.sin(angle) + back * np.cos(angle)
+            np.clip(self.car_x, self.margin, self.width - self.margin, out=self.car_x)
+            np.clip(self.car_y, self.margin, self.height - self.margin, out=self.car_y)
+
+    def _start_grid(self, position, race_size):
+        """(N, 2) sideways and backward offsets of grid positions, a square
+        block of rows centered on the start"""
+        columns = int(np.ceil(np.sqrt(race_size)))
+        rows = int(np.ceil(race_size / columns))
+        spacing = 2.5 * self.collider.radius
+        side = (position % columns - (columns - 1) / 2) * spacing
+        back = (position // columns - (rows - 1) / 2) * spacing
+        return np.stack([side, back], axis=1)
+
+    def resolve_collisions(self, done):
+        """Separate overlapping cars of each race; returns the collided cars"""
+        self.in_race &= ~done
+        collided = self.collider.resolve(self.car_x, self.car_y, self.car_speed, self.race_id, active=self.in_race)
+        # Races every car has finished start over with all of them
+        over = np.bincount(self.race_id, weights=self.in_race) == 0
+        self.in_race |= over[self.race_id]
+        np.clip(self.car_x, self.margin, self.width - self.margin, out=self.car_x)
+        np.clip(self.car_y, self.margin, self.height - self.margin, out=self.car_y)
+        self.collisions += collided
+        return np.flatnonzero(collided)
+
+    def get_state_snapshot(self, indices=None):
+        """(len(indices),) CAR_STATE record array of the selected cars (all by default)"""
+        if indices is None:
+            indices = np.arange(self.n_cars)
+        snapshot = np.empty(len(indices), dtype=CAR_STATE)
+        for name in CAR_STATE.names:
+            snapshot[name] = getattr(self, name)[indices]
+        return snapshot
+
+    def restore(self, snapshot, indices=None):
+        """Put the selected cars (all by default) into the states of a
+        get_state_snapshot() record array, one record per car or a single
+        record for all of them. A game.GameState from the scalar game is
+        accepted too; the cars then keep their tracks. Track indices refer to
+        this engine's bank, so restore into the engine (or an identically
+        configured one) that took the snapshot. Observations are refreshed
+        by get_state() or observe_into()."""
+        if indices is None:
+            indices = np.arange(self.n_cars)
+        if isinstance(snapshot, np.ndarray):
+            fields = {name: snapshot[name] for name in CAR_STATE.names}
+        else:
+            fields = {name: getattr(snapshot, name) for name in snapshot.__slots__}
+            fields.update(wrong_way_crossings=0, collisions=0)
+        for name, values in fields.items():
+            getattr(self, name)[indices] = values
+        self.wrong_way[indices] = False
+
+    def get_state(self):
+        """Get the (N, 5 + rays) game state for all cars"""
+        gate_center = self.bank.gate_center[self.track_index, self.current_gate]
+
+        # Vector to gate center
+        dx = gate_center[:, 0] - self.car_x
+        dy = gate_center[:, 1] - self.car_y
+        distance_to_gate = np.sqrt(dx*dx + dy*dy)
+
+        # Angle to gate (relative to car's current heading)
+        angle_to_gate = np.arctan2(dx, -dy)  # -dy because y increases downward
+        relative_angle = angle_to_gate - np.radians(self.car_angle)
+
+        # Normalize angle to [-pi, pi] the same way the scalar game does, so
+        # headings that wrapped several times round identically
+        over = relative_angle > np.pi
+        while over.any():
+            relative_angle[over] -= 2 * np.pi
+            over = relative_angle > np.pi
+        under = relative_angle < -np.pi
+        while under.any():
+            relative_angle[under] += 2 * np.pi
+            under = relative_angle < -np.pi
+
+        state = np.empty((self.n_cars, observation_size(self.sensor)))
+        state[:, 0] = np.minimum(distance_to_gate / 400.0, 1.0)
+        state[:, 1] = relative_angle / np.pi
+        state[:, 2] = self.car_speed / self.max_speed
+        state[:, 3] = np.abs(relative_angle) < np.pi / 4
+        state[:, 4] = self.gates_passed / self.bank.total_gates[self.track_index]
+        if self.sensor is not None:
+            state[:, 5:] = self.sensor.observe_engine(self)
+        return state
+
+    def step_into(self, actions, obs_out, rew_out, done_out):
+        """step() that writes into caller-provided buffers.
+
+        obs_out is (N, 5 + rays) float32, rew_out (N,) float32 and done_out
+        (N,) bool. With the compiled kernel and no sensor nothing is allocated
+        per call; without Numba this is step() plus copies.
+        """
+        if not self.use_kernel:
+            obs_out[:], rew_out[:], done_out[:] = self.step(actions)
+            return
+        kernels.step_cars(
+            np.asarray(actions, dtype=np.int64).reshape(self.n_cars),
+            self.car_x, self.car_y, self.car_angle, self.car_speed, self.current_gate,
+            self.gates_passed, self.episode_reward, self.steps_taken, self.ticks,
+            self.wrong_way, self.wrong_way_crossings, self.track_index, self.bank.total_gates,
+            self.bank.gate_left, self.bank.gate_right, self.bank.gate_center, self.bank.gate_tangent,
+            self.bank.gate_normal, self.bank.gate_half_width, self.bank.gate_directed,
+            self.crossing == "swept", self.gate_tolerance,
+            float(self.dt), self.substeps, 0.98 ** (self.dt / self.substeps), self.frame_skip,
+            float(self.max_speed), float(self.margin), float(self.width), float(self.height),
+            self.max_steps, obs_out, rew_out, done_out)
+        if self.sensor is not None:
+            obs_out[:, 5:] = self.sensor.observe_engine(self)
+        if self.collider is not None:
+            collided = self.resolve_collisions(done_out)
+            if len(collided):
+                self.observe_into(collided, obs_out)
+
+    def observe_into(self, indices, obs_out):
+        """Write the observations of the given cars into rows of obs_out"""
+        if not self.use_kernel:
+            obs_out[indices] = self.get_state()[indices]
+            return
+        kernels.observe_cars(
+            np.asarray(indices, dtype=np.int64), self.car_x, self.car_y, self.car_angle,
+            self.car_speed, self.current_gate, self.gates_passed, self.track_index,
+            self.bank.total_gates, self.bank.gate_center, float(self.max_speed), obs_out)
+        if self.sensor is not None:
+            obs_out[indices, 5:] = self.sensor.observe_engine(self, indices)
+
+    def step(self, actions):
+        """Execute one game step for every car.
+
+        With frame_skip > 1 the actions are repeated for up to frame_skip
+        ticks; rewards are summed and a car stops at the tick its episode
+        ends. Returns the (N, 5 + rays) state and (N,) reward and done arrays.
+        """
+        actions = np.asarray(actions).reshape(self.n_cars)
+
+        # Actions: 0=nothing, 1=left, 2=right, 3=accelerate, 4=brake
+        turn_left = actions == 1
+        turn_right = actions == 2
+        accelerate = actions == 3
+        brake = actions == 4
+
+        self.wrong_way[:] = False
+        rewards, dones = self._tick(turn_left, turn_right, accelerate, brake)
+        self.ticks[:] = 1
+        for _ in range(self.frame_skip - 1):
+            running = ~dones
+            if not running.any():
+                break
+            tick_rewards, dones = self._tick(turn_left, turn_right, accelerate, brake, running)
+            rewards += tick_rewards
+            self.ticks += running
+
+        if self.collider is not None:
+            self.resolve_collisions(dones)
+        return self.get_state(), rewards, dones
+
+    def _tick(self, turn_left, turn_right, accelerate, brake, running=None):
+        """Advance one physics tick; cars outside the running mask stay frozen"""
+        if running is None:
+            self.steps_taken += 1
+        else:
+            self.steps_taken += running
+            turn_left = turn_left & running
+            turn_right = turn_right & running
+            accelerate = accelerate & running
+            brake = brake & running
+
+        h = self.dt / self.substeps
+        gates_crossed = np.zeros(self.n_cars, dtype=np.int64)
+        for _ in range(self.substeps):
+            self.car_angle[turn_left] -= 6 * h
+            self.car_angle[turn_right] += 6 * h
+            self.car_speed[accelerate] = np.minimum(self.car_speed[accelerate] + 0.8 * h, self.max_speed)
+            self.car_speed[brake] = np.maximum(self.car_speed[brake] - 1.5 * h, 0)
+
+            # Natural deceleration
+            if running is None:
+                self.car_speed *= 0.98 ** h
+            else:
+                self.car_speed[running] *= 0.98 ** h
+
+            # Move cars
+            prev_x = self.car_x.copy()
+            prev_y = self.car_y.copy()
+            angle_rad = np.radians(self.car_angle)
+            dx = self.car_speed * np.sin(angle_rad) * h
+            dy = self.car_speed * np.cos(angle_rad) * h
+            if running is not None:
+                dx[~running] = 0
+                dy[~running] = 0
+            self.car_x += dx
+            self.car_y -= dy
+
+            # Keep cars on screen with soft boundaries
+            np.clip(self.car_x, self.margin, self.width - self.margin, out=self.car_x)
+            np.clip(self.car_y, self.margin, self.height - self.margin, out=self.car_y)
+
+            if self.crossing == "swept":
+                gates_crossed += self.check_gate_crossing(prev_x, prev_y, running)
+            else:
+                gates_crossed += self.check_gate_passage(running)
+
+        rewards = self.calculate_reward(gates_crossed)
+        if running is not None:
+            rewards[~running] = 0
+        self.episode_reward += rewards
+
+        # Episode ends if all gates passed or time limit
+        dones = (self.gates_passed >= self.bank.total_gates[self.track_index]) | (self.steps_taken >= self.max_steps)
+
+        return rewards, dones
+
+    def check_gate_passage(self, running=None):
+        """Advance every car that is passing through its current gate"""
+        slot = self.track_index
+        total_gates = self.bank.total_gates[slot]
+        active = self.current_gate < total_gates
+        if running is not None:
+            active &= running
+        gate = np.minimum(self.current_gate, total_gates - 1)
+        gate_left = self.bank.gate_left[slot, gate]
+        gate_right = self.bank.gate_right[slot, gate]
+        gate_center = self.bank.gate_center[slot, gate]
+        tangent = self.bank.gate_tangent[slot, gate]
+        normal = self.bank.gate_normal[slot, gate]
+
+        # Within 20 px of the gate line and between the posts, in the gate's
+        # own frame (exact for the axis-aligned default gates)
+        across = (self.car_x - gate_center[:, 0]) * normal[:, 0] + (self.car_y - gate_center[:, 1]) * normal[:, 1]
+        from_left = (self.car_x - gate_left[:, 0]) * tangent[:, 0] + (self.car_y - gate_left[:, 1]) * tangent[:, 1]
+        from_right = (self.car_x - gate_right[:, 0]) * tangent[:, 0] + (self.car_y - gate_right[:, 1]) * tangent[:, 1]
+        passed = active & (np.abs(across) < self.gate_tolerance) & (from_left >= 0) & (from_right <= 0)
+
+        self.current_gate += passed
+        self.gates_passed += passed
+        return passed
+
+    def check_gate_crossing(self, prev_x, prev_y, running=None):
+        """Swept version of check_gate_passage for the move prev -> current.
+
+        The current gate counts as passed when the travelled segment touches
+        its band (between the posts, within gate_tolerance of the line) while
+        not moving against the course direction. Wrong-way crossings of the
+        current gate or the last one passed are recorded in
+        wrong_way/wrong_way_crossings; further gates are not tested, which
+        keeps the cost per car independent of the track length.
+        """
+        # Candidate gates per car: column 0 the last one passed, column 1 the
+        # current one, shape (N, 2)
+        slot = self.track_index[:, None]
+        total_gates = self.bank.total_gates[slot]
+        candidates = np.stack([self.current_gate - 1, self.current_gate], axis=1)
+        valid = (candidates >= 0) & (candidates < total_gates)
+        gate = np.clip(candidates, 0, total_gates - 1)
+        center = self.bank.gate_center[slot, gate]
+        tangent = self.bank.gate_tangent[slot, gate]
+        normal = self.bank.gate_normal[slot, gate]
+        half_width = self.bank.gate_half_width[slot, gate]
+
+        # Segment endpoints in each candidate gate's frame: a along the posts,
+        # b across the line (positive = course direction)
+        rel0_x = prev_x[:, None] - center[..., 0]
+        rel0_y = prev_y[:, None] - center[..., 1]
+        rel1_x = self.car_x[:, None] - center[..., 0]
+        rel1_y = self.car_y[:, None] - center[..., 1]
+        a0 = rel0_x * tangent[..., 0] + rel0_y * tangent[..., 1]
+        a1 = rel1_x * tangent[..., 0] + rel1_y * tangent[..., 1]
+        b0 = rel0_x * normal[..., 0] + rel0_y * normal[..., 1]
+        b1 = rel1_x * normal[..., 0] + rel1_y * normal[..., 1]
+
+        # Strict crossings of the gate line between the posts
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_line = b0 / (b0 - b1)
+            crosses_line = ((b0 < 0) != (b1 < 0)) & (np.abs(a0 + t_line * (a1 - a0)) <= half_width)
+        reversing = self.bank.gate_directed[slot, gate] & (b1 < b0)
+        backwards = crosses_line & reversing & valid
+        self.wrong_way |= backwards.any(axis=1)
+        self.wrong_way_crossings += backwards.sum(axis=1)
+
+        # Segment vs. band rectangle (slab test) for each car's current gate
+        active = valid[:, 1]
+        if running is not None:
+            active &= running
+        enter_a, exit_a = self._slab(a0[:, 1], a1[:, 1], half_width[:, 1])
+        enter_b, exit_b = self._slab(b0[:, 1], b1[:, 1], self.gate_tolerance)
+        touches = np.maximum(np.maximum(enter_a, enter_b), 0) <= np.minimum(np.minimum(exit_a, exit_b), 1)
+
+        passed = active & touches & ~reversing[:, 1]
+        self.current_gate += passed
+        self.gates_passed += passed
+        return passed
+
+    @staticmethod
+    def _slab(start, end, half_extent):
+        """Parameter interval in which start + t*(end-start) lies within +-half_extent"""
+        delta = end - start
+        moving = delta != 0
+        safe_delta = np.where(moving, delta, 1)
+        t_low = (-half_extent - start) / safe_delta
+        t_high = (half_extent - start) / safe_delta
+        enter = np.where(moving, np.minimum(t_low, t_high), -np.inf)
+        exit = np.where(moving, np.maximum(t_low, t_high), np.inf)
+
+        # Stationary along this axis: inside for all t or never
+        outside = ~moving & (np.abs(start) > half_extent)
+        enter[outside] = np.inf
+        return enter, exit
+
+    def calculate_reward(self, gates_crossed):
+        """Same reward as the scalar game: 100 per gate, otherwise -0.1 per unit of game time"""
+        return np.where(gates_crossed > 0, 100.0 * gates_crossed, -0.1 * self.dt)
@@ -0,0 +1,219 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+
+def measure(case, duration, items_per_call=1, warmup=20):
+    """Time case's step() calls for about `duration` seconds of step time.
+
+    `case` is (step, prepare): prepare() (e.g. choosing the next actions) runs
+    between the timed calls and may be None. Returns throughput
+    (items_per_call per call) and per-call latency percentiles in microseconds.
+    """
+    step, prepare = case
+    for _ in range(warmup):
+        if prepare:
+            prepare()
+        step()
+    latencies = []
+    total_ns = 0
+    budget_ns = duration * 1e9
+    while total_ns < budget_ns:
+        if prepare:
+            prepare()
+        call_start = time.perf_counter_ns()
+        step()
+        elapsed = time.perf_counter_ns() - call_start
+        latencies.append(elapsed)
+        total_ns += elapsed
+    latencies = np.array(latencies) / 1000.0
+    return {
+        "steps_per_sec": len(latencies) * items_per_call / (total_ns / 1e9),
+        "calls": len(latencies),
+        "p50_us": float(np.percentile(latencies, 50)),
+        "p90_us": float(np.percentile(latencies, 90)),
+        "p99_us": float(np.percentile(latencies, 99)),
+    }
+
+class RandomActions:
+    def __init__(self, n, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.n = n
+
+    def __call__(self, obs):
+        return self.rng.integers(0, 5, self.n)
+
+class PolicyActions:
+    """Trained-policy actions (inference runs in prepare, untimed)"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, obs):
+        actions, _ = self.model.predict(np.asarray(obs, dtype=np.float32), deterministic=True)
+        return actions
+
+def game_case(actions, render=False):
+    from game import CheckpointGatesGame
+    game = CheckpointGatesGame(render_mode="rgb_array" if render else None, fps=None)
+    state = {"obs": game.reset(), "action": 0}
+
+    def prepare():
+        state["action"] = int(actions(state["obs"][None])[0])
+
+    def step():
+        state["obs"], _, done = game.step(state["action"])
+        if render:
+            game.render()
+        if done:
+            state["obs"] = game.reset()
+    return step, prepare
+
+def get_state_case():
+    from game import CheckpointGatesGame
+    game = CheckpointGatesGame(render_mode=None)
+    game.reset()
+    return game.get_state, None
+
+def render_case():
+    from game import CheckpointGatesGame
+    game = CheckpointGatesGame(render_mode="rgb_array", fps=None)
+    game.reset()
+    rng = np.random.default_rng(0)
+
+    def prepare():
+        game.step(int(rng.integers(0, 5)))
+    return game.render, prepare
+
+def env_case(actions, render=False):
+    from ai_env import CheckpointRacingEnv
+    env = CheckpointRacingEnv(render_mode="rgb_array" if render else None)
+    state = {"obs": env.reset()[0], "action": 0}
+
+    def prepare():
+        state["action"] = int(actions(state["obs"][None])[0])
+
+    def step():
+        state["obs"], _, terminated, truncated, _ = env.step(state["action"])
+        if render:
+            env.render()
+        if terminated or truncated:
+            state["obs"] = env.reset()[0]
+    return step, prepare
+
+def vec_env_case(n_envs, actions):
+    from vec_env import CheckpointRacingVecEnv
+    env = CheckpointRacingVecEnv(n_envs=n_envs)
+    state = {"obs": env.reset(), "actions": None}
+
+    def prepare():
+        state["actions"] = actions(state["obs"])
+
+    def step():
+        state["obs"], _, _, _ = env.step(state["actions"])
+    return step, prepare
+
+def vec_env_render_case(n_envs, actions):
+    """Step the vectorized env and draw every environment's frame offscreen"""
+    from recording import BatchedFrameRenderer
+    from vec_env import CheckpointRacingVecEnv
+    env = CheckpointRacingVecEnv(n_envs=n_envs)
+    renderer = BatchedFrameRenderer(env.game)
+    state = {"obs": env.reset(), "actions": None}
+
+    def prepare():
+        state["actions"] = actions(state["obs"])
+
+    def step():
+        state["obs"], _, _, _ = env.step(state["actions"])
+        for index in range(n_envs):
+            renderer.render(index)
+    return step, prepare
+
+def build_cases(n_envs, model=None):
+    """name -> (factory returning (step, prepare), environment steps per call)"""
+    cases = {
+        "game_step": (lambda: game_case(RandomActions(1)), 1),
+        "game_get_state": (get_state_case, 1),
+        "game_render": (render_case, 1),
+        "env_step": (lambda: env_case(RandomActions(1)), 1),
+        "env_step_render": (lambda: env_case(RandomActions(1), render=True), 1),
+        f"vec_env_step_{n_envs}": (lambda: vec_env_case(n_envs, RandomActions(n_envs)), n_envs),
+        f"vec_env_step_render_{n_envs}": (lambda: vec_env_render_case(n_envs, RandomActions(n_envs)), n_envs),
+    }
+    if model is not None:
+        cases["env_step_policy"] = (lambda: env_case(PolicyActions(model)), 1)
+        cases[f"vec_env_step_{n_envs}_policy"] = (lambda: vec_env_case(n_envs, PolicyActions(model)), n_envs)
+    return cases
+
+def compare(results, baseline, tolerance):
+    """Names of cases whose throughput dropped more than tolerance percent"""
+    regressions = []
+    for name, result in results["cases"].items():
+        reference = baseline["cases"].get(name)
+        if reference is None:
+            continue
+        change = 100.0 * (result["steps_per_sec"] / reference["steps_per_sec"] - 1)
+        result["change_pct"] = change
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark game and environment throughput")
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds per case")
+    parser.add_argument("--envs", type=int, default=256, help="Environments in the vectorized cases")
+    parser.add_argument("--model", help="Trained model for the policy-action cases")
+    parser.add_argument("--cases", nargs="*", help="Only run these cases")
+    parser.add_argument("--save", help="Write the results as a baseline JSON file")
+    parser.add_argument("--compare", help="Baseline JSON to check the results against")
+    parser.add_argument("--tolerance", type=float, default=10.0,
+                        help="Allowed throughput drop vs. the baseline, in percent")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    model = None
+    if args.model:
+        from stable_baselines3 import PPO
+        model = PPO.load(args.model, device="cpu")
+
+    results = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "duration": args.duration,
+        },
+        "cases": {},
+    }
+    for name, (factory, items_per_call) in build_cases(args.envs, model).items():
+        if args.cases and name not in args.cases:
+            continue
+        result = measure(factory(), args.duration, items_per_call)
+        results["cases"][name] = result
+        print(f"{name:28s} {result['steps_per_sec']:>14,.0f} steps/s   "
+              f"p50 {result['p50_us']:9.1f} us   p99 {result['p99_us']:9.1f} us")
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, result in results["cases"].items():
+            if "change_pct" in result:
+                print(f"{name:28s} {result['change_pct']:+7.1f}% vs. baseline")
+        if regressions:
+            print(f"Throughput regressed by more than {args.tolerance}%: {', '.join(regressions)}")
+            exit_code = 1
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import copy
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+import numpy as np
+import torch
+from stable_baselines3.common.callbacks import BaseCallback
+from evaluate import evaluate
+from numpy_policy import NumpyPolicy, export_policy
+
+def capture(model):
+    """Everything needed to continue training `model` exactly, as of the
+    start of its next rollout: parameters, optimizer, counters, RNGs and
+    (for the in-process VecEnv) the environments' episodes. Tensors and
+    arrays are copies, so training can go on while this is written."""
+    env = model.get_env()
+    venv = env.venv if hasattr(env, "venv") else env
+    state = {
+        "num_timesteps": model.num_timesteps,
+        "n_updates": model._n_updates,
+        "policy": {key: value.detach().clone() for key, value in model.policy.state_dict().items()},
+        "optimizer": copy.deepcopy(model.policy.optimizer.state_dict()),
+        "rng": {
+            "torch": torch.get_rng_state(),
+            "numpy": np.random.get_state(),
+            "python": random.getstate(),
+        },
+        "ep_info_buffer": list(model.ep_info_buffer or []),
+        "ep_success_buffer": list(model.ep_success_buffer or []),
+        "env": None,
+    }
+    if hasattr(venv, "get_state_snapshot") and getattr(venv.game, "curriculum", None) is None:
+        state["env"] = {
+            "snapshot": venv.get_state_snapshot(),
+            "last_obs": np.array(model._last_obs),
+            "last_episode_starts": np.array(model._last_episode_starts),
+            # VecMonitor's running episode statistics
+            "episode_returns": np.array(getattr(env, "episode_returns", [])),
+            "episode_lengths": np.array(getattr(env, "episode_lengths", [])),
+        }
+    return state
+
+def restore(model, state):
+    """Put a capture() state back into a model built with the same settings.
+    Continue with model.learn(total - model.num_timesteps,
+    reset_num_timesteps=False); without an environment state the episodes
+    start over."""
+    model.num_timesteps = state["num_timesteps"]
+    model._n_updates = state["n_updates"]
+    model.policy.load_state_dict(state["policy"])
+    model.policy.optimizer.load_state_dict(state["optimizer"])
+    model.ep_info_buffer = deque(state["ep_info_buffer"], maxlen=model._stats_window_size)
+    model.ep_success_buffer = deque(state["ep_success_buffer"], maxlen=model._stats_window_size)
+
+    env = model.get_env()
+    venv = env.venv if hasattr(env, "venv") else env
+    saved_env = state["env"]
+    if saved_env is not None and hasattr(venv, "restore") and venv.num_envs == len(saved_env["last_obs"]):
+        venv.restore(saved_env["snapshot"])
+        model._last_obs = saved_env["last_obs"]
+        model._last_episode_starts = saved_env["last_episode_starts"]
+        if hasattr(env, "episode_returns"):
+            env.episode_returns = saved_env["episode_returns"]
+            env.episode_lengths = saved_env["episode_lengths"]
+    else:
+        model._last_obs = None  # learn() resets the environments
+
+    torch.set_rng_state(state["rng"]["torch"])
+    np.random.set_state(state["rng"]["numpy"])
+    random.setstate(state["rng"]["python"])
+
+def load_checkpoint(path):
+    """A checkpoint file's state, or the newest one of a checkpoint directory"""
+    if os.path.isdir(path):
+        with open(os.path.join(path, "index.json")) as f:
+            index = json.load(f)
+        if not index["checkpoints"]:
+            raise FileNotFoundError(f"No checkpoints in {path}")
+        latest = max(index["checkpoints"], key=lambda entry: entry["timesteps"])
+        path = os.path.join(path, latest["file"])
+    return torch.load(path, weights_only=False)
+
+class CheckpointManager:
+    """Write checkpoints from a background thread, evaluate them and rotate them.
+
+    save(state, policy) queues a capture() state (at most max_pending, so
+    memory stays bounded) and returns at once. The writer thread saves it as
+    checkpoint_<timesteps>.pt (written to a temporary name and renamed, so a
+    crash never leaves a torn file), then, with eval_episodes > 0, runs
+    evaluate() on the NumPy copy of the policy and stores the result. Only
+    the keep_last newest checkpoints and the keep_best best by mean gates
+    passed (then success rate) are kept; the rest are deleted. Each best
+    checkpoint also gets a .npz policy that evaluate.py --model and
+    load_policy() read. index.json lists the kept checkpoints and scores.
+
+    The thread shares the CPU and GIL with the learner, so evaluation slows
+    it down a little, but the learner never waits on disk.
+    """
+
+    def __init__(self, directory, keep_last=2, keep_best=3, eval_episodes=100, eval_kwargs=None, max_pending=2):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.eval_episodes = eval_episodes
+        self.eval_kwargs = eval_kwargs or {}
+        os.makedirs(directory, exist_ok=True)
+
+        self.index_path = os.path.join(directory, "index.json")
+        self.checkpoints = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.checkpoints = json.load(f)["checkpoints"]
+        self.error = None
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def save(self, state, policy=None):
+        """Queue a capture() state (and its NumpyPolicy, for evaluation)"""
+        if self.error is not None:
+            raise self.error
+        self.pending.put((state, policy))
+
+    def _writer(self):
+        while True:
+            item = self.pending.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.pending.task_done()
+
+    def _write(self, state, policy):
+        timesteps = state["num_timesteps"]
+        name = f"checkpoint_{timesteps:09d}"
+        path = os.path.join(self.directory, name + ".pt")
+        torch.save(state, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        entry = {"file": name + ".pt", "timesteps": timesteps, "time": time.time()}
+
+        if self.eval_episodes and policy is not None:
+            results = evaluate(policy, n_episodes=self.eval_episodes, n_envs=min(self.eval_episodes, 64),
+                               seed=None, **self.eval_kwargs)
+            entry.update(mean_gates_passed=results["mean_gates_passed"], success_rate=results["success_rate"])
+            policy.save(os.path.join(self.directory, name + ".npz"))
+            entry["policy"] = name + ".npz"
+        self.checkpoints = [c for c in self.checkpoints if c["file"] != entry["file"]] + [entry]
+        self._rotate()
+
+    def best(self):
+        """Kept checkpoints that have scores, best first"""
+        scored = [c for c in self.checkpoints if "mean_gates_passed" in c]
+        return sorted(scored, key=lambda c: (c["mean_gates_passed"], c["success_rate"], c["timesteps"]),
+                      reverse=True)
+
+    def _rotate(self):
+        newest = sorted(self.checkpoints, key=lambda c: c["timesteps"])[-self.keep_last:] if self.keep_last else []
+        best = self.best()[:self.keep_best]
+        keep = {c["file"] for c in newest} | {c["file"] for c in best}
+        best_files = {c["file"] for c in best}
+        for entry in self.checkpoints:
+            if entry["file"] not in keep:
+                self._remove(entry["file"])
+            if entry.get("policy") and entry["file"] not in best_files:
+                self._remove(entry.pop("policy"))
+        self.checkpoints = [c for c in self.checkpoints if c["file"] in keep]
+
+        index = {"checkpoints": self.checkpoints, "best": [c["file"] for c in best]}
+        with open(self.index_path + ".tmp", "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def _remove(self, file):
+        try:
+            os.remove(os.path.join(self.directory, file))
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """Write everything queued, then stop the thread"""
+        self.pending.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+class CheckpointCallback(BaseCallback):
+    """Hand a checkpoint to a CheckpointManager every `every` timesteps.
+
+    The state is captured when a rollout starts (the previous update is
+    done and nothing of the next rollout has happened yet), so restore()
+    followed by learn() continues exactly as the uninterrupted run. Only
+    the in-memory copy is made on the training thread.
+    """
+
+    def __init__(self, manager, every):
+        super().__init__()
+        self.manager = manager
+        self.every = every
+        self.last_saved = None
+
+    def _on_training_start(self):
+        # Nothing new to save where training starts (or resumes)
+        self.last_saved = self.model.num_timesteps
+
+    def _on_rollout_start(self):
+        if self.model.num_timesteps - self.last_saved >= self.every:
+            self.save()
+
+    def save(self):
+        policy = export_policy(self.model)
+        # export_policy's arrays share memory with the live weights
+        policy = NumpyPolicy([(w.copy(), b.copy()) for w, b in policy.layers], policy.activation)
+        self.manager.save(capture(self.model), policy)
+        self.last_saved = self.model.num_timesteps
+
+    def _on_training_end(self):
+        if self.model.num_timesteps > self.last_saved:
+            self.save()
+
+    def _on_step(self):
+        return True
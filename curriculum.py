@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from tracks import generate_track
+
+class TrackPool:
+    """LRU cache of generated tracks keyed by (seed, difficulty).
+
+    get() returns the cached Track or generates it (a miss); prefetch() fills
+    the cache ahead of time, optionally from a background thread, so
+    generation stays off the step path. At most `capacity` tracks are kept.
+    """
+
+    def __init__(self, capacity=512, width=800, height=600, n_gates=None):
+        self.capacity = capacity
+        self.width = width
+        self.height = height
+        self.n_gates = n_gates
+        self.tracks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled (the pool travels to worker processes)
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _generate(self, seed, difficulty):
+        return generate_track(seed, difficulty, n_gates=self.n_gates, width=self.width, height=self.height)
+
+    def get(self, seed, difficulty):
+        key = (seed, round(difficulty, 6))
+        with self._lock:
+            track = self.tracks.get(key)
+            if track is not None:
+                self.tracks.move_to_end(key)
+                self.hits += 1
+                return track
+            self.misses += 1
+        track = self._generate(seed, difficulty)
+        self._store(key, track)
+        return track
+
+    def _store(self, key, track):
+        with self._lock:
+            self.tracks[key] = track
+            self.tracks.move_to_end(key)
+            while len(self.tracks) > self.capacity:
+                self.tracks.popitem(last=False)
+
+    def prefetch(self, keys, background=False):
+        """Generate the (seed, difficulty) keys that are not cached yet"""
+        if background:
+            thread = threading.Thread(target=self.prefetch, args=(list(keys),), daemon=True)
+            thread.start()
+            return thread
+        for seed, difficulty in keys:
+            key = (seed, round(difficulty, 6))
+            with self._lock:
+                cached = key in self.tracks
+            if not cached:
+                self._store(key, self._generate(seed, difficulty))
+
+class CurriculumScheduler:
+    """Deal generated tracks to the cars of a batched engine by skill.
+
+    Each environment has its own difficulty level (0 .. levels - 1) and a
+    rolling window of its last `window` episode outcomes (all gates passed or
+    not). When the window is full the level goes up at a success rate of
+    promote_at or more and down at demote_at or less, and the window starts
+    over. An environment's next track is one of tracks_per_level fixed seeds
+    of a level drawn from [level - spread, level], so easier courses keep
+    being revisited as difficulty widens. Reaching a new highest level
+    prefetches the level above it in the background.
+
+    Pass an instance as curriculum= to BatchedCheckpointGatesGame (or the
+    VecEnvs, which forward it); the engine calls attach, record and
+    next_track when it resets cars.
+    """
+
+    def __init__(self, levels=10, tracks_per_level=64, window=20, promote_at=0.8, demote_at=0.2,
+                 spread=1, seed=0, pool=None, width=800, height=600):
+        self.levels = levels
+        self.tracks_per_level = tracks_per_level
+        self.window = window
+        self.promote_at = promote_at
+        self.demote_at = demote_at
+        self.spread = spread
+        self.seed = seed
+        self.stream = 0  # Set per worker process so workers draw different tracks
+        if pool is None:
+            pool = TrackPool(capacity=max(512, 3 * tracks_per_level), width=width, height=height)
+        self.pool = pool
+        self.n_envs = 0
+
+    def difficulty(self, level):
+        return level / max(self.levels - 1, 1)
+
+    def level_keys(self, level):
+        """(seed, difficulty) of every track of a level"""
+        return [(self.seed * 1000003 + level * self.tracks_per_level + k, self.difficulty(level))
+                for k in range(self.tracks_per_level)]
+
+    def attach(self, n_envs):
+        """Start every environment at level 0 with an empty history"""
+        self.n_envs = n_envs
+        self.rng = np.random.default_rng([self.seed, self.stream])
+        self.level = np.zeros(n_envs, dtype=np.int64)
+        self.history = np.zeros((n_envs, self.window), dtype=bool)
+        self.history_count = np.zeros(n_envs, dtype=np.int64)
+        self.episodes = 0
+        self.max_level = 0
+        self.pool.prefetch(self.level_keys(0))
+        if self.levels > 1:
+            self.pool.prefetch(self.level_keys(1), background=True)
+
+    def record(self, envs, successes):
+        """Add finished episodes' outcomes and move levels up or down"""
+        for env, success in zip(envs, successes):
+            self.history[env, self.history_count[env] % self.window] = success
+            self.history_count[env] += 1
+            self.episodes += 1
+            if self.history_count[env] < self.window:
+                continue
+            rate = self.history[env].mean()
+            if rate >= self.promote_at and self.level[env] < self.levels - 1:
+                self.level[env] += 1
+            elif rate <= self.demote_at and self.level[env] > 0:
+                self.level[env] -= 1
+            else:
+                continue
+            self.history[env] = False
+            self.history_count[env] = 0
+            if self.level[env] > self.max_level:
+                self.max_level = int(self.level[env])
+                if self.max_level + 1 < self.levels:
+                    self.pool.prefetch(self.level_keys(self.max_level + 1), background=True)
+
+    def next_track(self, env):
+        """Track for env's next episode"""
+        level = int(self.rng.integers(max(self.level[env] - self.spread, 0), self.level[env] + 1))
+        k = int(self.rng.integers(self.tracks_per_level))
+        seed = self.seed * 1000003 + level * self.tracks_per_level + k  # As in level_keys
+        return self.pool.get(seed, self.difficulty(level))
+
+    def success_rate(self):
+        """Per-environment success rate over the current window"""
+        counts = np.minimum(self.history_count, self.window)
+        return np.where(counts > 0, self.history.sum(axis=1) / np.maximum(counts, 1), 0.0)
+
+    def stats(self):
+        return {
+            "mean_level": float(self.level.mean()),
+            "max_level": self.max_level,
+            "mean_difficulty": float(self.difficulty(self.level.mean())),
+            "episodes": self.episodes,
+            "pool_hits": self.pool.hits,
+            "pool_misses": self.pool.misses,
+        }
@@ -1,17 +1,17 @@
-from stable_baselines3 import PPO
+from numpy_policy import load_policy
 from ai_env import CheckpointRacingEnv
 import time
 
 # Check if model exists first
 try:
-    model = PPO.load("checkpoint_racing_model")
+    model = load_policy("checkpoint_racing_model")
     print("Model loaded successfully!")
 except:
     print("No trained model found. Train first with: python train_ai.py")
     exit()
 
 # Create environment directly (not vectorized)
-env = CheckpointRacingEnv()
+env = CheckpointRacingEnv(render_mode="human")
 
 print("Debugging trained AI on checkpoint gates racing...")
 print("Actions: 0=nothing, 1=left, 2=right, 3=accelerate, 4=brake")
@@ -0,0 +1,426 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import time
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+
+# Wire format: every message is a little-endian uint32 payload length
+# followed by the payload, whose first byte is the message type.
+#   CREATE  -> u16 n_envs                     <- u16 n_envs, u16 obs size
+#   RESET   ->                                <- f32 obs[n, obs size]
+#   STEP    -> u8 actions[n]                  <- u16 k, f32 obs[n, obs size], f32 rewards[n],
+#                                                u8 dones[n], u8 truncated[n], u16 done index[k],
+#                                                f32 terminal obs[k, obs size], u16 gates passed[k],
+#                                                u16 steps taken[k]
+#   STATS   ->                                <- UTF-8 JSON
+#   CLOSE   ->                                (connection closed)
+#   ERROR                                     <- UTF-8 message
+MSG_CREATE = 1
+MSG_RESET = 2
+MSG_STEP = 3
+MSG_STATS = 4
+MSG_CLOSE = 5
+MSG_ERROR = 255
+LENGTH = struct.Struct("<I")
+
+def _frame(payload):
+    return LENGTH.pack(len(payload)) + payload
+
+class EnvServer:
+    """Serve CheckpointRacingVecEnv-style environments to many clients.
+
+    One BatchedCheckpointGatesGame holding the cars of every connection is
+    shared by all of them; a client's CREATE claims n_envs cars (released
+    when it disconnects), up to `slots` in total. The engine only holds
+    claimed cars: it is rebuilt at each CREATE and disconnect, with the
+    remaining cars carried over by snapshot and restore, so a tick costs
+    the claimed cars, not the capacity. Step requests are collected and run
+    together as one engine tick: a tick starts once every client with
+    environments has a step pending, or max_wait seconds after the first
+    pending request. Cars of clients that did not ask for a step are
+    snapshotted before the tick and restored after it, so they do not move.
+    Episodes end and auto-reset exactly as in CheckpointRacingVecEnv
+    (max_steps game ticks). A malformed request gets an ERROR reply; it
+    never stops the ticks of the other clients.
+
+    Latency (request received to reply ready) and tick batch sizes are kept
+    for the STATS message.
+    """
+
+    def __init__(self, slots=1024, max_steps=3000, max_wait=0.002, **game_kwargs):
+        from sensors import observation_size
+
+        self.slots = slots
+        self.game_kwargs = game_kwargs
+        self.obs_size = observation_size(game_kwargs.get("sensor"))
+        self.max_steps = max_steps
+        self.max_wait = max_wait
+        self.clients = {}  # Connection id -> car indices
+        self.pending = {}  # Connection id -> (actions, future)
+        self.game = None
+        self._assign({})
+
+        self.latencies = []
+        self.batch_sizes = []
+        self.ticks = 0
+        self.started = time.perf_counter()
+
+    async def serve_unix(self, path):
+        server = await asyncio.start_unix_server(self._handle, path=path)
+        await self._run(server)
+
+    async def serve_tcp(self, host, port):
+        server = await asyncio.start_server(self._handle, host=host, port=port)
+        await self._run(server)
+
+    async def _run(self, server):
+        self.wakeup = asyncio.Event()
+        self.all_pending = asyncio.Event()
+        ticker = asyncio.create_task(self._ticker())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            ticker.cancel()
+
+    async def _handle(self, reader, writer):
+        client = id(writer)
+        try:
+            while True:
+                (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+                payload = await reader.readexactly(length)
+                received = time.perf_counter()
+                kind = payload[0]
+                if kind == MSG_STEP:
+                    reply = await self._step(client, np.frombuffer(payload, dtype=np.uint8, offset=1))
+                    self.latencies.append(time.perf_counter() - received)
+                elif kind == MSG_RESET:
+                    reply = self._reset(client)
+                elif kind == MSG_CREATE:
+                    (n_envs,) = struct.unpack_from("<H", payload, 1)
+                    reply = self._create(client, n_envs)
+                elif kind == MSG_STATS:
+                    reply = bytes([MSG_STATS]) + json.dumps(self.stats()).encode()
+                elif kind == MSG_CLOSE:
+                    break
+                else:
+                    reply = bytes([MSG_ERROR]) + f"Unknown message type {kind}".encode()
+                writer.write(_frame(reply))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._release(client)
+            writer.close()
+
+    @property
+    def free(self):
+        return self.slots - self.game.n_cars
+
+    def _assign(self, sizes):
+        """Rebuild the engine for clients' car counts (id -> n_envs, in
+        order); cars of clients that had some keep their states"""
+        from batched_game import BatchedCheckpointGatesGame
+
+        n_cars = sum(sizes.values())
+        game = BatchedCheckpointGatesGame(n_cars, **self.game_kwargs)
+        current_step = np.zeros(n_cars, dtype=np.int64)
+        clients = {}
+        start = 0
+        for client, n_envs in sizes.items():
+            indices = np.arange(start, start + n_envs)
+            start += n_envs
+            old = self.clients.get(client)
+            if old is not None:
+                game.restore(self.game.get_state_snapshot(old), indices)
+                current_step[indices] = self.current_step[old]
+            clients[client] = indices
+        self.game = game
+        self.clients = clients
+        self.current_step = current_step
+        self._obs = np.zeros((n_cars, self.obs_size), dtype=np.float32)
+        self._rewards = np.zeros(n_cars, dtype=np.float32)
+        self._dones = np.zeros(n_cars, dtype=bool)
+        self._actions = np.zeros(n_cars, dtype=np.int64)
+        game.observe_into(np.arange(n_cars), self._obs)
+
+    def _create(self, client, n_envs):
+        if client in self.clients:
+            return bytes([MSG_ERROR]) + b"Environments already created"
+        if n_envs > self.free:
+            return bytes([MSG_ERROR]) + f"Only {self.free} environments free".encode()
+        sizes = {other: len(indices) for other, indices in self.clients.items()}
+        sizes[client] = n_envs
+        self._assign(sizes)
+        return struct.pack("<BHH", MSG_CREATE, n_envs, self.obs_size)
+
+    def _release(self, client):
+        if client in self.clients:
+            self._assign({other: len(indices) for other, indices in self.clients.items() if other != client})
+        pending = self.pending.pop(client, None)
+        if pending is not None and not pending[1].done():
+            pending[1].cancel()
+        self._check_all_pending()
+
+    def _reset(self, client):
+        indices = self.clients.get(client)
+        if indices is None:
+            return bytes([MSG_ERROR]) + b"No environments created"
+        self.game.reset_cars(indices)
+        self.current_step[indices] = 0
+        self.game.observe_into(indices, self._obs)
+        return bytes([MSG_RESET]) + self._obs[indices].tobytes()
+
+    async def _step(self, client, actions):
+        indices = self.clients.get(client)
+        if indices is None:
+            return bytes([MSG_ERROR]) + b"No environments created"
+        if len(actions) != len(indices):
+            return bytes([MSG_ERROR]) + f"Expected {len(indices)} actions, got {len(actions)}".encode()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[client] = (actions, future)
+        self.wakeup.set()
+        self._check_all_pending()
+        return await future
+
+    def _check_all_pending(self):
+        if self.pending and len(self.pending) >= len(self.clients):
+            self.all_pending.set()
+
+    async def _ticker(self):
+        while True:
+            await self.wakeup.wait()
+            try:
+                await asyncio.wait_for(self.all_pending.wait(), self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            self.all_pending.clear()
+            pending, self.pending = self.pending, {}
+            if pending:
+                try:
+                    self._tick(pending)
+                except Exception as error:
+                    # Fail this tick's requests, keep serving
+                    reply = bytes([MSG_ERROR]) + f"Step failed: {error!r}".encode()
+                    for _, future in pending.values():
+                        if not future.done():
+                            future.set_result(reply)
+
+    def _tick(self, pending):
+        """Advance the cars of every pending client by one step and reply"""
+        game = self.game
+        active = [(self.clients[client], actions, future) for client, (actions, future) in pending.items()
+                  if client in self.clients]
+        if not active:
+            return
+        stepping = np.concatenate([indices for indices, _, _ in active])
+        idle = np.setdiff1d(np.arange(game.n_cars), stepping, assume_unique=True)
+        frozen = game.get_state_snapshot(idle)
+        for indices, actions, _ in active:
+            self._actions[indices] = actions
+        game.step_into(self._actions, self._obs, self._rewards, self._dones)
+        game.restore(frozen, idle)
+
+        self.current_step[stepping] += game.ticks[stepping]
+        truncated = self.current_step >= self.max_steps
+        dones = self._dones | truncated
+        for indices, _, future in active:
+            done_index = np.flatnonzero(dones[indices])
+            done_cars = indices[done_index]
+            terminal = self._obs[done_cars].copy()
+            gates = game.gates_passed[done_cars].astype(np.uint16)
+            steps = game.steps_taken[done_cars].astype(np.uint16)
+            if len(done_cars):
+                # Auto-reset finished environments
+                self.current_step[done_cars] = 0
+                game.reset_cars(done_cars)
+                game.observe_into(done_cars, self._obs)
+            reply = b"".join([
+                struct.pack("<BH", MSG_STEP, len(done_index)),
+                self._obs[indices].tobytes(),
+                self._rewards[indices].tobytes(),
+                dones[indices].astype(np.uint8).tobytes(),
+                truncated[indices].astype(np.uint8).tobytes(),
+                done_index.astype(np.uint16).tobytes(),
+                terminal.tobytes(),
+                gates.tobytes(),
+                steps.tobytes(),
+            ])
+            if not future.done():
+                future.set_result(reply)
+        self.ticks += 1
+        self.batch_sizes.append(len(active))
+
+    def stats(self):
+        """Request latency percentiles (ms), ticks and clients per tick"""
+        latencies = np.array(self.latencies[-100000:]) * 1000
+        elapsed = time.perf_counter() - self.started
+        return {
+            "clients": len(self.clients),
+            "free_envs": self.free,
+            "ticks": self.ticks,
+            "ticks_per_sec": self.ticks / elapsed,
+            "mean_clients_per_tick": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            "latency_ms": {f"p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)}
+            if len(latencies) else None,
+        }
+
+def connect(address):
+    """Blocking socket to a Unix socket path or a "host:port" TCP address"""
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        sock = socket.create_connection((host, int(port)))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+    return sock
+
+class RemoteVecEnv(VecEnv):
+    """SB3 VecEnv whose environments live in an EnvServer.
+
+    Behaves like CheckpointRacingVecEnv (observations, rewards, auto-reset,
+    terminal_observation, gates_passed and steps_taken in infos); the game
+    settings are the server's. Round-trip times of the step requests are
+    kept for latency_stats().
+    """
+
+    def __init__(self, address, n_envs=8):
+        self.sock = connect(address)
+        reply = self._request(struct.pack("<BH", MSG_CREATE, n_envs))
+        _, n_envs, obs_size = struct.unpack_from("<BHH", reply)
+        self.obs_size = obs_size
+        self.render_mode = None
+        self.actions = None
+        self.latencies = []
+
+        # Same bounds as sensors.observation_bounds: 5 game values, then rays
+        low = np.array([0, -1, 0, 0, 0] + [0] * (obs_size - 5), dtype=np.float32)
+        observation_space = spaces.Box(low=low, high=np.ones(obs_size, dtype=np.float32), dtype=np.float32)
+        super().__init__(n_envs, observation_space, spaces.Discrete(5))
+
+    def _recv_exactly(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Environment server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def _request(self, payload):
+        self.sock.sendall(_frame(payload))
+        (length,) = LENGTH.unpack(self._recv_exactly(LENGTH.size))
+        reply = self._recv_exactly(length)
+        if reply[0] == MSG_ERROR:
+            raise RuntimeError(reply[1:].decode())
+        return reply
+
+    def reset(self):
+        self._reset_seeds()
+        self._reset_options()
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        reply = self._request(bytes([MSG_RESET]))
+        return np.frombuffer(reply, dtype=np.float32, offset=1).reshape(self.num_envs, self.obs_size).copy()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions, dtype=np.uint8).reshape(self.num_envs)
+
+    def step_wait(self):
+        started = time.perf_counter()
+        reply = self._request(bytes([MSG_STEP]) + self.actions.tobytes())
+        self.latencies.append(time.perf_counter() - started)
+
+        n, size = self.num_envs, self.obs_size
+        (k,) = struct.unpack_from("<H", reply, 1)
+        offset = 3
+        def take(dtype, count):
+            nonlocal offset
+            values = np.frombuffer(reply, dtype=dtype, count=count, offset=offset)
+            offset += values.nbytes
+            return values
+        obs = take(np.float32, n * size).reshape(n, size).copy()
+        rewards = take(np.float32, n).copy()
+        dones = take(np.uint8, n).astype(bool)
+        truncated = take(np.uint8, n).astype(bool)
+        done_index = take(np.uint16, k)
+        terminal = take(np.float32, k * size).reshape(k, size)
+        gates = take(np.uint16, k)
+        steps = take(np.uint16, k)
+
+        infos = [{} for _ in range(n)]
+        for j, i in enumerate(done_index):
+            infos[i]["terminal_observation"] = terminal[j].copy()
+            infos[i]["TimeLimit.truncated"] = bool(truncated[i])
+            infos[i]["gates_passed"] = int(gates[j])
+            infos[i]["steps_taken"] = int(steps[j])
+        return obs, rewards, dones, infos
+
+    def server_stats(self):
+        return json.loads(self._request(bytes([MSG_STATS]))[1:].decode())
+
+    def latency_stats(self):
+        """Client round-trip percentiles of the step requests, in ms"""
+        latencies = np.array(self.latencies) * 1000
+        return {f"p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)} if len(latencies) else None
+
+    def close(self):
+        try:
+            self.sock.sendall(_frame(bytes([MSG_CLOSE])))
+        except OSError:
+            pass
+        self.sock.close()
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        method = getattr(self, method_name)
+        return [method(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve batched racing environments to local clients")
+    parser.add_argument("--unix", default="/tmp/checkpoint_racing.sock", help="Unix socket path")
+    parser.add_argument("--port", type=int, help="Listen on localhost TCP instead of the Unix socket")
+    parser.add_argument("--slots", type=int, default=1024, help="Most environments claimed by all clients together")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0,
+                        help="Longest wait for other clients' steps before running a tick")
+    parser.add_argument("--track", help="Track file (.json or .npz) instead of the default course")
+    parser.add_argument("--rays", type=int, default=0, help="Add ray-cast distance readings to observations")
+    parser.add_argument("--frame-skip", type=int, default=1)
+    return parser.parse_args()
+
+def main():
+    from sensors import RaySensor
+    from tracks import load_track
+
+    args = parse_args()
+    game_kwargs = dict(frame_skip=args.frame_skip)
+    if args.track:
+        game_kwargs["track"] = load_track(args.track)
+    if args.rays:
+        game_kwargs["sensor"] = RaySensor(args.rays)
+    server = EnvServer(args.slots, max_wait=args.max_wait_ms / 1000, **game_kwargs)
+    if args.port:
+        print(f"Serving {args.slots} environments on 127.0.0.1:{args.port}")
+        asyncio.run(server.serve_tcp("127.0.0.1", args.port))
+    else:
+        if os.path.exists(args.unix):
+            os.unlink(args.unix)
+        print(f"Serving {args.slots} environments on {args.unix}")
+        asyncio.run(server.serve_unix(args.unix))
+
+if __name__ == "__main__":
+    main()
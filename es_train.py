@@ -0,0 +1,309 @@
+import argparse
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+from numpy_policy import ACTIVATIONS, NumpyPolicy
+
+def flatten(layers):
+    """One float64 parameter vector from (weight, bias) layers"""
+    return np.concatenate([np.concatenate([w.ravel(), b.ravel()]) for w, b in layers]).astype(np.float64)
+
+def unflatten(theta, shapes):
+    """(weight, bias) layers of the given weight shapes from a parameter
+    vector, or (P, ...) stacked layers from (P, parameters) vectors"""
+    layers = []
+    start = 0
+    batch = theta.shape[:-1]
+    for out_size, in_size in shapes:
+        weight = theta[..., start:start + out_size * in_size].reshape(batch + (out_size, in_size))
+        start += out_size * in_size
+        bias = theta[..., start:start + out_size]
+        start += out_size
+        layers.append((weight, bias))
+    return layers
+
+def centered_ranks(returns, distances):
+    """Fitness ranks scaled to [-0.5, 0.5]. Episodes are ordered by return;
+    equal returns (common with the sparse gate reward) by how close the car
+    ended to its next gate. Exact ties share their average rank."""
+    flat_returns = returns.ravel()
+    flat_distances = distances.ravel()
+    order = np.lexsort((-flat_distances, flat_returns))
+    ranks = np.empty(len(order))
+    ranks[order] = np.arange(len(order))
+    # Average the ranks of identical (return, distance) pairs
+    keys = np.stack([flat_returns, flat_distances], axis=1)
+    _, groups = np.unique(keys, axis=0, return_inverse=True)
+    groups = groups.ravel()
+    ranks = (np.bincount(groups, ranks) / np.bincount(groups))[groups]
+    return (ranks / max(len(ranks) - 1, 1) - 0.5).reshape(returns.shape)
+
+class Adam:
+    def __init__(self, size, learning_rate=0.02, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        self.learning_rate = learning_rate
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.m = np.zeros(size)
+        self.v = np.zeros(size)
+        self.t = 0
+
+    def step(self, gradient):
+        """Parameter change that descends gradient"""
+        self.t += 1
+        self.m = self.beta1 * self.m + (1 - self.beta1) * gradient
+        self.v = self.beta2 * self.v + (1 - self.beta2) * gradient * gradient
+        rate = self.learning_rate * np.sqrt(1 - self.beta2 ** self.t) / (1 - self.beta1 ** self.t)
+        return -rate * self.m / (np.sqrt(self.v) + self.epsilon)
+
+class SharedNoiseES:
+    """OpenAI-ES state kept identically by the master and every worker.
+
+    All processes build the same noise table from noise_seed; a perturbation
+    is the slice of the table at an offset, so a generation is fully
+    described by its offsets and fitness weights. Each process applies
+    the same update to its own copy of theta, so only those scalars
+    cross process boundaries.
+    """
+
+    def __init__(self, theta, noise_seed, noise_size, sigma, learning_rate, l2):
+        self.theta = theta.copy()
+        self.noise = np.random.default_rng(noise_seed).standard_normal(noise_size, dtype=np.float32)
+        self.sigma = sigma
+        self.l2 = l2
+        self.optimizer = Adam(len(theta), learning_rate)
+
+    def perturbation(self, offset):
+        return self.noise[offset:offset + len(self.theta)]
+
+    def update(self, offsets, weights):
+        """Ascend the fitness estimate of antithetic pairs (weight = shaped
+        fitness of +eps minus that of -eps)"""
+        gradient = np.zeros(len(self.theta))
+        for offset, weight in zip(offsets, weights):
+            gradient += weight * self.perturbation(offset)
+        gradient /= 2 * len(offsets) * self.sigma
+        self.theta += self.optimizer.step(-gradient + self.l2 * self.theta)
+
+def run_population(engine, layers, activation):
+    """Run one episode per car, car i driven by the i-th policy of layers
+    ((P, out, in) weights, (P, out) biases). Returns per-car return, gates
+    passed and final distance to the car's next gate."""
+    n = engine.n_cars
+    weights = [np.ascontiguousarray(w.transpose(0, 2, 1), dtype=np.float32) for w, _ in layers]
+    biases = [b.astype(np.float32) for _, b in layers]
+    act = ACTIVATIONS[activation]
+
+    obs = engine.reset().astype(np.float32)
+    rewards = np.zeros(n, dtype=np.float32)
+    dones = np.zeros(n, dtype=bool)
+    finished = np.zeros(n, dtype=bool)
+    returns = np.zeros(n)
+    gates = np.zeros(n, dtype=np.int64)
+    distances = np.zeros(n)
+    while not finished.all():
+        x = obs
+        for i, (weight, bias) in enumerate(zip(weights, biases)):
+            x = np.matmul(x[:, None, :], weight)[:, 0, :] + bias
+            if i < len(weights) - 1:
+                x = act(x)
+        engine.step_into(x.argmax(axis=1), obs, rewards, dones)
+        returns += np.where(finished, 0.0, rewards)
+        ended = dones & ~finished
+        if ended.any():
+            gates[ended] = engine.gates_passed[ended]
+            target = engine.bank.gate_center[engine.track_index[ended], engine.current_gate[ended]]
+            distances[ended] = np.hypot(target[:, 0] - engine.car_x[ended], target[:, 1] - engine.car_y[ended])
+            finished |= ended
+    return returns, gates, distances
+
+def _worker(remote, es_kwargs, shapes, activation, n_pairs, game_kwargs):
+    """Evaluate this worker's share of every generation's perturbations"""
+    from batched_game import BatchedCheckpointGatesGame
+
+    es = SharedNoiseES(**es_kwargs)
+    engine = BatchedCheckpointGatesGame(2 * n_pairs, **game_kwargs)
+    while True:
+        message = remote.recv()
+        if message is None:
+            break
+        update, offsets = message
+        if update is not None:
+            es.update(*update)
+        # Cars [0, k) drive theta + sigma*eps, cars [k, 2k) theta - sigma*eps
+        epsilons = np.stack([es.perturbation(offset) for offset in offsets])
+        thetas = np.concatenate([es.theta + es.sigma * epsilons, es.theta - es.sigma * epsilons])
+        if len(thetas) < engine.n_cars:
+            thetas = np.concatenate([thetas, np.repeat(thetas[:1], engine.n_cars - len(thetas), axis=0)])
+        returns, gates, distances = run_population(engine, unflatten(thetas, shapes), activation)
+        k = len(offsets)
+        remote.send((returns[:2 * k].reshape(2, k), gates[:2 * k].reshape(2, k), distances[:2 * k].reshape(2, k)))
+
+def greedy_episode(policy, game_kwargs):
+    """(gates passed, steps, total gates) of policy's deterministic episode"""
+    from batched_game import BatchedCheckpointGatesGame
+
+    engine = BatchedCheckpointGatesGame(1, **game_kwargs)
+    obs = engine.reset().astype(np.float32)
+    rewards = np.zeros(1, dtype=np.float32)
+    dones = np.zeros(1, dtype=bool)
+    while not dones[0]:
+        engine.step_into(policy.predict(obs)[0], obs, rewards, dones)
+    return int(engine.gates_passed[0]), int(engine.steps_taken[0]), int(engine.bank.total_gates[0])
+
+def to_ppo(model, layers):
+    """Copy ES layers into an SB3 PPO model's action network"""
+    import torch as th
+    policy = model.policy
+    linears = [module for module in policy.mlp_extractor.policy_net if hasattr(module, "weight")]
+    linears.append(policy.action_net)
+    with th.no_grad():
+        for linear, (weight, bias) in zip(linears, layers):
+            linear.weight.copy_(th.as_tensor(np.asarray(weight, dtype=np.float32)))
+            linear.bias.copy_(th.as_tensor(np.asarray(bias, dtype=np.float32)))
+    return model
+
+def ppo_time_to_solve(cores, timesteps, eval_interval, game_kwargs, seed=0):
+    """Wall seconds (or None) for train_ai.py's PPO setup to complete the
+    course, checked every eval_interval timesteps"""
+    import torch as th
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import VecMonitor
+    from numpy_policy import export_policy
+    from vec_env import CheckpointRacingVecEnv
+
+    th.set_num_threads(cores)
+    env = VecMonitor(CheckpointRacingVecEnv(n_envs=8, **game_kwargs))
+    model = PPO("MlpPolicy", env, verbose=0, learning_rate=3e-4, n_steps=2048 // 8, batch_size=64,
+                n_epochs=10, gamma=0.99, seed=seed, device="cpu")
+    started = time.perf_counter()
+    while model.num_timesteps < timesteps:
+        model.learn(total_timesteps=eval_interval, reset_num_timesteps=False)
+        gates, _, total = greedy_episode(export_policy(model), game_kwargs)
+        print(f"PPO {model.num_timesteps:8d} steps {time.perf_counter() - started:7.1f}s: {gates}/{total} gates")
+        if gates >= total:
+            return time.perf_counter() - started, model.num_timesteps
+    return None, model.num_timesteps
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the racing policy with OpenAI-style evolution strategies")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Evaluation processes")
+    parser.add_argument("--population", type=int, default=128, help="Perturbed policies per generation (even)")
+    parser.add_argument("--generations", type=int, default=300)
+    parser.add_argument("--sigma", type=float, default=0.05, help="Perturbation scale")
+    parser.add_argument("--learning-rate", type=float, default=0.02)
+    parser.add_argument("--l2", type=float, default=0.005, help="Weight decay")
+    parser.add_argument("--noise-size", type=int, default=2 ** 23, help="Shared noise table entries")
+    parser.add_argument("--keep-going", action="store_true",
+                        help="Run every generation instead of stopping once the course is completed")
+    parser.add_argument("--init", help="Start from this SB3 model instead of a fresh MlpPolicy")
+    parser.add_argument("--track", help="Track file (.json or .npz) instead of the default course")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-method", choices=["fork", "forkserver", "spawn"], default="forkserver")
+    parser.add_argument("--compare-ppo", action="store_true",
+                        help="Also time train_ai.py's PPO to all gates (7/7) on the same number of cores")
+    parser.add_argument("--ppo-timesteps", type=int, default=300000)
+    parser.add_argument("--ppo-eval-interval", type=int, default=4096)
+    parser.add_argument("--out", default="es_racing_model", help="Output model (SB3 .zip plus NumPy .npz)")
+    args = parser.parse_args()
+    if args.population < 2 or args.population % 2:
+        parser.error("--population must be an even number of at least 2 (antithetic pairs)")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+def main():
+    from stable_baselines3 import PPO
+    from numpy_policy import export_policy
+    from tracks import load_track
+    from vec_env import CheckpointRacingVecEnv
+
+    args = parse_args()
+    game_kwargs = {"track": load_track(args.track)} if args.track else {}
+
+    # Same architecture and initialization as train_ai.py's model
+    env = CheckpointRacingVecEnv(n_envs=1, **game_kwargs)
+    if args.init:
+        model = PPO.load(args.init, env=env, device="cpu")
+    else:
+        model = PPO("MlpPolicy", env, seed=args.seed, device="cpu")
+    start_policy = export_policy(model)
+    shapes = [w.shape for w, _ in start_policy.layers]
+    es_kwargs = dict(theta=flatten(start_policy.layers), noise_seed=args.seed, noise_size=args.noise_size,
+                     sigma=args.sigma, learning_rate=args.learning_rate, l2=args.l2)
+    es = SharedNoiseES(**es_kwargs)
+    n_pairs = args.population // 2
+    workers = min(args.workers, n_pairs)  # Every worker needs at least one pair
+    pairs_per_worker = -(-n_pairs // workers)
+    rng = np.random.default_rng(args.seed)
+
+    ctx = mp.get_context(args.start_method)
+    remotes = []
+    processes = []
+    for _ in range(workers):
+        remote, work_remote = ctx.Pipe()
+        process = ctx.Process(target=_worker, daemon=True,
+                              args=(work_remote, es_kwargs, shapes, start_policy.activation, pairs_per_worker,
+                                    game_kwargs))
+        process.start()
+        work_remote.close()
+        remotes.append(remote)
+        processes.append(process)
+
+    print(f"ES: {n_pairs} antithetic pairs per generation on {workers} worker(s), "
+          f"{len(es.theta)} parameters")
+    started = time.perf_counter()
+    solved_at = None
+    update = None
+    episodes = 0
+    try:
+        for generation in range(args.generations):
+            offsets = rng.integers(0, args.noise_size - len(es.theta), n_pairs)
+            chunks = np.array_split(offsets, workers)
+            for remote, chunk in zip(remotes, chunks):
+                remote.send((update, chunk))
+            results = [remote.recv() for remote in remotes]
+            returns = np.concatenate([r[0] for r in results], axis=1)
+            gates = np.concatenate([r[1] for r in results], axis=1)
+            distances = np.concatenate([r[2] for r in results], axis=1)
+            episodes += returns.size
+
+            ranks = centered_ranks(returns, distances)
+            update = (offsets, ranks[0] - ranks[1])
+            es.update(*update)
+
+            policy = NumpyPolicy(unflatten(es.theta, shapes), start_policy.activation)
+            passed, steps, total = greedy_episode(policy, game_kwargs)
+            elapsed = time.perf_counter() - started
+            print(f"Generation {generation:4d} {elapsed:7.1f}s: population return {returns.mean():8.1f} "
+                  f"(best {returns.max():6.1f}, gates max {gates.max()}), mean policy {passed}/{total} gates"
+                  + (f" in {steps} steps" if passed >= total else ""))
+            if passed >= total and solved_at is None:
+                solved_at = elapsed
+                print(f"Course completed after {elapsed:.1f}s ({generation + 1} generations, "
+                      f"{episodes} episodes)")
+                if not args.keep_going:
+                    break
+    finally:
+        for remote in remotes:
+            remote.send(None)
+        for process in processes:
+            process.join(timeout=10)
+
+    # Save in train_ai.py's format (the value network is left as initialized)
+    layers = unflatten(es.theta, shapes)
+    to_ppo(model, layers).save(args.out)
+    NumpyPolicy(layers, start_policy.activation).save(args.out + ".npz")
+    print(f"Model saved as '{args.out}' (.zip and NumPy .npz)")
+
+    if args.compare_ppo:
+        ppo_seconds, ppo_steps = ppo_time_to_solve(args.workers, args.ppo_timesteps, args.ppo_eval_interval,
+                                                   game_kwargs, args.seed)
+        es_text = f"{solved_at:.1f}s" if solved_at is not None else "not reached"
+        ppo_text = f"{ppo_seconds:.1f}s ({ppo_steps} steps)" if ppo_seconds is not None else \
+            f"not reached in {ppo_steps} steps"
+        print(f"Wall time to all gates on {args.workers} core(s): ES {es_text}, PPO {ppo_text}")
+
+if __name__ == "__main__":
+    main()
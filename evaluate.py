@@ -0,0 +1,124 @@
+import argparse
+import json
+import time
+import numpy as np
+from batched_game import BatchedCheckpointGatesGame
+from instrumentation import add_profiling_args, profiled
+from numpy_policy import NumpyPolicy
+from sensors import RaySensor, observation_size
+from tracks import load_track
+
+def evaluate(model, n_episodes=1000, n_envs=256, deterministic=True, seed=0, max_steps=3000, **game_kwargs):
+    """Run n_episodes headless episodes of `model` and summarize them.
+
+    All environments are stepped by one batched engine and their actions come
+    from a single model.predict call per step. `model` only needs a
+    predict(obs, deterministic=...) method (an SB3 model or NumpyPolicy). Each
+    environment runs a fixed share of the episodes, so short episodes are not
+    over-represented. The engine is driven directly, with
+    CheckpointRacingVecEnv's max_steps truncation and auto-reset, so
+    evaluating a NumpyPolicy never imports torch or stable_baselines3.
+    seed=None leaves the global NumPy RNG alone (seeding reseeds it, as
+    the VecEnv does), e.g. when evaluating beside training.
+    """
+    n_envs = min(n_envs, n_episodes)
+    game = BatchedCheckpointGatesGame(n_envs, **game_kwargs)
+    if hasattr(model, "set_random_seed"):
+        # Seeds the action sampling of stochastic policies
+        model.set_random_seed(seed)
+    if seed is not None:
+        np.random.seed(seed)
+
+    targets = np.array([(n_episodes + i) // n_envs for i in range(n_envs)])
+    counts = np.zeros(n_envs, dtype=np.int64)
+    gates_passed = []
+    steps_taken = []
+    rewards = []
+    episode_rewards = np.zeros(n_envs)
+
+    obs = np.zeros((n_envs, observation_size(game.sensor)), dtype=np.float32)
+    step_rewards = np.zeros(n_envs, dtype=np.float32)
+    game_done = np.zeros(n_envs, dtype=bool)
+    current_step = np.zeros(n_envs, dtype=np.int64)
+
+    started = time.perf_counter()
+    obs[:] = game.reset()
+    env_steps = 0
+    while (counts < targets).any():
+        actions, _ = model.predict(obs, deterministic=deterministic)
+        game.step_into(actions, obs, step_rewards, game_done)
+        current_step += game.ticks
+        dones = game_done | (current_step >= max_steps)
+        env_steps += n_envs
+        episode_rewards += step_rewards
+        done_indices = np.flatnonzero(dones)
+        for i in done_indices:
+            if counts[i] < targets[i]:
+                counts[i] += 1
+                gates_passed.append(int(game.gates_passed[i]))
+                steps_taken.append(int(game.steps_taken[i]))
+                rewards.append(episode_rewards[i])
+            episode_rewards[i] = 0
+        if len(done_indices):
+            # Auto-reset finished episodes
+            current_step[done_indices] = 0
+            game.reset_cars(done_indices)
+            game.observe_into(done_indices, obs)
+    elapsed = time.perf_counter() - started
+
+    total_gates = game.total_gates
+    gates_passed = np.array(gates_passed)
+    finished_steps = np.array(steps_taken)[gates_passed >= total_gates]
+    return {
+        "episodes": len(gates_passed),
+        "total_gates": total_gates,
+        "success_rate": float(np.mean(gates_passed >= total_gates)),
+        "mean_gates_passed": float(gates_passed.mean()),
+        "gates_passed_histogram": np.bincount(gates_passed, minlength=total_gates + 1).tolist(),
+        "steps_to_finish_percentiles": {
+            f"p{q}": float(np.percentile(finished_steps, q)) for q in (10, 50, 90, 99)
+        } if len(finished_steps) else None,
+        "mean_reward": float(np.mean(rewards)),
+        "episodes_per_sec": len(gates_passed) / elapsed,
+        "env_steps_per_sec": env_steps / elapsed,
+        "seconds": elapsed,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate the trained AI on many headless episodes")
+    parser.add_argument("--model", default="checkpoint_racing_model",
+                        help="SB3 model, or an .npz exported by numpy_policy.py")
+    parser.add_argument("--episodes", type=int, default=1000)
+    parser.add_argument("--envs", type=int, default=256, help="Episodes run in parallel")
+    parser.add_argument("--stochastic", action="store_true",
+                        help="Sample actions instead of taking the most likely one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--track", help="Track file (.json or .npz) instead of the default course")
+    parser.add_argument("--rays", type=int, default=0, help="Ray readings the model was trained with")
+    parser.add_argument("--ray-fov", type=float, default=180.0)
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    add_profiling_args(parser, "evaluate")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.model.endswith(".npz"):
+        model = NumpyPolicy.load(args.model)
+    else:
+        from stable_baselines3 import PPO
+        model = PPO.load(args.model, device="cpu")
+    game_kwargs = {"track": load_track(args.track)} if args.track else {}
+    if args.rays:
+        game_kwargs["sensor"] = RaySensor(args.rays, fov=args.ray_fov)
+    results = profiled(args, "evaluate", lambda profiler: evaluate(
+        model, n_episodes=args.episodes, n_envs=args.envs,
+        deterministic=not args.stochastic, seed=args.seed, **game_kwargs))
+    results["model"] = args.model
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,51 @@
-import pygame
 import math
 import numpy as np
+from tracks import default_track, make_gates  # make_gates kept importable from game
+
+class GameState:
+    """Snapshot of everything in a CheckpointGatesGame that changes during
+    an episode (the track, settings and display are not included)"""
+    __slots__ = ("car_x", "car_y", "car_angle", "car_speed", "current_gate", "gates_passed",
+                 "episode_reward", "steps_taken")
+
+    def __init__(self, car_x, car_y, car_angle, car_speed, current_gate, gates_passed,
+                 episode_reward, steps_taken):
+        self.car_x = car_x
+        self.car_y = car_y
+        self.car_angle = car_angle
+        self.car_speed = car_speed
+        self.current_gate = current_gate
+        self.gates_passed = gates_passed
+        self.episode_reward = episode_reward
+        self.steps_taken = steps_taken
+
+    def astuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, GameState) and self.astuple() == other.astuple()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"GameState({fields})"
 
 class CheckpointGatesGame:
-    def __init__(self, width=800, height=600):
-        pygame.init()
-        self.width = width
-        self.height = height
-        self.screen = pygame.display.set_mode((width, height))
-        pygame.display.set_caption("Checkpoint Gates Racing AI")
-        self.clock = pygame.time.Clock()
+    def __init__(self, width=800, height=600, render_mode="human", frame_skip=1, fps=60, track=None,
+                 sensor=None):
+        # Course to drive (tracks.Track); the default is the original seven
+        # gates. A track brings its own screen size.
+        self.track = track if track is not None else default_track(width, height)
+        width = self.width = self.track.width
+        height = self.height = self.track.height
+        self.frame_skip = frame_skip  # Physics ticks per step() call
+        
+        # Rendering: "human" opens a window on the first render() call,
+        # "rgb_array" draws offscreen and returns frames as NumPy arrays,
+        # None never touches pygame (headless training)
+        self.render_mode = render_mode
+        self.fps = fps  # Frame rate cap for render(), None = uncapped
+        self.screen = None
+        self.clock = None
         
         # Colors
         self.BLACK = (0, 0, 0)
@@ -20,29 +56,24 @@ class CheckpointGatesGame:
         self.YELLOW = (255, 255, 0)
         self.GRAY = (128, 128, 128)
         
-        # Car properties
-        self.car_x = width // 2
-        self.car_y = height - 100
-        self.car_angle = 0
+        # Car properties (the car waits at the track's start, as after reset)
+        self.car_x, self.car_y = self.track.start
+        self.car_angle = self.track.start_angle
         self.car_speed = 0
         self.max_speed = 5
         self.car_width = 15
         self.car_height = 25
         
         # Checkpoint gates - narrow passages the car MUST drive through
-        self.gates = [
-            # Each gate is defined by two points (left post, right post)
-            ((width//2 - 30, height - 200), (width//2 + 30, height - 200)),  # Gate 1
-            ((width//2 + 150, height - 350), (width//2 + 210, height - 350)), # Gate 2 (right)
-            ((width//2 + 150, height//2), (width//2 + 210, height//2)),       # Gate 3 (right middle)
-            ((width//2 - 30, height//2), (width//2 + 30, height//2)),         # Gate 4 (center)
-            ((width//2 - 210, height//2), (width//2 - 150, height//2)),       # Gate 5 (left)
-            ((width//2 - 210, height - 350), (width//2 - 150, height - 350)), # Gate 6 (left high)
-            ((width//2 - 30, height - 450), (width//2 + 30, height - 450)),   # Gate 7 (finish)
-        ]
+        self.gates = self.track.gates
+        self.gate_frames = self.track.gate_frames
+        self.gate_centers = self.track.gate_center.tolist()  # Last entry: target after the finish
         
         self.current_gate = 0
-        self.total_gates = len(self.gates)
+        self.total_gates = self.track.total_gates
+        
+        # Optional sensors.RaySensor, its readings are appended to the state
+        self.sensor = sensor
         self.gates_passed = 0
         
         # Game state
@@ -52,32 +83,34 @@ class CheckpointGatesGame:
         
     def reset(self):
         """Reset the game to initial state"""
-        self.car_x = self.width // 2
-        self.car_y = self.height - 50  # Start at bottom
-        self.car_angle = 0
+        self.car_x, self.car_y = self.track.start  # Start at bottom
+        self.car_angle = self.track.start_angle
         self.car_speed = 0
         self.current_gate = 0
         self.gates_passed = 0
         self.episode_reward = 0
         self.steps_taken = 0
-        
-        # Reset distance tracking
-        if hasattr(self, 'prev_distance_to_gate'):
-            delattr(self, 'prev_distance_to_gate')
-            
+        return self.get_state()
+    
+    def get_state_snapshot(self):
+        """Copy of the episode state, for restore()"""
+        return GameState(self.car_x, self.car_y, self.car_angle, self.car_speed, self.current_gate,
+                         self.gates_passed, self.episode_reward, self.steps_taken)
+    
+    def restore(self, snapshot):
+        """Return to a get_state_snapshot() state and return the game state
+        
+        The game is deterministic, so the same actions from a restored state
+        give the same results as they did from the original.
+        """
+        self.car_x, self.car_y, self.car_angle, self.car_speed, self.current_gate, \
+            self.gates_passed, self.episode_reward, self.steps_taken = snapshot.astuple()
         return self.get_state()
     
     def get_state(self):
         """Get current game state for AI"""
-        if self.current_gate >= len(self.gates):
-            # All gates passed
-            gate_left = gate_right = (self.width//2, 0)
-        else:
-            gate_left, gate_right = self.gates[self.current_gate]
-        
-        # Gate center
-        gate_center_x = (gate_left[0] + gate_right[0]) / 2
-        gate_center_y = (gate_left[1] + gate_right[1]) / 2
+        # Gate center (precomputed by the track, finish target once all are passed)
+        gate_center_x, gate_center_y = self.gate_centers[self.current_gate]
         
         # Vector to gate center
         dx = gate_center_x - self.car_x
@@ -103,16 +136,35 @@ class CheckpointGatesGame:
         normalized_angle = relative_angle / math.pi
         normalized_speed = self.car_speed / self.max_speed
         
-        return np.array([
+        state = np.array([
             normalized_distance,    # Distance to next gate
             normalized_angle,       # Angle to next gate
             normalized_speed,       # Current speed
             float(alignment),       # Whether pointing toward gate (0 or 1)
             self.gates_passed / self.total_gates  # Progress
         ])
+        if self.sensor is not None:
+            rays = self.sensor.observe(self.track, [self.car_x], [self.car_y], [self.car_angle])[0]
+            state = np.concatenate([state, rays])
+        return state
     
     def step(self, action):
-        """Execute one game step based on action"""
+        """Execute one game step based on action
+        
+        The action is repeated for frame_skip physics ticks (stopping early
+        if the episode ends) and the tick rewards are summed.
+        """
+        reward, done = self.tick(action)
+        for _ in range(self.frame_skip - 1):
+            if done:
+                break
+            tick_reward, done = self.tick(action)
+            reward += tick_reward
+        
+        return self.get_state(), reward, done
+    
+    def tick(self, action):
+        """Advance the physics by one tick, returning (reward, done)"""
         self.steps_taken += 1
         
         # Actions: 0=nothing, 1=left, 2=right, 3=accelerate, 4=brake
@@ -156,24 +208,22 @@ class CheckpointGatesGame:
         done = (self.gates_passed >= self.total_gates or 
                 self.steps_taken >= self.max_steps)
         
-        return self.get_state(), reward, done
+        return reward, done
     
     def check_gate_passage(self):
         """Check if car passed through the current gate"""
-        if self.current_gate >= len(self.gates):
+        if self.current_gate >= self.total_gates:
             return False
         
-        gate_left, gate_right = self.gates[self.current_gate]
+        left_x, left_y, right_x, right_y, center_x, center_y, tx, ty, nx, ny = self.gate_frames[self.current_gate]
         
-        # Check if car is at the gate's Y level (within tolerance)
-        gate_y = gate_left[1]  # Both posts have same Y
-        if abs(self.car_y - gate_y) < 20:  # Within 20 pixels of gate line
-            
-            # Check if car X is between the gate posts
-            gate_left_x = gate_left[0]
-            gate_right_x = gate_right[0]
+        # Check if car is near the gate line (within tolerance), measured
+        # along the gate normal so any gate orientation works
+        if abs((self.car_x - center_x) * nx + (self.car_y - center_y) * ny) < 20:  # Within 20 pixels of gate line
             
-            if gate_left_x <= self.car_x <= gate_right_x:
+            # Check if car is between the gate posts (along the gate tangent)
+            if ((self.car_x - left_x) * tx + (self.car_y - left_y) * ty >= 0
+                    and (self.car_x - right_x) * tx + (self.car_y - right_y) * ty <= 0):
                 # Passed through gate!
                 self.current_gate += 1
                 self.gates_passed += 1
@@ -191,9 +241,41 @@ class CheckpointGatesGame:
         # Small negative reward per step to encourage efficiency
         return -0.1
     
-    def render(self):
-        """Render the game"""
-        self.screen.fill(self.BLACK)
+    def init_display(self):
+        """Create the pygame window (or offscreen frame), clock and cached
+        drawing resources (done lazily by render)"""
+        import pygame
+        if self.render_mode == "rgb_array":
+            # Offscreen 32-bit surface (same blending as the window) drawing
+            # straight into a NumPy buffer; frames are views of its RGB bytes
+            pygame.font.init()
+            self.frame_buffer = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+            self.frame = self.frame_buffer[:, :, :3]
+            self.screen = pygame.image.frombuffer(self.frame_buffer, (self.width, self.height), "RGBX")
+        else:
+            pygame.init()
+            self.screen = pygame.display.set_mode((self.width, self.height))
+            pygame.display.set_caption("Checkpoint Gates Racing AI")
+        self.clock = pygame.time.Clock()
+        
+        # Fonts and gate labels are created once, not per gate per frame
+        self.gate_font = pygame.font.Font(None, 24)
+        self.hud_font = pygame.font.Font(None, 36)
+        self.gate_labels = {
+            color: [self.gate_font.render(str(i+1), True, color) for i in range(self.total_gates)]
+            for color in (self.GREEN, self.GRAY, self.WHITE)
+        }
+        self.hud_cache = {}
+        
+        # Static background (gates) and the areas drawn over it last frame
+        self.background = pygame.Surface((self.width, self.height), 0, self.screen)
+        self.background_gate = None
+        self.dirty_rects = []
+    
+    def draw_background(self):
+        """Redraw the static gates layer for the current target gate"""
+        import pygame
+        self.background.fill(self.BLACK)
         
         # Draw all gates
         for i, (gate_left, gate_right) in enumerate(self.gates):
@@ -211,40 +293,78 @@ class CheckpointGatesGame:
                 thickness = 4
             
             # Draw gate posts
-            pygame.draw.circle(self.screen, color, gate_left, 10, thickness//2)
-            pygame.draw.circle(self.screen, color, gate_right, 10, thickness//2)
+            pygame.draw.circle(self.background, color, gate_left, 10, thickness//2)
+            pygame.draw.circle(self.background, color, gate_right, 10, thickness//2)
             
             # Draw gate line
-            pygame.draw.line(self.screen, color, gate_left, gate_right, thickness//2)
+            pygame.draw.line(self.background, color, gate_left, gate_right, thickness//2)
             
             # Draw gate number
-            font = pygame.font.Font(None, 24)
-            text = font.render(str(i+1), True, color)
             gate_center_x = (gate_left[0] + gate_right[0]) // 2
             gate_center_y = (gate_left[1] + gate_right[1]) // 2
-            self.screen.blit(text, (gate_center_x - 6, gate_center_y - 30))
+            self.background.blit(self.gate_labels[color][i], (gate_center_x - 6, gate_center_y - 30))
+        
+        self.background_gate = self.current_gate
+    
+    def hud_text(self, text):
+        """Rendered HUD line, cached while its text does not change"""
+        surface = self.hud_cache.get(text)
+        if surface is None:
+            if len(self.hud_cache) > 256:
+                self.hud_cache.clear()
+            surface = self.hud_cache[text] = self.hud_font.render(text, True, self.WHITE)
+        return surface
+    
+    def render(self):
+        """Render the game
+        
+        Only the car and HUD are redrawn each frame; the gates come from a
+        background surface rebuilt when the target gate changes. In
+        "rgb_array" mode the (height, width, 3) frame is returned; it is a
+        view that the next render() overwrites, so copy it to keep it.
+        """
+        if self.render_mode is None:
+            return
+        if self.screen is None:
+            self.init_display()
+        import pygame
+        
+        full_redraw = self.background_gate != self.current_gate
+        if full_redraw:
+            self.draw_background()
+            self.screen.blit(self.background, (0, 0))
+        else:
+            # Erase last frame's car and HUD
+            for rect in self.dirty_rects:
+                self.screen.blit(self.background, rect, rect)
+        previous_rects = self.dirty_rects
         
         # Draw car
         car_points = self.get_car_corners()
-        pygame.draw.polygon(self.screen, self.RED, car_points)
+        rects = [pygame.draw.polygon(self.screen, self.RED, car_points)]
         
         # Draw direction line
         car_front_x = self.car_x + 20 * math.sin(math.radians(self.car_angle))
         car_front_y = self.car_y - 20 * math.cos(math.radians(self.car_angle))
-        pygame.draw.line(self.screen, self.YELLOW, (self.car_x, self.car_y), (car_front_x, car_front_y), 3)
+        rects.append(pygame.draw.line(self.screen, self.YELLOW, (self.car_x, self.car_y), (car_front_x, car_front_y), 3))
         
         # Draw info
-        font = pygame.font.Font(None, 36)
-        speed_text = font.render(f"Speed: {self.car_speed:.1f}", True, self.WHITE)
-        gate_text = font.render(f"Gate: {self.current_gate+1}/{self.total_gates}", True, self.WHITE)
-        reward_text = font.render(f"Reward: {self.episode_reward:.1f}", True, self.WHITE)
+        rects.append(self.screen.blit(self.hud_text(f"Speed: {self.car_speed:.1f}"), (10, 10)))
+        rects.append(self.screen.blit(self.hud_text(f"Gate: {self.current_gate+1}/{self.total_gates}"), (10, 50)))
+        rects.append(self.screen.blit(self.hud_text(f"Reward: {self.episode_reward:.1f}"), (10, 90)))
+        self.dirty_rects = rects
         
-        self.screen.blit(speed_text, (10, 10))
-        self.screen.blit(gate_text, (10, 50))
-        self.screen.blit(reward_text, (10, 90))
+        if self.render_mode == "rgb_array":
+            return self.frame
+        
+        if full_redraw:
+            pygame.display.flip()
+        else:
+            pygame.display.update(previous_rects + rects)
         
-        pygame.display.flip()
-        self.clock.tick(60)
+        # fps=None renders as fast as possible (offline recording)
+        if self.fps:
+            self.clock.tick(self.fps)
     
     def get_car_corners(self):
         """Get car corner points for drawing"""
@@ -0,0 +1,216 @@
+import argparse
+import math
+import time
+import numpy as np
+
+def keyboard_controller(game, state):
+    """Action from the arrow keys (pygame key state)"""
+    import pygame
+    keys = pygame.key.get_pressed()
+    if keys[pygame.K_LEFT]:
+        return 1
+    if keys[pygame.K_RIGHT]:
+        return 2
+    if keys[pygame.K_UP]:
+        return 3
+    if keys[pygame.K_DOWN]:
+        return 4
+    return 0
+
+def policy_controller(model):
+    """Controller taking the deterministic actions of a model with predict()"""
+    def controller(game, state):
+        action, _ = model.predict(np.asarray(state, dtype=np.float32), deterministic=True)
+        return int(action)
+    return controller
+
+class GameLoop:
+    """Drive a CheckpointGatesGame at a fixed physics rate, independent of drawing.
+
+    Each frame adds the elapsed wall time to an accumulator and runs one
+    physics tick (input sampled from controller(game, state), then
+    game.tick) per 1/tick_rate seconds in it. At most max_frame_time
+    seconds of physics (but never less than one frame's worth) are caught
+    up in one frame; the rest is dropped so a stall cannot snowball. The car is then drawn
+    at its pose interpolated between the last two ticks by the remaining
+    fraction of a tick, and the loop sleeps until the next 1/fps frame.
+    The game's own frame cap is turned off. Each tick is one step of the
+    scalar game, so tick_rate=60 plays at the original speed.
+
+    With realtime=False time advances exactly 1/fps per frame whatever the
+    drawing costs and no tick is ever dropped, so offline runs (rgb_array recorders, CI) produce the same
+    frames every time. on_step(game, reward, done) is called after every
+    tick (the loop resets the game when done) and on_frame(frame) after
+    every render.
+
+    stats() reports input-to-photon latency (input sample of the oldest tick
+    first shown in a frame until that frame is presented), frames that
+    missed their deadline and physics time dropped.
+    """
+
+    def __init__(self, game, controller=keyboard_controller, tick_rate=60.0, fps=60.0, max_frame_time=0.25,
+                 realtime=True, on_step=None, on_frame=None):
+        self.game = game
+        self.controller = controller
+        self.tick_rate = tick_rate
+        self.fps = fps
+        self.max_frame_time = max_frame_time
+        # Ticks caught up per frame: enough for a slow frame, and always a
+        # whole frame's worth at the display rate
+        self.max_ticks_per_frame = max(math.ceil(tick_rate / fps), int(max_frame_time * tick_rate))
+        self.realtime = realtime
+        self.on_step = on_step
+        self.on_frame = on_frame
+        game.fps = None  # The loop paces the frames
+
+        self.state = game.get_state()
+        self.previous_pose = self.pose()
+        self.running = False
+
+        self.frames = 0
+        self.ticks = 0
+        self.dropped_frames = 0
+        self.dropped_ticks = 0
+        self.latencies = []
+        self.elapsed = 0.0
+
+    def pose(self):
+        return self.game.car_x, self.game.car_y, self.game.car_angle
+
+    def tick(self):
+        """Sample the input and advance the physics by one tick"""
+        sampled = time.perf_counter()
+        action = self.controller(self.game, self.state)
+        self.previous_pose = self.pose()
+        reward, done = self.game.tick(action)
+        self.ticks += 1
+        if self.on_step is not None:
+            self.on_step(self.game, reward, done)
+        if done:
+            self.game.reset()
+            self.previous_pose = self.pose()  # No interpolation across the reset
+        self.state = self.game.get_state()
+        return sampled
+
+    def draw(self, alpha):
+        """Render with the car between its last two poses (alpha in [0, 1))"""
+        game = self.game
+        current = self.pose()
+        game.car_x, game.car_y, game.car_angle = (p + alpha * (c - p) for p, c in zip(self.previous_pose, current))
+        try:
+            frame = game.render()
+        finally:
+            game.car_x, game.car_y, game.car_angle = current
+        if self.on_frame is not None and frame is not None:
+            self.on_frame(frame)
+
+    def handle_events(self):
+        if self.game.render_mode != "human" or self.game.screen is None:
+            return
+        import pygame
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.running = False
+
+    def run(self, seconds=None, frames=None):
+        """Run until the window is closed, or for the given seconds (of game
+        time when not realtime) or number of frames"""
+        tick_time = 1.0 / self.tick_rate
+        frame_time = 1.0 / self.fps
+        accumulator = 0.0
+        self.running = True
+        self.draw(1.0)  # Opens the window
+        started = previous = time.perf_counter()
+        deadline = started + frame_time
+        while self.running:
+            if self.realtime:
+                now = time.perf_counter()
+                elapsed, previous = now - previous, now
+            else:
+                elapsed = frame_time
+            accumulator += elapsed
+
+            self.handle_events()
+            first_sample = None
+            ticks = 0
+            limit = self.max_ticks_per_frame if self.realtime else math.inf
+            while accumulator >= tick_time and ticks < limit:
+                sampled = self.tick()
+                if first_sample is None:
+                    first_sample = sampled
+                accumulator -= tick_time
+                ticks += 1
+            if accumulator >= tick_time:
+                # Too far behind: drop the backlog instead of spiralling
+                dropped = int(accumulator / tick_time)
+                self.dropped_ticks += dropped
+                accumulator -= dropped * tick_time
+
+            self.draw(accumulator / tick_time)
+            presented = time.perf_counter()
+            self.frames += 1
+            if first_sample is not None:
+                self.latencies.append(presented - first_sample)
+
+            if self.realtime:
+                if presented > deadline:
+                    # Frames whose whole slot went by while this one was drawn
+                    missed = int((presented - deadline) / frame_time)
+                    if presented - deadline > frame_time / 2:
+                        self.dropped_frames += missed + 1
+                    deadline += (missed + 1) * frame_time
+                else:
+                    time.sleep(deadline - presented)
+                    deadline += frame_time
+            game_time = (time.perf_counter() - started) if self.realtime else self.frames / self.fps
+            if (seconds is not None and game_time >= seconds) or (frames is not None and self.frames >= frames):
+                break
+        self.running = False
+        self.elapsed = time.perf_counter() - started
+        return self.stats()
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        elapsed = self.elapsed or 1e-9
+        return {
+            "frames": self.frames,
+            "ticks": self.ticks,
+            "fps": self.frames / elapsed,
+            "ticks_per_sec": self.ticks / elapsed,
+            "dropped_frames": self.dropped_frames,
+            "dropped_ticks": self.dropped_ticks,
+            "input_to_photon_ms": {f"p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)}
+            if len(latencies) else None,
+        }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Play or watch the game with a fixed-timestep loop")
+    parser.add_argument("--ai", nargs="?", const="checkpoint_racing_model", metavar="MODEL",
+                        help="Let a trained model drive (default model: checkpoint_racing_model)")
+    parser.add_argument("--tick-rate", type=float, default=60.0, help="Physics ticks per second")
+    parser.add_argument("--fps", type=float, default=60.0, help="Display frames per second")
+    parser.add_argument("--max-frame-time", type=float, default=0.25,
+                        help="Most physics time (s) caught up after a slow frame; the rest is dropped")
+    parser.add_argument("--seconds", type=float, help="Stop after this long")
+    parser.add_argument("--offscreen", action="store_true",
+                        help="Render to rgb_array frames with a virtual clock (no window)")
+    return parser.parse_args()
+
+def main():
+    from game import CheckpointGatesGame
+
+    args = parse_args()
+    game = CheckpointGatesGame(render_mode="rgb_array" if args.offscreen else "human")
+    game.reset()
+    if args.ai:
+        from numpy_policy import load_policy
+        controller = policy_controller(load_policy(args.ai))
+    else:
+        controller = keyboard_controller
+    loop = GameLoop(game, controller, tick_rate=args.tick_rate, fps=args.fps,
+                    max_frame_time=args.max_frame_time, realtime=not args.offscreen)
+    stats = loop.run(seconds=args.seconds if args.seconds or not args.offscreen else 10.0)
+    print(stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import cProfile
+import csv
+import functools
+import importlib
+import importlib.util
+import json
+import os
+import pstats
+import signal
+import threading
+import time
+from collections import Counter
+
+# Methods timed by default: (module, class, method, phase name, items counted
+# per call or None). Classes whose module cannot be imported are skipped.
+DEFAULT_TARGETS = [
+    ("game", "CheckpointGatesGame", "step", "game.step", None),
+    ("game", "CheckpointGatesGame", "get_state", "game.get_state", None),
+    ("game", "CheckpointGatesGame", "render", "game.render", None),
+    ("ai_env", "CheckpointRacingEnv", "step", "env.step", None),
+    ("batched_game", "BatchedCheckpointGatesGame", "step_into", "engine.step", lambda game: game.n_cars),
+    ("batched_game", "BatchedCheckpointGatesGame", "reset_cars", "engine.reset_cars", None),
+    ("vec_env", "CheckpointRacingVecEnv", "step_wait", "vec_env.step", lambda env: env.num_envs),
+    ("subproc_vec_env", "SharedMemoryVecEnv", "step_wait", "vec_env.step", lambda env: env.num_envs),
+    ("stable_baselines3.common.on_policy_algorithm", "OnPolicyAlgorithm", "collect_rollouts",
+     "sb3.collect_rollouts", None),
+    ("stable_baselines3", "PPO", "train", "sb3.train", None),
+]
+
+class Profiler:
+    """Per-phase wall-clock timers, switched on and off at runtime.
+
+    enable() wraps each target method on its class with a timer and disable()
+    puts the original back, so instrumented code runs untouched while the
+    profiler is off. Every phase records its calls, total and longest time
+    (inclusive of nested phases); targets with an items function also count
+    the items processed (e.g. environment steps). With trace=True each call
+    is kept as a Chrome trace event (up to max_events) for write_trace().
+
+    count(name, n) adds to a free-form counter from anywhere. Only this
+    process is timed: with worker processes (SharedMemoryVecEnv) the
+    engine phases run in the workers and show up as part of vec_env.step.
+    """
+
+    def __init__(self, targets=None, trace=False, max_events=1000000):
+        self.targets = DEFAULT_TARGETS if targets is None else targets
+        self.trace = trace
+        self.max_events = max_events
+        self.enabled = False
+        self.patched = []  # (class, method name, original or None if inherited)
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        self.timers = {}  # Phase -> [calls, total ns, max ns]
+        self.counters = Counter()
+        self.events = []
+        self.started = time.perf_counter_ns()
+
+    def enable(self):
+        if self.enabled:
+            return self
+        for module_name, class_name, method, phase, items in self.targets:
+            try:
+                cls = getattr(importlib.import_module(module_name), class_name)
+            except (ImportError, AttributeError):
+                continue
+            # None marks an inherited method: disable() deletes the wrapper
+            self.patched.append((cls, method, vars(cls).get(method)))
+            setattr(cls, method, self._wrap(getattr(cls, method), phase, items))
+        self.enabled = True
+        return self
+
+    def disable(self):
+        for cls, method, original in reversed(self.patched):
+            if original is None:
+                delattr(cls, method)
+            else:
+                setattr(cls, method, original)
+        self.patched = []
+        self.enabled = False
+        return self
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def _wrap(self, function, phase, items):
+        profiler = self
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler._record(phase, start, time.perf_counter_ns())
+                if items is not None:
+                    profiler.count(phase + ".items", items(args[0]))
+        return timed
+
+    def _record(self, phase, start, end):
+        elapsed = end - start
+        timer = self.timers.get(phase)
+        if timer is None:
+            timer = self.timers[phase] = [0, 0, 0]
+        timer[0] += 1
+        timer[1] += elapsed
+        if elapsed > timer[2]:
+            timer[2] = elapsed
+        if self.trace and len(self.events) < self.max_events:
+            self.events.append((phase, start, elapsed, threading.get_ident()))
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def summary(self):
+        """Phase -> calls, total seconds, mean/max microseconds, share of wall time"""
+        wall = max(time.perf_counter_ns() - self.started, 1)
+        phases = {}
+        for phase, (calls, total, longest) in sorted(self.timers.items(), key=lambda item: -item[1][1]):
+            phases[phase] = {
+                "calls": calls,
+                "total_s": total / 1e9,
+                "mean_us": total / calls / 1000,
+                "max_us": longest / 1000,
+                "share": total / wall,
+            }
+            items = self.counters.get(phase + ".items")
+            if items:
+                phases[phase]["items_per_sec"] = items / (total / 1e9) if total else 0.0
+        return phases
+
+    def record(self, logger, prefix="profile"):
+        """Write the summary to an SB3 logger (tensorboard/CSV/stdout outputs)"""
+        for phase, stats in self.summary().items():
+            for key in ("total_s", "mean_us", "share", "items_per_sec"):
+                if key in stats:
+                    logger.record(f"{prefix}/{phase}/{key}", stats[key])
+        for name, value in self.counters.items():
+            if not name.endswith(".items"):
+                logger.record(f"{prefix}/{name}", value)
+
+    def write_csv(self, path):
+        """The summary as CSV, one row per phase"""
+        rows = [dict(phase=phase, **stats) for phase, stats in self.summary().items()]
+        fields = ["phase", "calls", "total_s", "mean_us", "max_us", "share", "items_per_sec"]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def write_trace(self, path):
+        """Chrome trace-event JSON (chrome://tracing, Perfetto) of the recorded calls"""
+        pid = os.getpid()
+        events = [{"name": phase, "cat": phase.split(".")[0], "ph": "X", "ts": start / 1000,
+                   "dur": elapsed / 1000, "pid": pid, "tid": tid}
+                  for phase, start, elapsed, tid in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def format(self):
+        """The summary as a printable table"""
+        lines = [f"{'phase':24s} {'calls':>9s} {'total s':>9s} {'mean us':>10s} {'max us':>10s} {'share':>7s}"]
+        for phase, stats in self.summary().items():
+            lines.append(f"{phase:24s} {stats['calls']:9d} {stats['total_s']:9.3f} {stats['mean_us']:10.1f} "
+                         f"{stats['max_us']:10.1f} {stats['share']:7.1%}")
+        return "\n".join(lines)
+
+class SamplingProfiler:
+    """Statistical profiler: samples the main thread's Python stack every
+    `interval` seconds of CPU time (SIGPROF, so Unix only) and writes the
+    counts in the collapsed-stack format read by flamegraph.pl and
+    speedscope."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+
+def run_profiled(function, mode, path, top=25):
+    """Run function() under cProfile ("cprofile") or the sampling profiler
+    ("sample"), write the profile to path and print the hottest functions"""
+    if mode == "cprofile":
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function)
+        finally:
+            profile.dump_stats(path)
+            pstats.Stats(profile).sort_stats("cumulative").print_stats(top)
+            print(f"cProfile stats written to {path} (view with snakeviz or pstats)")
+    sampler = SamplingProfiler()
+    sampler.start()
+    try:
+        return function()
+    finally:
+        sampler.stop()
+        sampler.write(path)
+        own = Counter()
+        for stack, samples in sampler.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += samples
+        total = max(sum(own.values()), 1)
+        for name, samples in own.most_common(top):
+            print(f"{samples / total:7.1%} {name}")
+        print(f"{total} samples written to {path} (collapsed stacks for flamegraph.pl/speedscope)")
+
+def training_logger(log_dir):
+    """SB3 logger writing to stdout, log_dir/progress.csv and (when the
+    tensorboard package is installed) TensorBoard event files in log_dir"""
+    from stable_baselines3.common.logger import configure
+
+    formats = ["stdout", "csv"]
+    if importlib.util.find_spec("tensorboard") is not None:
+        formats.append("tensorboard")
+    return configure(log_dir, formats)
+
+def add_profiling_args(parser, name):
+    """Add the --profile, --profile-out, --instrument, --trace and --profile-csv options"""
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=["cprofile", "sample"],
+                        help="Profile the run with cProfile (default) or a sampling profiler")
+    parser.add_argument("--profile-out", help=f"Profile file (default {name}.prof or {name}.folded)")
+    parser.add_argument("--instrument", action="store_true",
+                        help="Time the game, env and training phases and report them")
+    parser.add_argument("--trace", help="Also write the timed calls as a Chrome trace JSON to this file")
+    parser.add_argument("--profile-csv", help="Also write the phase timings (--instrument) as CSV to this file")
+
+def profiled(args, name, function):
+    """Run function(profiler) with the profiling requested on the command line;
+    profiler is the enabled Profiler with --instrument/--trace/--profile-csv, else None"""
+    instrument = args.instrument or args.trace or args.profile_csv
+    profiler = Profiler(trace=bool(args.trace)).enable() if instrument else None
+    try:
+        if args.profile:
+            path = args.profile_out or f"{name}.{'prof' if args.profile == 'cprofile' else 'folded'}"
+            return run_profiled(lambda: function(profiler), args.profile, path)
+        return function(profiler)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            print(profiler.format())
+            if args.trace:
+                profiler.write_trace(args.trace)
+                print(f"Trace written to {args.trace}")
+            if args.profile_csv:
+                profiler.write_csv(args.profile_csv)
+                print(f"Phase timings written to {args.profile_csv}")
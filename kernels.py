@@ -0,0 +1,179 @@
+"""Compiled per-car step kernel for BatchedCheckpointGatesGame.
+
+The kernel is plain scalar Python over math functions, compiled with Numba
+when it is installed (optional dependency). It updates the engine's state
+arrays in place and writes float32 observations, rewards and done flags into
+caller-provided buffers, so a steady-state step loop allocates nothing.
+Gate arrays are the engine's TrackBank arrays: a car on track slot s reads
+gate g of its course at [s, g].
+Without Numba, BatchedCheckpointGatesGame.step_into falls back to the
+vectorized NumPy engine, which allocates every step (the engine warns once
+when that happens): install numba for the zero-allocation step.
+"""
+import math
+
+try:
+    import numba
+    HAVE_NUMBA = True
+except ImportError:
+    numba = None
+    HAVE_NUMBA = False
+
+DEG2RAD = math.pi / 180.0  # Same constant math.radians uses
+
+def _observe_car(i, car_x, car_y, car_angle, car_speed, current_gate, gates_passed,
+                 track_index, total_gates, gate_center, max_speed, obs_out):
+    """Write car i's 5-value observation (same formulas as get_state)"""
+    t = track_index[i]
+    gate = current_gate[i]
+    dx = gate_center[t, gate, 0] - car_x[i]
+    dy = gate_center[t, gate, 1] - car_y[i]
+    distance_to_gate = math.sqrt(dx*dx + dy*dy)
+
+    relative_angle = math.atan2(dx, -dy) - car_angle[i] * DEG2RAD
+    while relative_angle > math.pi:
+        relative_angle -= 2 * math.pi
+    while relative_angle < -math.pi:
+        relative_angle += 2 * math.pi
+
+    obs_out[i, 0] = min(distance_to_gate / 400.0, 1.0)
+    obs_out[i, 1] = relative_angle / math.pi
+    obs_out[i, 2] = car_speed[i] / max_speed
+    obs_out[i, 3] = 1.0 if abs(relative_angle) < math.pi / 4 else 0.0
+    obs_out[i, 4] = gates_passed[i] / total_gates[t]
+
+def _slab(start, end, half_extent):
+    """Parameter interval in which start + t*(end-start) lies within +-half_extent"""
+    delta = end - start
+    if delta != 0:
+        t_low = (-half_extent - start) / delta
+        t_high = (half_extent - start) / delta
+        return min(t_low, t_high), max(t_low, t_high)
+    if abs(start) > half_extent:
+        return math.inf, math.inf
+    return -math.inf, math.inf
+
+def _swept_crossing(i, prev_x, prev_y, car_x, car_y, current_gate, t, gate_center, gate_tangent,
+                    gate_normal, gate_half_width, gate_directed, gate_tolerance, total_gates,
+                    wrong_way, wrong_way_crossings):
+    """Scalar version of BatchedCheckpointGatesGame.check_gate_crossing"""
+    target = current_gate[i]
+    passed = False
+    # Only the last passed gate and the current one, as in the NumPy engine
+    for g in range(max(target - 1, 0), min(target, total_gates - 1) + 1):
+        rel0_x = prev_x - gate_center[t, g, 0]
+        rel0_y = prev_y - gate_center[t, g, 1]
+        rel1_x = car_x[i] - gate_center[t, g, 0]
+        rel1_y = car_y[i] - gate_center[t, g, 1]
+        a0 = rel0_x * gate_tangent[t, g, 0] + rel0_y * gate_tangent[t, g, 1]
+        a1 = rel1_x * gate_tangent[t, g, 0] + rel1_y * gate_tangent[t, g, 1]
+        b0 = rel0_x * gate_normal[t, g, 0] + rel0_y * gate_normal[t, g, 1]
+        b1 = rel1_x * gate_normal[t, g, 0] + rel1_y * gate_normal[t, g, 1]
+
+        reversing = gate_directed[t, g] and b1 < b0
+        if reversing and (b0 < 0) != (b1 < 0):
+            t_line = b0 / (b0 - b1)
+            if abs(a0 + t_line * (a1 - a0)) <= gate_half_width[t, g]:
+                wrong_way[i] = True
+                wrong_way_crossings[i] += 1
+
+        if g == target and not reversing:
+            enter_a, exit_a = _slab(a0, a1, gate_half_width[t, g])
+            enter_b, exit_b = _slab(b0, b1, gate_tolerance)
+            passed = max(max(enter_a, enter_b), 0.0) <= min(min(exit_a, exit_b), 1.0)
+    return passed
+
+def _step_cars(actions, car_x, car_y, car_angle, car_speed, current_gate, gates_passed,
+               episode_reward, steps_taken, ticks, wrong_way, wrong_way_crossings,
+               track_index, total_gates, gate_left, gate_right, gate_center, gate_tangent,
+               gate_normal, gate_half_width, gate_directed, swept, gate_tolerance, dt, substeps,
+               decel, frame_skip, max_speed, margin, width, height, max_steps, obs_out, rew_out,
+               done_out):
+    """Advance every car by one step (frame_skip ticks) in place"""
+    h = dt / substeps
+    for i in range(actions.shape[0]):
+        action = actions[i]
+        t = track_index[i]
+        n_gates = total_gates[t]
+        wrong_way[i] = False
+        total_reward = 0.0
+        done = False
+        n_ticks = 0
+        while n_ticks < frame_skip and not (n_ticks > 0 and done):
+            n_ticks += 1
+            steps_taken[i] += 1
+            gates_crossed = 0
+            for _ in range(substeps):
+                # Actions: 0=nothing, 1=left, 2=right, 3=accelerate, 4=brake
+                if action == 1:
+                    car_angle[i] -= 6 * h
+                elif action == 2:
+                    car_angle[i] += 6 * h
+                elif action == 3:
+                    car_speed[i] = min(car_speed[i] + 0.8 * h, max_speed)
+                elif action == 4:
+                    car_speed[i] = max(car_speed[i] - 1.5 * h, 0.0)
+
+                # Natural deceleration
+                car_speed[i] *= decel
+
+                # Move car
+                prev_x = car_x[i]
+                prev_y = car_y[i]
+                angle_rad = car_angle[i] * DEG2RAD
+                car_x[i] += car_speed[i] * math.sin(angle_rad) * h
+                car_y[i] -= car_speed[i] * math.cos(angle_rad) * h
+
+                # Keep car on screen with soft boundaries
+                car_x[i] = min(max(car_x[i], margin), width - margin)
+                car_y[i] = min(max(car_y[i], margin), height - margin)
+
+                gate = current_gate[i]
+                if swept:
+                    passed = _swept_crossing(i, prev_x, prev_y, car_x, car_y, current_gate, t,
+                                             gate_center, gate_tangent, gate_normal, gate_half_width,
+                                             gate_directed, gate_tolerance, n_gates,
+                                             wrong_way, wrong_way_crossings)
+                else:
+                    passed = (gate < n_gates
+                              and abs((car_x[i] - gate_center[t, gate, 0]) * gate_normal[t, gate, 0]
+                                      + (car_y[i] - gate_center[t, gate, 1]) * gate_normal[t, gate, 1]) < gate_tolerance
+                              and (car_x[i] - gate_left[t, gate, 0]) * gate_tangent[t, gate, 0]
+                                  + (car_y[i] - gate_left[t, gate, 1]) * gate_tangent[t, gate, 1] >= 0
+                              and (car_x[i] - gate_right[t, gate, 0]) * gate_tangent[t, gate, 0]
+                                  + (car_y[i] - gate_right[t, gate, 1]) * gate_tangent[t, gate, 1] <= 0)
+                if passed and gate < n_gates:
+                    current_gate[i] += 1
+                    gates_passed[i] += 1
+                    gates_crossed += 1
+
+            reward = 100.0 * gates_crossed if gates_crossed > 0 else -0.1 * dt
+            episode_reward[i] += reward
+            total_reward += reward
+
+            # Episode ends if all gates passed or time limit
+            done = gates_passed[i] >= n_gates or steps_taken[i] >= max_steps
+
+        ticks[i] = n_ticks
+        rew_out[i] = total_reward
+        done_out[i] = done
+        _observe_car(i, car_x, car_y, car_angle, car_speed, current_gate, gates_passed,
+                     track_index, total_gates, gate_center, max_speed, obs_out)
+
+def _observe_cars(indices, car_x, car_y, car_angle, car_speed, current_gate, gates_passed,
+                  track_index, total_gates, gate_center, max_speed, obs_out):
+    """Write the observations of the given cars into obs_out"""
+    for i in indices:
+        _observe_car(i, car_x, car_y, car_angle, car_speed, current_gate, gates_passed,
+                     track_index, total_gates, gate_center, max_speed, obs_out)
+
+if HAVE_NUMBA:
+    _jit = numba.njit(cache=True, nogil=True)
+    _observe_car = _jit(_observe_car)
+    _slab = _jit(_slab)
+    _swept_crossing = _jit(_swept_crossing)
+    step_cars = _jit(_step_cars)
+    observe_cars = _jit(_observe_cars)
+else:
+    step_cars = None
+    observe_cars = None
@@ -0,0 +1,137 @@
+import argparse
+import os
+import time
+import numpy as np
+
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0),
+}
+
+class NumpyPolicy:
+    """The action network of an SB3 MlpPolicy (discrete actions), run with NumPy.
+
+    layers is a list of (weight, bias) float32 pairs in torch's Linear
+    layout, (out, in) weights; the activation follows every layer but the
+    last, whose outputs are the action logits. Computed in float32 like the
+    torch policy, so deterministic predict() picks the same actions. Needs
+    neither torch nor stable_baselines3: a .npz written by export_policy()
+    loads in milliseconds.
+    """
+
+    def __init__(self, layers, activation="tanh", seed=None):
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unknown activation: {activation}")
+        self.layers = [(np.asarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32)) for w, b in layers]
+        self.activation = activation
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            n_layers = int(data["n_layers"])
+            layers = [(data[f"weight_{i}"], data[f"bias_{i}"]) for i in range(n_layers)]
+            return cls(layers, str(data["activation"]))
+
+    def save(self, path):
+        arrays = {"n_layers": len(self.layers), "activation": self.activation}
+        for i, (weight, bias) in enumerate(self.layers):
+            arrays[f"weight_{i}"] = weight
+            arrays[f"bias_{i}"] = bias
+        np.savez(path, **arrays)
+
+    def logits(self, obs):
+        """(N, actions) action logits for (N, obs size) observations"""
+        x = np.asarray(obs, dtype=np.float32)
+        activation = ACTIVATIONS[self.activation]
+        last = len(self.layers) - 1
+        for i, (weight, bias) in enumerate(self.layers):
+            x = x @ weight.T + bias
+            if i < last:
+                x = activation(x)
+        return x
+
+    def predict(self, obs, state=None, episode_start=None, deterministic=True):
+        """SB3-style predict: (actions, None) for one observation or a batch"""
+        obs = np.asarray(obs, dtype=np.float32)
+        single = obs.ndim == 1
+        logits = self.logits(obs[None] if single else obs)
+        if deterministic:
+            actions = logits.argmax(axis=1)
+        else:
+            # Sample from the softmax (Gumbel-max trick)
+            actions = (logits - np.log(-np.log(self.rng.random(logits.shape)))).argmax(axis=1)
+        return (actions[0] if single else actions), None
+
+    def set_random_seed(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+def export_policy(model, path=None):
+    """NumpyPolicy holding an SB3 PPO model's (or .zip path's) action network,
+    also saved to path (.npz) when given"""
+    if isinstance(model, str):
+        from stable_baselines3 import PPO
+        model = PPO.load(model, device="cpu")
+    policy = model.policy
+    linears = [module for module in policy.mlp_extractor.policy_net if hasattr(module, "weight")]
+    linears.append(policy.action_net)
+    layers = [(layer.weight.detach().cpu().numpy(), layer.bias.detach().cpu().numpy()) for layer in linears]
+    numpy_policy = NumpyPolicy(layers, policy.activation_fn.__name__.lower())
+    if path is not None:
+        numpy_policy.save(path)
+    return numpy_policy
+
+def load_policy(name="checkpoint_racing_model"):
+    """The NumpyPolicy in name.npz if it exists, otherwise the SB3 model name.zip
+    (name may also be an .npz path)"""
+    if name.endswith(".npz"):
+        return NumpyPolicy.load(name)
+    if os.path.exists(name + ".npz"):
+        return NumpyPolicy.load(name + ".npz")
+    from stable_baselines3 import PPO
+    return PPO.load(name, device="cpu")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export an SB3 PPO model for torch-free NumPy inference")
+    parser.add_argument("--model", default="checkpoint_racing_model", help="SB3 model (.zip)")
+    parser.add_argument("--out", help="Exported .npz (default: next to the model)")
+    parser.add_argument("--verify", type=int, default=100000,
+                        help="Compare actions with SB3 on this many observations (0 = skip)")
+    return parser.parse_args()
+
+def main():
+    from stable_baselines3 import PPO
+
+    args = parse_args()
+    model = PPO.load(args.model, device="cpu")
+    out = args.out or os.path.splitext(args.model)[0] + ".npz"
+    policy = export_policy(model, out)
+    print(f"Exported {len(policy.layers)} layers ({policy.activation}) to {out} ({os.path.getsize(out)} bytes)")
+
+    if args.verify:
+        # Random observations plus (for the plain 5-value observation) ones
+        # actually met on the default course
+        rng = np.random.default_rng(0)
+        low, high = model.observation_space.low, model.observation_space.high
+        observations = [rng.uniform(low, high, (args.verify, len(low))).astype(np.float32)]
+        if len(low) == 5:
+            from vec_env import CheckpointRacingVecEnv
+            env = CheckpointRacingVecEnv(n_envs=256)
+            obs = env.reset()
+            for _ in range(max(args.verify // 256, 1)):
+                observations.append(obs)
+                obs, _, _, _ = env.step(policy.predict(obs)[0])
+        observations = np.concatenate(observations)
+
+        expected, _ = model.predict(observations, deterministic=True)
+        started = time.perf_counter()
+        actions, _ = policy.predict(observations)
+        elapsed = time.perf_counter() - started
+        mismatches = int((actions != expected).sum())
+        print(f"{len(observations)} observations: {mismatches} action mismatches, "
+              f"NumPy predict {len(observations) / elapsed:,.0f} obs/sec")
+        if mismatches:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import time
+import numpy as np
+from stable_baselines3 import PPO
+from sensors import RaySensor
+from tracks import load_track
+from vec_env import CheckpointRacingVecEnv
+
+def race(models, n_races=64, race_size=8, deterministic=True, seed=0, **game_kwargs):
+    """Race several policies against each other and summarize per policy.
+
+    Every race has race_size cars on the same track; car k of a race is
+    driven by models[k % len(models)], so each policy gets the same share of
+    grid positions. Each car runs one episode. All cars are stepped by one
+    batched engine with car-car collisions, and each policy predicts for all
+    of its cars at once. A car's place is its finishing order in its race
+    (finished cars by time, then the rest by gates passed).
+    """
+    n_cars = n_races * race_size
+    env = CheckpointRacingVecEnv(n_envs=n_cars, race_size=race_size, **game_kwargs)
+    env.seed(seed)
+    driver = np.arange(n_cars) % race_size % len(models)
+
+    gates_passed = np.zeros(n_cars, dtype=np.int64)
+    steps_taken = np.zeros(n_cars, dtype=np.int64)
+    collisions = np.zeros(n_cars, dtype=np.int64)
+    running = np.ones(n_cars, dtype=bool)
+    actions = np.zeros(n_cars, dtype=np.int64)
+
+    started = time.perf_counter()
+    obs = env.reset()
+    while running.any():
+        for index, model in enumerate(models):
+            cars = np.flatnonzero(driver == index)
+            actions[cars], _ = model.predict(obs[cars], deterministic=deterministic)
+        actions[~running] = 0  # Finished cars wait at the start, out of the race, until everyone is done
+        obs, _, dones, infos = env.step(actions)
+        for i in np.flatnonzero(dones & running):
+            running[i] = False
+            gates_passed[i] = infos[i]["gates_passed"]
+            steps_taken[i] = infos[i]["steps_taken"]
+            collisions[i] = infos[i]["collisions"]
+    elapsed = time.perf_counter() - started
+    env.close()
+
+    # Places within each race: more gates first, then fewer steps
+    total_gates = env.game.total_gates
+    finished = gates_passed >= total_gates
+    order = np.lexsort((steps_taken, -gates_passed, np.arange(n_cars) // race_size))
+    place = np.empty(n_cars, dtype=np.int64)
+    place[order] = np.arange(n_cars) % race_size + 1
+
+    results = []
+    for index in range(len(models)):
+        cars = driver == index
+        results.append({
+            "policy": index,
+            "cars": int(cars.sum()),
+            "mean_place": float(place[cars].mean()),
+            "wins": int((place[cars] == 1).sum()),
+            "success_rate": float(finished[cars].mean()),
+            "mean_gates_passed": float(gates_passed[cars].mean()),
+            "mean_steps_to_finish": float(steps_taken[cars & finished].mean()) if (cars & finished).any() else None,
+            "mean_collisions": float(collisions[cars].mean()),
+        })
+    return {"races": n_races, "race_size": race_size, "seconds": elapsed, "policies": results}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Race trained models against each other on one track")
+    parser.add_argument("models", nargs="*", default=["checkpoint_racing_model"],
+                        help="Models to race (one model races against itself)")
+    parser.add_argument("--races", type=int, default=64)
+    parser.add_argument("--race-size", type=int, default=8, help="Cars per race")
+    parser.add_argument("--stochastic", action="store_true",
+                        help="Sample actions instead of taking the most likely one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--track", help="Track file (.json or .npz) instead of the default course")
+    parser.add_argument("--rays", type=int, default=0, help="Ray readings the models were trained with")
+    parser.add_argument("--ray-fov", type=float, default=180.0)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    game_kwargs = {}
+    if args.track:
+        game_kwargs["track"] = load_track(args.track)
+    if args.rays:
+        game_kwargs["sensor"] = RaySensor(args.rays, fov=args.ray_fov)
+
+    models = [PPO.load(path, device="cpu") for path in args.models]
+    report = race(models, n_races=args.races, race_size=args.race_size,
+                  deterministic=not args.stochastic, seed=args.seed, **game_kwargs)
+
+    print(f"{report['races']} races of {report['race_size']} cars in {report['seconds']:.1f}s")
+    for path, result in zip(args.models, report["policies"]):
+        finish = result["mean_steps_to_finish"]
+        print(f"{path}: place {result['mean_place']:.2f}, wins {result['wins']}, "
+              f"success {result['success_rate']:.1%}, gates {result['mean_gates_passed']:.2f}, "
+              f"finish {'-' if finish is None else f'{finish:.0f} steps'}, "
+              f"collisions {result['mean_collisions']:.1f}")
+
+if __name__ == "__main__":
+    main()
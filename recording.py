@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+import numpy as np
+from game import CheckpointGatesGame
+
+class BatchedFrameRenderer:
+    """Draw cars of a BatchedCheckpointGatesGame offscreen, one at a time.
+
+    An rgb_array CheckpointGatesGame per track is used as the canvas: the
+    chosen car's pose and progress are copied into it before rendering, so its
+    cached background and dirty-rect drawing are shared by every car on that
+    track.
+    """
+
+    def __init__(self, engine, max_canvases=16):
+        self.engine = engine
+        self.max_canvases = max_canvases
+        self.canvases = {}
+
+    def render(self, index):
+        """(height, width, 3) frame of car `index`, valid until the next call"""
+        engine = self.engine
+        track = engine.car_track(index)
+        canvas = self.canvases.get(id(track))
+        if canvas is None or canvas.track is not track:
+            if len(self.canvases) >= self.max_canvases:
+                self.canvases.clear()
+            canvas = self.canvases[id(track)] = CheckpointGatesGame(render_mode="rgb_array", track=track)
+        canvas.car_x = engine.car_x[index]
+        canvas.car_y = engine.car_y[index]
+        canvas.car_angle = engine.car_angle[index]
+        canvas.car_speed = engine.car_speed[index]
+        canvas.current_gate = int(engine.current_gate[index])
+        canvas.gates_passed = int(engine.gates_passed[index])
+        canvas.episode_reward = engine.episode_reward[index]
+        return canvas.render()
+
+class EpisodeRecorder:
+    """Stream frames of many parallel episodes to disk from background threads.
+
+    Frames are grouped per environment into chunks of chunk_frames and handed
+    to writer threads (an environment always goes to the same writer, so its
+    chunks stay in order). Each episode becomes one .npz whose frames are
+    stored as frames_0000.npy, frames_0001.npy, ... members (see
+    load_episode), or with video=True an .mp4 through the optional imageio
+    package plus a .json with the metadata. Memory stays bounded by the chunk
+    size and the bounded queues, whatever the episode length.
+    """
+
+    def __init__(self, directory, video=False, fps=30, chunk_frames=16, writers=2,
+                 max_pending=8, compresslevel=1):
+        if video:
+            import imageio  # Optional dependency, only needed for video output
+            self.imageio = imageio
+        self.directory = directory
+        self.video = video
+        self.fps = fps
+        self.chunk_frames = chunk_frames
+        self.compresslevel = compresslevel
+        os.makedirs(directory, exist_ok=True)
+
+        self.frames = {}
+        self.episode_ids = {}
+        self.episodes_started = 0
+        self.episodes_written = 0
+        self.error = None
+        self.queues = [queue.Queue(maxsize=max_pending) for _ in range(writers)]
+        self.threads = [threading.Thread(target=self._writer, args=(q,), daemon=True) for q in self.queues]
+        for thread in self.threads:
+            thread.start()
+
+    def add_frame(self, env_index, frame):
+        """Append a frame to the running episode of env_index (copied)"""
+        frame = np.asarray(frame)
+        base = frame.base
+        if (base is not None and base.ndim == 3 and base.shape[2] == 4
+                and base.shape[:2] == frame.shape[:2] and base.flags.c_contiguous):
+            # rgb_array frames are RGB views of an RGBX buffer: copying the
+            # whole buffer is a memcpy, the writer drops the 4th channel
+            frame = base.copy()
+        else:
+            frame = np.array(frame)
+
+        if env_index not in self.episode_ids:
+            self.episode_ids[env_index] = self.episodes_started
+            self.episodes_started += 1
+        chunk = self.frames.setdefault(env_index, [])
+        chunk.append(frame)
+        if len(chunk) >= self.chunk_frames:
+            self._submit(env_index, ("chunk", self.episode_ids[env_index], self.frames.pop(env_index)))
+
+    def end_episode(self, env_index, **metadata):
+        """Flush env_index's remaining frames and close its episode file"""
+        if env_index not in self.episode_ids:
+            return
+        episode = self.episode_ids.pop(env_index)
+        chunk = self.frames.pop(env_index, None)
+        if chunk:
+            self._submit(env_index, ("chunk", episode, chunk))
+        self._submit(env_index, ("end", episode, dict(metadata, env_index=int(env_index))))
+
+    def _submit(self, env_index, item):
+        if self.error is not None:
+            raise self.error
+        self.queues[env_index % len(self.queues)].put(item)
+
+    def _writer(self, items):
+        open_episodes = {}
+        while True:
+            item = items.get()
+            if item is None:
+                break
+            kind, episode, payload = item
+            try:
+                if kind == "chunk":
+                    frames = np.stack(payload)[:, :, :, :3]
+                    if episode not in open_episodes:
+                        open_episodes[episode] = self._open_episode(episode)
+                    self._write_chunk(open_episodes[episode], frames)
+                else:
+                    output = open_episodes.pop(episode, None)
+                    if output is not None:
+                        self._close_episode(output, payload)
+                        self.episodes_written += 1
+            except Exception as e:
+                self.error = e
+
+    def _open_episode(self, episode):
+        path = os.path.join(self.directory, f"episode_{episode:06d}")
+        if self.video:
+            writer = self.imageio.get_writer(path + ".mp4", fps=self.fps)
+        else:
+            writer = zipfile.ZipFile(path + ".npz", "w", zipfile.ZIP_DEFLATED, compresslevel=self.compresslevel)
+        return {"path": path, "writer": writer, "chunks": 0, "n_frames": 0}
+
+    def _write_chunk(self, output, frames):
+        if self.video:
+            for frame in frames:
+                output["writer"].append_data(frame)
+        else:
+            name = f"frames_{output['chunks']:04d}.npy"
+            with output["writer"].open(name, "w", force_zip64=True) as f:
+                np.lib.format.write_array(f, np.ascontiguousarray(frames))
+        output["chunks"] += 1
+        output["n_frames"] += len(frames)
+
+    def _close_episode(self, output, metadata):
+        metadata = dict(metadata, n_frames=output["n_frames"])
+        if self.video:
+            output["writer"].close()
+            with open(output["path"] + ".json", "w") as f:
+                json.dump(metadata, f)
+        else:
+            for key, value in metadata.items():
+                with output["writer"].open(key + ".npy", "w") as f:
+                    np.lib.format.write_array(f, np.asarray(value))
+            output["writer"].close()
+
+    def close(self):
+        """Flush every queued chunk and stop the writer threads"""
+        for items in self.queues:
+            items.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+def load_episode(path):
+    """Load a recorded .npz episode as (frames, metadata dict)"""
+    with np.load(path) as data:
+        chunks = sorted(name for name in data.files if name.startswith("frames_"))
+        frames = np.concatenate([data[name] for name in chunks])
+        metadata = {name: data[name].item() for name in data.files if not name.startswith("frames_")}
+    return frames, metadata
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Record evaluation episodes of the trained AI offscreen")
+    parser.add_argument("--model", default="checkpoint_racing_model")
+    parser.add_argument("--episodes", type=int, default=100)
+    parser.add_argument("--envs", type=int, default=16, help="Episodes run in parallel")
+    parser.add_argument("--out", default="recordings")
+    parser.add_argument("--video", action="store_true", help="Write .mp4 (needs imageio) instead of .npz")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--writers", type=int, default=2, help="Background writer threads")
+    return parser.parse_args()
+
+def main():
+    from stable_baselines3 import PPO
+    from vec_env import CheckpointRacingVecEnv
+
+    args = parse_args()
+    model = PPO.load(args.model, device="cpu")
+    env = CheckpointRacingVecEnv(n_envs=args.envs)
+    renderer = BatchedFrameRenderer(env.game)
+    recorder = EpisodeRecorder(args.out, video=args.video, fps=args.fps, writers=args.writers)
+
+    started = time.perf_counter()
+    obs = env.reset()
+    finished = 0
+    frames = 0
+    # Only record as many episodes as requested, even with many envs
+    recording = np.arange(args.envs) < args.episodes
+    scheduled = int(recording.sum())
+    while finished < args.episodes:
+        for i in np.flatnonzero(recording):
+            recorder.add_frame(i, renderer.render(i))
+            frames += 1
+
+        actions, _ = model.predict(obs, deterministic=True)
+        obs, rewards, dones, infos = env.step(actions)
+
+        for i in np.flatnonzero(dones & recording):
+            recorder.end_episode(i, gates_passed=infos[i]["gates_passed"])
+            finished += 1
+            if scheduled < args.episodes:
+                scheduled += 1
+            else:
+                recording[i] = False
+
+    recorder.close()
+    elapsed = time.perf_counter() - started
+    print(f"Recorded {finished} episodes ({frames} frames) to {args.out} "
+          f"in {elapsed:.1f}s ({frames / elapsed:.0f} frames/sec)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import importlib
+import json
+import numpy as np
+from tracks import Track
+
+# Objects an environment can be built with, saved as their constructor
+# arguments (each kept as an attribute of the same name)
+COMPONENTS = {
+    "RaySensor": ("sensors", ("n_rays", "fov", "max_range", "post_radius", "cell_size", "grid_min_gates")),
+    "SpatialHashCollider": ("collisions", ("radius", "restitution", "iterations")),
+    "CurriculumScheduler": ("curriculum", ("levels", "tracks_per_level", "window", "promote_at", "demote_at",
+                                           "spread", "seed", "pool")),
+    "TrackPool": ("curriculum", ("capacity", "width", "height", "n_gates")),
+}
+
+def encode_setting(value):
+    """A JSON-able form of an environment keyword argument"""
+    if isinstance(value, Track):
+        return {"track": value.to_dict()}
+    name = type(value).__name__
+    if name in COMPONENTS:
+        return {"class": name, "kwargs": {key: encode_setting(getattr(value, key)) for key in COMPONENTS[name][1]}}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError(f"Cannot save an environment setting of type {name}")
+
+def decode_setting(value):
+    if isinstance(value, dict):
+        if "track" in value:
+            return Track.from_dict(value["track"])
+        module, _ = COMPONENTS[value["class"]]
+        kwargs = {key: decode_setting(item) for key, item in value["kwargs"].items()}
+        return getattr(importlib.import_module(module), value["class"])(**kwargs)
+    return value
+
+class ActionLog:
+    """Everything needed to re-run episodes exactly: the seed, the actions
+    and the settings of the environment they were taken in.
+
+    actions is (steps,) for a CheckpointRacingEnv or (steps, n_envs) for a
+    CheckpointRacingVecEnv. env_kwargs are the rest of the keyword arguments
+    the environment was built with (crossing, dt, substeps, max_steps,
+    kernel, sensor, ...); for_env() takes them from a live environment. The
+    game itself has no randomness, so the seed only matters to seeded
+    components (e.g. a curriculum), but it is kept so a replay starts from
+    the same point in every case.
+    """
+
+    def __init__(self, seed=0, actions=(), track=None, frame_skip=1, **env_kwargs):
+        self.seed = seed
+        self.actions = list(actions)
+        self.track = track
+        self.frame_skip = frame_skip
+        self.env_kwargs = env_kwargs
+
+    @classmethod
+    def for_env(cls, env, seed=0):
+        """An empty log with the settings `env` was built with"""
+        kwargs = dict(env.env_kwargs, max_steps=env.max_steps)
+        return cls(seed, (), **kwargs)
+
+    def append(self, action):
+        self.actions.append(np.array(action, dtype=np.int8))
+
+    def make_env(self, render_mode=None):
+        """A fresh environment matching the log, reset with its seed"""
+        actions = np.asarray(self.actions)
+        kwargs = dict(self.env_kwargs, track=self.track, frame_skip=self.frame_skip)
+        if actions.ndim == 2:
+            from vec_env import CheckpointRacingVecEnv
+            env = CheckpointRacingVecEnv(n_envs=actions.shape[1], **kwargs)
+            env.seed(self.seed)
+            return env, env.reset()
+        from ai_env import CheckpointRacingEnv
+        max_steps = kwargs.pop("max_steps", None)
+        env = CheckpointRacingEnv(render_mode=render_mode, **kwargs)
+        if max_steps is not None:
+            env.max_steps = max_steps
+        return env, env.reset(seed=self.seed)[0]
+
+    def save(self, path):
+        track = self.track.to_dict() if self.track is not None else {}
+        settings = {key: encode_setting(value) for key, value in self.env_kwargs.items()}
+        np.savez(path, seed=self.seed, actions=np.asarray(self.actions, dtype=np.int8),
+                 frame_skip=self.frame_skip, track=np.array(json.dumps(track)),
+                 settings=np.array(json.dumps(settings)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            track = json.loads(str(data["track"]))
+            # Logs written before settings were saved only have track and frame_skip
+            settings = json.loads(str(data["settings"])) if "settings" in data else {}
+            return cls(int(data["seed"]), data["actions"], Track.from_dict(track) if track else None,
+                       int(data["frame_skip"]), **{key: decode_setting(value) for key, value in settings.items()})
+
+def replay(log, snapshot_every=0):
+    """Re-run an ActionLog.
+
+    Returns (env, observations, snapshots): the environment in its final
+    state, the (steps + 1, ...) observations seen along the way and, every
+    snapshot_every steps, (step, get_state_snapshot()) pairs to branch from
+    or restore() for closer inspection.
+    """
+    env, obs = log.make_env()
+    observations = [obs]
+    snapshots = []
+    for step, action in enumerate(log.actions):
+        if snapshot_every and step % snapshot_every == 0:
+            snapshots.append((step, env.get_state_snapshot()))
+        result = env.step(action)
+        observations.append(result[0])
+    return env, np.array(observations), snapshots
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay an action log and show where the episode ended")
+    parser.add_argument("log", help="ActionLog .npz file")
+    parser.add_argument("--render", action="store_true", help="Watch a single-environment replay")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    log = ActionLog.load(args.log)
+    if args.render:
+        if np.asarray(log.actions).ndim != 1:
+            raise SystemExit("--render needs a single-environment log")
+        env, _ = log.make_env(render_mode="human")
+        for action in log.actions:
+            env.step(action)
+            env.render()
+        game = env.game
+    else:
+        env, _, _ = replay(log)
+        game = env.game
+    print(f"Replayed {len(log.actions)} steps (seed {log.seed})")
+    print(game.get_state_snapshot())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import numpy as np
+
+class SensorGeometry:
+    """Obstacle arrays of one track for ray casting, with a uniform grid.
+
+    Segments are the gate lines plus the four screen edges; posts are
+    circles of post_radius around every gate post, as drawn. Each cell of
+    the grid stores the segments and posts whose bounding boxes overlap it,
+    as flat (members, start) lists; one extra, empty cell stands for
+    everything off the screen. A ray only looks at the cells it crosses
+    within its range (walked cell by cell, as in Amanatides & Woo's DDA), so
+    its candidates are bounded by the range over the cell size and the local
+    gate density, not by the track length. cell_size=None makes one cell
+    of the whole screen: every ray tests everything, which is cheaper for
+    tracks with few gates.
+    """
+
+    def __init__(self, track, cell_size, post_radius=10):
+        w, h = track.width, track.height
+        walls_a = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float64)
+        walls_b = np.roll(walls_a, -1, axis=0)
+        self.seg_a = np.vstack([track.gate_left, walls_a])
+        self.seg_b = np.vstack([track.gate_right, walls_b])
+        self.posts = np.vstack([track.gate_left, track.gate_right])
+        self.post_radius = post_radius
+
+        self.cell_size = cell_size = cell_size or max(w, h)
+        self.nx = max(int(np.ceil(w / cell_size)), 1)
+        self.ny = max(int(np.ceil(h / cell_size)), 1)
+        low = np.minimum(self.seg_a, self.seg_b)
+        high = np.maximum(self.seg_a, self.seg_b)
+        self.cell_segments = self._bin(low, high)
+        self.cell_posts = self._bin(self.posts - post_radius, self.posts + post_radius)
+
+    def _bin(self, low, high):
+        """(members, start): the boxes low..high overlapping cell c are
+        members[start[c]:start[c + 1]]; the last cell is empty"""
+        cells = [[] for _ in range(self.nx * self.ny)]
+        # A hair of slack so hits exactly on a cell border are in both cells
+        slack = 1e-6 * self.cell_size
+        first = np.clip(((low - slack) // self.cell_size).astype(int), 0, [self.nx - 1, self.ny - 1])
+        last = np.clip(((high + slack) // self.cell_size).astype(int), 0, [self.nx - 1, self.ny - 1])
+        for index, ((x0, y0), (x1, y1)) in enumerate(zip(first, last)):
+            for cy in range(y0, y1 + 1):
+                for cx in range(x0, x1 + 1):
+                    cells[cy * self.nx + cx].append(index)
+        cells.append([])
+        start = np.zeros(len(cells) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in cells], out=start[1:])
+        members = np.array([index for c in cells for index in c], dtype=np.int64)
+        return members, start
+
+    def ray_cells(self, x, y, dir_x, dir_y, max_range):
+        """(N, K, steps) cells crossed by the rays from x, y (N,) along
+        dir_x, dir_y (N, K) up to max_range, in order; cells past the range
+        or off the screen are the empty last cell"""
+        if self.nx * self.ny == 1:
+            return np.zeros(dir_x.shape + (1,), dtype=np.int64)
+        size = self.cell_size
+        cell_x = np.clip((x // size).astype(int), 0, self.nx - 1)[:, None] + np.zeros(dir_x.shape, dtype=int)
+        cell_y = np.clip((y // size).astype(int), 0, self.ny - 1)[:, None] + np.zeros(dir_y.shape, dtype=int)
+        step_x = np.where(dir_x > 0, 1, -1)
+        step_y = np.where(dir_y > 0, 1, -1)
+        # Ray length to the next vertical / horizontal cell border, and between borders
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta_x = np.where(dir_x != 0, size / np.abs(dir_x), np.inf)
+            delta_y = np.where(dir_y != 0, size / np.abs(dir_y), np.inf)
+            border_x = np.where(dir_x > 0, (cell_x + 1) * size - x[:, None], x[:, None] - cell_x * size)
+            border_y = np.where(dir_y > 0, (cell_y + 1) * size - y[:, None], y[:, None] - cell_y * size)
+            next_x = np.where(dir_x != 0, np.maximum(border_x, 0) / np.abs(dir_x), np.inf)
+            next_y = np.where(dir_y != 0, np.maximum(border_y, 0) / np.abs(dir_y), np.inf)
+
+        # A ray of length r crosses at most r * (|dx| + |dy|) / size <= r * sqrt(2) / size
+        # borders, plus one each way for where it starts in its cell
+        steps = int(np.ceil(max_range * np.sqrt(2) / size)) + 3
+        cells = np.empty(dir_x.shape + (steps,), dtype=np.int64)
+        entered = np.zeros(dir_x.shape)
+        outside = self.nx * self.ny
+        for step in range(steps):
+            inside = ((cell_x >= 0) & (cell_x < self.nx) & (cell_y >= 0) & (cell_y < self.ny)
+                      & (entered <= max_range))
+            cells[..., step] = np.where(inside, cell_y * self.nx + cell_x, outside)
+            if not inside.any():
+                cells[..., step:] = outside
+                break
+            across_x = next_x <= next_y
+            across_y = ~across_x
+            np.minimum(next_x, next_y, out=entered)
+            np.add(cell_x, step_x, out=cell_x, where=across_x)
+            np.add(cell_y, step_y, out=cell_y, where=across_y)
+            np.add(next_x, delta_x, out=next_x, where=across_x)
+            np.add(next_y, delta_y, out=next_y, where=across_y)
+        return cells
+
+    def candidates(self, table, cells):
+        """(ray, index, per_ray) of the (ray, obstacle) pairs to test, for
+        ray_cells() cells: the flat ray number (car * K + ray), the obstacle
+        in a _bin table, and the number of pairs of each ray. Pairs come
+        grouped by ray, in ray order; an obstacle in several crossed cells
+        is listed once per cell."""
+        members, start = table
+        n_rays, steps = cells.shape[0] * cells.shape[1], cells.shape[2]
+        cells = cells.reshape(-1)
+        counts = start[cells + 1] - start[cells]
+        # Most crossed cells are empty: expand only the others
+        used = np.flatnonzero(counts)
+        cells, counts = cells[used], counts[used]
+        ray = np.repeat(used // steps, counts)
+        # Position of each pair within its cell's member list
+        offset = np.arange(len(ray)) - np.repeat(np.cumsum(counts) - counts, counts)
+        per_ray = np.bincount(ray, minlength=n_rays)
+        return ray, members[np.repeat(start[cells], counts) + offset], per_ray
+
+def segment_distance(px, py, ex, ey, dir_x, dir_y):
+    """Distance along rays (direction dir) to segments a..a + e, with p = a -
+    the ray origin; inf where a ray misses. Arguments broadcast together."""
+    # origin + t*dir = a + s*e, t >= 0, 0 <= s <= 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = dir_x * ey - dir_y * ex
+        t = (px * ey - py * ex) / denom
+        s = (px * dir_y - py * dir_x) / denom
+    hit = (denom != 0) & (t >= 0) & (s >= 0) & (s <= 1)
+    return np.where(hit, t, np.inf)
+
+def post_distance(ox, oy, dir_x, dir_y, radius):
+    """Distance along rays to circles of the given radius, with o = the ray
+    origin - the center; 0 inside a circle, inf where a ray misses"""
+    b = ox * dir_x + oy * dir_y
+    c = ox * ox + oy * oy - radius ** 2
+    disc = b * b - c
+    with np.errstate(invalid="ignore"):
+        t = -b - np.sqrt(disc)
+    t = np.where(c <= 0, 0.0, t)  # Inside a post
+    hit = (disc >= 0) & (t >= 0)
+    return np.where(hit, t, np.inf)
+
+def nearest(distance, t, per_ray):
+    """Lower each ray's distance to the smallest of its pairs' t (grouped
+    by ray, per_ray of them each)"""
+    has_pairs = per_ray > 0
+    if not has_pairs.any():
+        return
+    first = (np.cumsum(per_ray) - per_ray)[has_pairs]
+    distance[has_pairs] = np.minimum(distance[has_pairs], np.minimum.reduceat(t, first))
+
+class RaySensor:
+    """Lidar-style distances from each car, for any number of cars at once.
+
+    n_rays rays are spread over fov degrees around the car's heading (evenly
+    round the car for fov=360). A ray stops at the nearest gate post, gate
+    line or screen edge; its observation is that distance / max_range, 1.0 when
+    nothing is within range. All cars, rays and candidate obstacles are
+    handled in one vectorized pass over (ray, obstacle) pairs. On tracks
+    with at least grid_min_gates gates each ray tests only the obstacles in
+    the cell_size grid cells it crosses; smaller tracks are tested whole.
+    """
+
+    def __init__(self, n_rays=8, fov=180.0, max_range=300.0, post_radius=10, cell_size=50.0,
+                 grid_min_gates=20):
+        self.n_rays = n_rays
+        self.fov = fov
+        self.max_range = max_range
+        self.post_radius = post_radius
+        self.cell_size = cell_size
+        self.grid_min_gates = grid_min_gates
+        if n_rays == 1:
+            offsets = np.zeros(1)
+        else:
+            offsets = np.linspace(-fov / 2, fov / 2, n_rays, endpoint=fov < 360)
+        self.offsets = np.radians(offsets)
+        self.geometry = {}  # id(track) -> (track, SensorGeometry)
+
+    def __getstate__(self):
+        # Geometry is rebuilt on demand (e.g. in worker processes)
+        state = self.__dict__.copy()
+        state["geometry"] = {}
+        return state
+
+    def track_geometry(self, track):
+        entry = self.geometry.get(id(track))
+        if entry is None or entry[0] is not track:
+            if len(self.geometry) > 256:
+                self.geometry.clear()
+            cell_size = self.cell_size if track.total_gates >= self.grid_min_gates else None
+            entry = self.geometry[id(track)] = (track, SensorGeometry(track, cell_size, self.post_radius))
+        return entry[1]
+
+    def observe(self, track, x, y, angle):
+        """(N, n_rays) normalized distances for cars at x, y heading angle (degrees)"""
+        geometry = self.track_geometry(track)
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        heading = np.radians(angle)[:, None] + self.offsets
+        dir_x = np.sin(heading)  # (N, K): same convention as the car's motion
+        dir_y = -np.cos(heading)
+        if geometry.nx * geometry.ny == 1:
+            distance = self._observe_all(geometry, x, y, dir_x, dir_y)
+        else:
+            distance = self._observe_grid(geometry, x, y, dir_x, dir_y)
+        return distance / self.max_range
+
+    def _observe_all(self, geometry, x, y, dir_x, dir_y):
+        """Every ray against every obstacle, broadcast over (N, K, obstacles)"""
+        dir_x = dir_x[:, :, None]
+        dir_y = dir_y[:, :, None]
+        e = geometry.seg_b - geometry.seg_a
+        t = segment_distance(geometry.seg_a[:, 0] - x[:, None, None], geometry.seg_a[:, 1] - y[:, None, None],
+                             e[:, 0], e[:, 1], dir_x, dir_y)
+        distance = np.minimum(self.max_range, t.min(axis=2))
+        t = post_distance(x[:, None, None] - geometry.posts[:, 0], y[:, None, None] - geometry.posts[:, 1],
+                          dir_x, dir_y, geometry.post_radius)
+        return np.minimum(distance, t.min(axis=2))
+
+    def _observe_grid(self, geometry, x, y, dir_x, dir_y):
+        """Each ray against the obstacles in the grid cells it crosses, as
+        flat (ray, obstacle) pairs"""
+        shape = dir_x.shape
+        cells = geometry.ray_cells(x, y, dir_x, dir_y, self.max_range)
+        distance = np.full(dir_x.size, self.max_range)
+        origin_x = np.repeat(x, self.n_rays)
+        origin_y = np.repeat(y, self.n_rays)
+        dir_x = dir_x.reshape(-1)
+        dir_y = dir_y.reshape(-1)
+
+        ray, index, per_ray = geometry.candidates(geometry.cell_segments, cells)
+        a = geometry.seg_a[index]
+        e = geometry.seg_b[index] - a
+        t = segment_distance(a[:, 0] - origin_x[ray], a[:, 1] - origin_y[ray], e[:, 0], e[:, 1],
+                             dir_x[ray], dir_y[ray])
+        nearest(distance, t, per_ray)
+
+        ray, index, per_ray = geometry.candidates(geometry.cell_posts, cells)
+        centers = geometry.posts[index]
+        t = post_distance(origin_x[ray] - centers[:, 0], origin_y[ray] - centers[:, 1],
+                          dir_x[ray], dir_y[ray], geometry.post_radius)
+        nearest(distance, t, per_ray)
+        return distance.reshape(shape)
+
+    def observe_engine(self, engine, indices=None):
+        """(len(indices), n_rays) readings for cars of a BatchedCheckpointGatesGame"""
+        if indices is None:
+            indices = np.arange(engine.n_cars)
+        indices = np.asarray(indices)
+        slots = engine.track_index[indices]
+        readings = np.empty((len(indices), self.n_rays))
+        # One batch per track the cars are driving
+        for slot in np.unique(slots):
+            rows = np.flatnonzero(slots == slot)
+            cars = indices[rows]
+            readings[rows] = self.observe(engine.bank.tracks[slot], engine.car_x[cars],
+                                          engine.car_y[cars], engine.car_angle[cars])
+        return readings
+
+def observation_size(sensor=None):
+    """Length of an observation: the 5 game values plus one per ray"""
+    return 5 + (sensor.n_rays if sensor is not None else 0)
+
+def observation_bounds(sensor=None):
+    """(low, high) arrays for the observation space"""
+    n_rays = sensor.n_rays if sensor is not None else 0
+    return np.array([0, -1, 0, 0, 0] + [0] * n_rays), np.ones(5 + n_rays)
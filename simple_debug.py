@@ -2,7 +2,7 @@ from ai_env import CheckpointRacingEnv
 import time
 
 # Test with random actions first to see if the environment works
-env = CheckpointRacingEnv()
+env = CheckpointRacingEnv(render_mode="human")
 
 print("Testing checkpoint racing environment with random actions...")
 print("This will help us see if the basic system works.")
@@ -0,0 +1,200 @@
+import multiprocessing as mp
+import time
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from sensors import observation_bounds
+
+# One-byte commands sent over the worker pipes (send_bytes, never pickled)
+CMD_RESET = b"r"
+CMD_STEP = b"s"
+CMD_CLOSE = b"c"
+REPLY_DONE = b"d"
+
+def _worker(remote, parent_remote, worker_index, n_envs, obs_size, max_steps, buffers, game_kwargs):
+    """Run one batched engine on its slice of the shared buffers"""
+    # Imported here so forkserver/spawn workers only load numpy + the game
+    from batched_game import BatchedCheckpointGatesGame
+
+    parent_remote.close()
+    obs_buf, terminal_buf, reward_buf, done_buf, truncated_buf, action_buf, stats_buf, episode_buf = buffers
+    start, end = worker_index * n_envs, (worker_index + 1) * n_envs
+
+    # NumPy views onto this worker's slice of shared memory
+    obs = np.frombuffer(obs_buf, dtype=np.float32).reshape(-1, obs_size)[start:end]
+    terminal_obs = np.frombuffer(terminal_buf, dtype=np.float32).reshape(-1, obs_size)[start:end]
+    rewards = np.frombuffer(reward_buf, dtype=np.float32)[start:end]
+    dones = np.frombuffer(done_buf, dtype=np.bool_)[start:end]
+    truncated = np.frombuffer(truncated_buf, dtype=np.bool_)[start:end]
+    actions = np.frombuffer(action_buf, dtype=np.int64)[start:end]
+    stats = np.frombuffer(stats_buf, dtype=np.float64).reshape(-1, 2)[worker_index]
+    episode_stats = np.frombuffer(episode_buf, dtype=np.int64).reshape(-1, 2)[start:end]
+
+    if game_kwargs.get("curriculum") is not None:
+        # Each worker got its own copy of the scheduler; vary its track draws
+        game_kwargs["curriculum"].stream = worker_index
+    game = BatchedCheckpointGatesGame(n_envs, **game_kwargs)
+    current_step = np.zeros(n_envs, dtype=np.int64)
+    game_done = np.zeros(n_envs, dtype=bool)
+
+    try:
+        while True:
+            cmd = remote.recv_bytes()
+            if cmd == CMD_STEP:
+                started = time.perf_counter()
+                # The engine writes straight into shared memory
+                game.step_into(actions, obs, rewards, game_done)
+                current_step += game.ticks
+
+                # Same truncation / auto-reset rules as CheckpointRacingVecEnv
+                np.greater_equal(current_step, max_steps, out=truncated)
+                np.logical_or(game_done, truncated, out=dones)
+                if dones.any():
+                    done_indices = np.flatnonzero(dones)
+                    terminal_obs[done_indices] = obs[done_indices]
+                    episode_stats[done_indices, 0] = game.gates_passed[done_indices]
+                    episode_stats[done_indices, 1] = game.steps_taken[done_indices]
+                    current_step[done_indices] = 0
+                    game.reset_cars(done_indices)
+                    game.observe_into(done_indices, obs)
+
+                stats[0] += n_envs
+                stats[1] += time.perf_counter() - started
+            elif cmd == CMD_RESET:
+                current_step[:] = 0
+                obs[:] = game.reset()
+            elif cmd == CMD_CLOSE:
+                break
+            remote.send_bytes(REPLY_DONE)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.close()
+
+class SharedMemoryVecEnv(VecEnv):
+    """Multi-process VecEnv whose workers exchange data through shared memory.
+
+    Each worker process runs a BatchedCheckpointGatesGame for envs_per_worker
+    cars. Actions, observations, rewards and done flags live in shared arrays;
+    the pipes only carry one-byte commands, so nothing is pickled per step.
+    Extra keyword arguments (crossing, dt, substeps, frame_skip, track,
+    curriculum, sensor) go to every engine.
+    """
+
+    def __init__(self, n_workers=1, envs_per_worker=1, start_method="forkserver", max_steps=3000,
+                 **game_kwargs):
+        self.n_workers = n_workers
+        self.envs_per_worker = envs_per_worker
+        self.max_steps = max_steps
+        self.env_kwargs = game_kwargs  # For replay.ActionLog
+        self.render_mode = None
+        n_envs = n_workers * envs_per_worker
+        low, high = observation_bounds(game_kwargs.get("sensor"))
+        obs_size = len(low)
+
+        ctx = mp.get_context(start_method)
+        self._buffers = (
+            ctx.RawArray("b", n_envs * obs_size * 4),   # observations (float32)
+            ctx.RawArray("b", n_envs * obs_size * 4),   # terminal observations (float32)
+            ctx.RawArray("b", n_envs * 4),              # rewards (float32)
+            ctx.RawArray("b", n_envs),                  # dones (bool)
+            ctx.RawArray("b", n_envs),                  # truncated (bool)
+            ctx.RawArray("b", n_envs * 8),              # actions (int64)
+            ctx.RawArray("b", n_workers * 2 * 8),       # per-worker [steps, busy seconds]
+            ctx.RawArray("b", n_envs * 2 * 8),          # finished episode [gates_passed, steps_taken]
+        )
+        (obs_buf, terminal_buf, reward_buf, done_buf, truncated_buf, action_buf, stats_buf,
+         episode_buf) = self._buffers
+        self._obs = np.frombuffer(obs_buf, dtype=np.float32).reshape(n_envs, obs_size)
+        self._terminal_obs = np.frombuffer(terminal_buf, dtype=np.float32).reshape(n_envs, obs_size)
+        self._rewards = np.frombuffer(reward_buf, dtype=np.float32)
+        self._dones = np.frombuffer(done_buf, dtype=np.bool_)
+        self._truncated = np.frombuffer(truncated_buf, dtype=np.bool_)
+        self._actions = np.frombuffer(action_buf, dtype=np.int64)
+        self._stats = np.frombuffer(stats_buf, dtype=np.float64).reshape(n_workers, 2)
+        self._episode_stats = np.frombuffer(episode_buf, dtype=np.int64).reshape(n_envs, 2)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_workers)])
+        self.processes = []
+        for index, (work_remote, remote) in enumerate(zip(self.work_remotes, self.remotes)):
+            args = (work_remote, remote, index, envs_per_worker, obs_size, max_steps, self._buffers, game_kwargs)
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.closed = False
+        self.waiting = False
+        self.started = time.perf_counter()
+
+        # Same spaces as CheckpointRacingEnv
+        action_space = spaces.Discrete(5)
+        observation_space = spaces.Box(low=low, high=high, dtype=np.float32)
+        super().__init__(n_envs, observation_space, action_space)
+
+    def _send(self, cmd):
+        for remote in self.remotes:
+            remote.send_bytes(cmd)
+
+    def _wait(self):
+        for remote in self.remotes:
+            remote.recv_bytes()
+
+    def reset(self):
+        self._reset_seeds()
+        self._reset_options()
+        self._send(CMD_RESET)
+        self._wait()
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        return self._obs.copy()
+
+    def step_async(self, actions):
+        self._actions[:] = actions
+        self._send(CMD_STEP)
+        self.waiting = True
+
+    def step_wait(self):
+        self._wait()
+        self.waiting = False
+
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(self._dones):
+            infos[i]["terminal_observation"] = self._terminal_obs[i].copy()
+            infos[i]["TimeLimit.truncated"] = bool(self._truncated[i])
+            infos[i]["gates_passed"] = int(self._episode_stats[i, 0])
+            infos[i]["steps_taken"] = int(self._episode_stats[i, 1])
+
+        # Copies: the shared buffers are overwritten by the next step
+        return self._obs.copy(), self._rewards.copy(), self._dones.copy(), infos
+
+    def worker_throughput(self):
+        """Environment steps per second of busy time, one value per worker"""
+        steps, busy = self._stats[:, 0], self._stats[:, 1]
+        return np.divide(steps, busy, out=np.zeros(self.n_workers), where=busy > 0)
+
+    def total_throughput(self):
+        """Environment steps per wall-clock second across all workers"""
+        return self._stats[:, 0].sum() / (time.perf_counter() - self.started)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self._wait()
+        self._send(CMD_CLOSE)
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        method = getattr(self, method_name)
+        return [method(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
@@ -0,0 +1,190 @@
+import argparse
+import csv
+import json
+import math
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+# PPO settings searched by default: ("log", low, high) samples log-uniformly,
+# ("choice", values) uniformly. n_steps counts transitions per update over
+# all environments, as in train_ai.py.
+SEARCH_SPACE = {
+    "learning_rate": ("log", 1e-4, 1e-3),
+    "n_steps": ("choice", [512, 1024, 2048, 4096]),
+    "batch_size": ("choice", [32, 64, 128, 256]),
+    "n_epochs": ("choice", [3, 5, 10, 20]),
+    "gamma": ("choice", [0.95, 0.98, 0.99, 0.995]),
+}
+
+# The hand-picked settings of train_ai.py, always run as trial 0
+DEFAULTS = {"learning_rate": 3e-4, "n_steps": 2048, "batch_size": 64, "n_epochs": 10, "gamma": 0.99}
+
+def sample_configs(n_trials, seed=0, space=SEARCH_SPACE):
+    """The defaults followed by n_trials - 1 random configurations"""
+    rng = np.random.default_rng(seed)
+    configs = [dict(DEFAULTS)]
+    for _ in range(n_trials - 1):
+        config = {}
+        for name, spec in space.items():
+            if spec[0] == "log":
+                config[name] = float(math.exp(rng.uniform(math.log(spec[1]), math.log(spec[2]))))
+            else:
+                config[name] = spec[1][rng.integers(len(spec[1]))]
+        configs.append(config)
+    return configs
+
+class MedianPruner:
+    """Stop a trial whose score at an evaluation is below the median of the
+    other trials' scores at that evaluation.
+
+    Scores live in a multiprocessing Manager dict shared by all trial
+    processes. Nothing is pruned before n_startup trials have reported an
+    evaluation, or during the first n_warmup evaluations of a trial.
+    """
+
+    def __init__(self, history, lock, n_startup=3, n_warmup=1):
+        self.history = history  # Evaluation index -> tuple of scores
+        self.lock = lock
+        self.n_startup = n_startup
+        self.n_warmup = n_warmup
+
+    def report(self, evaluation, score):
+        """Record score and return True if the trial should stop"""
+        with self.lock:
+            others = self.history.get(evaluation, ())
+            self.history[evaluation] = others + (score,)
+        if evaluation < self.n_warmup or len(others) < self.n_startup:
+            return False
+        return score < float(np.median(others))
+
+def limit_threads(cpus):
+    """Cap the OpenMP / BLAS thread pools of processes started from now on.
+
+    The pools read these variables once, when numpy or torch is first
+    imported, and the forkserver preloads this module (numpy included)
+    before forking the trial workers. So they must be in the environment
+    the forkserver is started with: call this before the first pool or
+    manager of the context is created.
+    """
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(cpus)
+
+def _init_worker(cpus):
+    # torch's intra-op pool can still be resized after import
+    import torch
+    torch.set_num_threads(cpus)
+
+def run_trial(trial, config, timesteps, eval_interval, eval_episodes, n_envs, pruner, out_dir, seed):
+    """Train one configuration, evaluating every eval_interval timesteps"""
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import VecMonitor
+    from evaluate import evaluate
+    from vec_env import CheckpointRacingVecEnv
+
+    started = time.perf_counter()
+    env = VecMonitor(CheckpointRacingVecEnv(n_envs=n_envs))
+    model = PPO(
+        "MlpPolicy",
+        env,
+        verbose=0,
+        learning_rate=config["learning_rate"],
+        n_steps=max(config["n_steps"] // n_envs, 1),
+        batch_size=config["batch_size"],
+        n_epochs=config["n_epochs"],
+        gamma=config["gamma"],
+        seed=seed + trial,
+        device="cpu",
+    )
+
+    scores = []
+    result = {}
+    pruned = False
+    while model.num_timesteps < timesteps:
+        model.learn(total_timesteps=eval_interval, reset_num_timesteps=False)
+        result = evaluate(model, n_episodes=eval_episodes, n_envs=min(eval_episodes, 256), seed=seed)
+        scores.append(result["mean_gates_passed"])
+        if pruner.report(len(scores) - 1, scores[-1]) and model.num_timesteps < timesteps:
+            pruned = True
+            break
+    env.close()
+    model.save(os.path.join(out_dir, f"trial_{trial:03d}"))
+
+    return dict(
+        trial=trial,
+        **config,
+        mean_gates_passed=scores[-1],
+        best_mean_gates_passed=max(scores),
+        success_rate=result["success_rate"],
+        timesteps=model.num_timesteps,
+        evaluations=len(scores),
+        pruned=pruned,
+        seconds=round(time.perf_counter() - started, 1),
+    )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run PPO hyperparameter trials in parallel with early stopping")
+    parser.add_argument("--trials", type=int, default=16)
+    parser.add_argument("--cpus-per-trial", type=int, default=1, help="CPU threads each trial may use")
+    parser.add_argument("--processes", type=int, help="Trials run at once (default: CPUs / cpus-per-trial)")
+    parser.add_argument("--timesteps", type=int, default=150000, help="Training budget per trial")
+    parser.add_argument("--eval-interval", type=int, default=25000,
+                        help="Timesteps between headless evaluations")
+    parser.add_argument("--eval-episodes", type=int, default=64)
+    parser.add_argument("--envs", type=int, default=8, help="Environments per trial")
+    parser.add_argument("--startup-trials", type=int, default=3,
+                        help="Trials that must report an evaluation before others are pruned")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="sweep", help="Directory for trial models and results")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    processes = args.processes or max((os.cpu_count() or 1) // args.cpus_per_trial, 1)
+    configs = sample_configs(args.trials, args.seed)
+
+    limit_threads(args.cpus_per_trial)  # Before the forkserver starts
+    ctx = mp.get_context("forkserver")
+    manager = ctx.Manager()
+    pruner = MedianPruner(manager.dict(), manager.Lock(), n_startup=args.startup_trials)
+
+    print(f"Running {len(configs)} trials, {processes} at a time, {args.cpus_per_trial} CPU(s) each")
+    results = []
+    with ProcessPoolExecutor(processes, mp_context=ctx, initializer=_init_worker,
+                             initargs=(args.cpus_per_trial,)) as pool:
+        futures = [
+            pool.submit(run_trial, trial, config, args.timesteps, args.eval_interval,
+                        args.eval_episodes, args.envs, pruner, args.out, args.seed)
+            for trial, config in enumerate(configs)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = "pruned" if result["pruned"] else "done"
+            print(f"Trial {result['trial']:3d} {status:6s} gates {result['mean_gates_passed']:.2f} "
+                  f"after {result['timesteps']} steps ({result['seconds']}s)")
+    manager.shutdown()
+
+    # Results table, best first
+    results.sort(key=lambda r: (-r["best_mean_gates_passed"], r["timesteps"]))
+    with open(os.path.join(args.out, "results.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+    with open(os.path.join(args.out, "results.json"), "w") as f:
+        json.dump(results, f, indent=2)
+
+    columns = ["trial", "learning_rate", "n_steps", "batch_size", "n_epochs", "gamma",
+               "best_mean_gates_passed", "success_rate", "timesteps", "pruned", "seconds"]
+    print(" ".join(f"{name:>12.12s}" for name in columns))
+    for result in results:
+        print(" ".join(f"{result[name]:>12.4g}" if isinstance(result[name], float) else f"{str(result[name]):>12s}"
+                       for name in columns))
+    best = results[0]["trial"]
+    print(f"Best: trial {best}, model {os.path.join(args.out, f'trial_{best:03d}.zip')}")
+
+if __name__ == "__main__":
+    main()
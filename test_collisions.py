@@ -0,0 +1,43 @@
+import numpy as np
+from batched_game import BatchedCheckpointGatesGame
+from collisions import SpatialHashCollider
+
+def test_pairs_match_brute_force():
+    rng = np.random.default_rng(0)
+    collider = SpatialHashCollider()
+    n_cars = 2000
+    x = rng.uniform(0, 800, n_cars)
+    y = rng.uniform(0, 600, n_cars)
+    group = rng.integers(0, 8, n_cars)
+    i, j = collider.pairs(x, y, group)
+    found = {(min(a, b), max(a, b)) for a, b in zip(i.tolist(), j.tolist())}
+    close = ((x[:, None] - x) ** 2 + (y[:, None] - y) ** 2 < collider.cell_size ** 2) & (group[:, None] == group)
+    expected = {(a, b) for a, b in zip(*np.nonzero(np.triu(close, 1)))}
+    assert found == expected
+
+def test_no_cars_or_none_active():
+    collider = SpatialHashCollider()
+    empty = np.zeros(0)
+    assert all(len(p) == 0 for p in collider.pairs(empty, empty, empty.astype(np.int64)))
+    x = np.array([100.0, 105.0])
+    assert not collider.resolve(x, x.copy(), np.ones(2), np.zeros(2, dtype=np.int64),
+                                active=np.zeros(2, dtype=bool)).any()
+
+def test_race_where_every_car_finishes_at_once():
+    for kernel in ("numpy", "auto"):
+        game = BatchedCheckpointGatesGame(n_cars=16, race_size=4, kernel=kernel)
+        obs = np.zeros((16, 5), dtype=np.float32)
+        rewards = np.zeros(16, dtype=np.float32)
+        dones = np.zeros(16, dtype=bool)
+        game.steps_taken[:] = game.max_steps - 1  # Everyone hits the time limit next step
+        game.step_into(np.zeros(16, dtype=np.int64), obs, rewards, dones)
+        assert dones.all(), kernel
+        game.reset()
+        game.steps_taken[:] = game.max_steps - 1
+        assert game.step(np.zeros(16, dtype=np.int64))[2].all(), kernel
+
+if __name__ == "__main__":
+    test_pairs_match_brute_force()
+    test_no_cars_or_none_active()
+    test_race_where_every_car_finishes_at_once()
+    print("collision tests passed")
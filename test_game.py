@@ -1,37 +1,32 @@
+import argparse
 from game import CheckpointGatesGame
+from game_loop import GameLoop, keyboard_controller, policy_controller
 import pygame
 
+parser = argparse.ArgumentParser(description="Play the checkpoint gates game (or watch a trained model)")
+parser.add_argument("--ai", nargs="?", const="checkpoint_racing_model", metavar="MODEL",
+                    help="Let a trained model drive instead of the arrow keys")
+parser.add_argument("--tick-rate", type=float, default=60.0, help="Physics ticks per second")
+parser.add_argument("--fps", type=float, default=60.0, help="Display frames per second")
+parser.add_argument("--max-frame-time", type=float, default=0.25,
+                    help="Most physics time (s) caught up after a slow frame; the rest is dropped")
+args = parser.parse_args()
+
 # Create the checkpoint gates game
 game = CheckpointGatesGame()
 
-# Manual control loop
-running = True
-print("Manual Controls:")
-print("Arrow Keys: Left/Right to steer, Up to accelerate, Down to brake")
+if args.ai:
+    from numpy_policy import load_policy
+    controller = policy_controller(load_policy(args.ai))
+    print(f"AI demo: {args.ai} is driving")
+else:
+    controller = keyboard_controller
+    print("Manual Controls:")
+    print("Arrow Keys: Left/Right to steer, Up to accelerate, Down to brake")
 print("Goal: Drive through the numbered gates in sequence!")
 print("Green gate = current target, White = future, Gray = completed")
 
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-    
-    # Manual controls for testing
-    keys = pygame.key.get_pressed()
-    action = 0  # Default: do nothing
-    
-    if keys[pygame.K_LEFT]:
-        action = 1
-    elif keys[pygame.K_RIGHT]:
-        action = 2
-    elif keys[pygame.K_UP]:
-        action = 3
-    elif keys[pygame.K_DOWN]:
-        action = 4
-    
-    # Step the game
-    state, reward, done = game.step(action)
-    
+def on_step(game, reward, done):
     # Print feedback when gates are passed
     if reward > 50:  # Gate passed (gets 100 reward)
         print(f"Gate {game.gates_passed} passed! Reward: {reward:.1f}")
@@ -43,12 +38,18 @@ while running:
         else:
             print(f"Time limit reached. Gates passed: {game.gates_passed}/{game.total_gates}")
         
-        # Reset for another attempt
+        # The loop resets the game for another attempt
         print("Resetting for another attempt...")
-        game.reset()
-    
-    # Render
-    game.render()
+
+# Physics at a fixed tick rate, drawn (interpolated) at the display rate
+loop = GameLoop(game, controller, tick_rate=args.tick_rate, fps=args.fps,
+                max_frame_time=args.max_frame_time, on_step=on_step)
+stats = loop.run()
 
 pygame.quit()
-print("Game ended!")
\ No newline at end of file
+print("Game ended!")
+print(f"{stats['frames']} frames ({stats['fps']:.1f} fps), {stats['ticks']} ticks, "
+      f"{stats['dropped_frames']} dropped frames, {stats['dropped_ticks']} dropped ticks")
+if stats["input_to_photon_ms"]:
+    print("Input-to-photon latency (ms): " +
+          ", ".join(f"{name} {value:.1f}" for name, value in stats["input_to_photon_ms"].items()))
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import numpy as np
+from collisions import SpatialHashCollider
+from replay import ActionLog, replay
+from sensors import RaySensor
+from tracks import generate_track
+from vec_env import CheckpointRacingVecEnv
+
+def test_replay_keeps_env_settings():
+    env = CheckpointRacingVecEnv(4, crossing="swept", dt=0.5, substeps=3, frame_skip=2, max_steps=200,
+                                 kernel="numpy", sensor=RaySensor(6, 270, max_range=200), track=generate_track(5, 0.7),
+                                 race_size=2, collider=SpatialHashCollider(radius=12, restitution=0.3))
+    env.seed(3)
+    log = ActionLog.for_env(env, seed=3)
+    observations = [env.reset()]
+    rng = np.random.default_rng(1)
+    for _ in range(300):
+        actions = rng.choice(5, 4, p=[0.1, 0.15, 0.15, 0.5, 0.1])
+        log.append(actions)
+        observations.append(env.step(actions)[0])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "log.npz")
+        log.save(path)
+        loaded = ActionLog.load(path)
+    assert loaded.env_kwargs["sensor"].max_range == 200 and loaded.env_kwargs["substeps"] == 3
+    _, replayed, _ = replay(loaded)
+    assert np.array_equal(replayed, np.array(observations))
+
+if __name__ == "__main__":
+    test_replay_keeps_env_settings()
+    print("replay tests passed")
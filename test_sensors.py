@@ -0,0 +1,45 @@
+import numpy as np
+from sensors import RaySensor
+from tracks import default_track, generate_track
+
+def random_cars(track, n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, track.width, n)
+    y = rng.uniform(0, track.height, n)
+    angle = rng.uniform(0, 360, n)
+    # Origins on cell borders, on the screen edge and inside posts; rays along the axes
+    x[:20] = np.round(x[:20] / 50) * 50
+    y[20:40] = np.round(y[20:40] / 50) * 50
+    x[40:50] = track.width
+    y[50:60] = 0
+    posts = np.arange(10) % track.total_gates
+    x[60:70], y[60:70] = track.gate_left[posts, 0], track.gate_left[posts, 1] + 5
+    angle[:100] = rng.choice([0, 45, 90, 180, 270], 100)
+    return x, y, angle
+
+def test_grid_matches_whole_track():
+    for track in (default_track(), generate_track(1, 1.0), generate_track(3, 0.5, n_gates=100)):
+        x, y, angle = random_cars(track, 1000)
+        whole = RaySensor(12, 360, grid_min_gates=10 ** 9).observe(track, x, y, angle)
+        for cell_size in (37.0, 50.0, 300.0):
+            grid = RaySensor(12, 360, cell_size=cell_size, grid_min_gates=0).observe(track, x, y, angle)
+            assert np.abs(grid - whole).max() < 1e-9, (track.total_gates, cell_size)
+
+def test_candidates_do_not_grow_with_track_length():
+    # Same gate density, four times the gates: about as many pairs per ray
+    sensor = RaySensor(8, grid_min_gates=0)
+    per_ray = []
+    for n_gates, size in ((25, (800, 600)), (100, (1600, 1200))):
+        track = generate_track(2, 0.5, n_gates=n_gates, width=size[0], height=size[1])
+        geometry = sensor.track_geometry(track)
+        x, y, angle = random_cars(track, 500)
+        heading = np.radians(angle)[:, None] + sensor.offsets
+        cells = geometry.ray_cells(x, y, np.sin(heading), -np.cos(heading), sensor.max_range)
+        ray, _, _ = geometry.candidates(geometry.cell_segments, cells)
+        per_ray.append(len(ray) / heading.size)
+    assert per_ray[1] < 2 * per_ray[0], per_ray
+
+if __name__ == "__main__":
+    test_grid_matches_whole_track()
+    test_candidates_do_not_grow_with_track_length()
+    print("sensor tests passed")
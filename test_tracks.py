@@ -0,0 +1,50 @@
+import math
+import os
+import tempfile
+import numpy as np
+from tracks import Track, default_track, load_track, save_track
+
+def round_trip(track, suffix):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "track" + suffix)
+        save_track(track, path)
+        return load_track(path)
+
+def test_round_trip_keeps_gate_directions():
+    # Gate 1 is driven against its implicit direction, gate 2 along its line
+    track = Track([((380, 400), (420, 400)), ((500, 300), (540, 300)), ((380, 200), (420, 200))],
+                  gate_direction=[(0, 1), (1, 0), (0, 0)])
+    for suffix in (".json", ".npz"):
+        loaded = round_trip(track, suffix)
+        assert np.array_equal(loaded.gate_normal, track.gate_normal), suffix
+        assert np.array_equal(loaded.gate_directed, track.gate_directed), suffix
+        assert loaded.gates == track.gates and loaded.start == track.start
+
+def test_default_track_round_trip():
+    track = default_track()
+    for suffix in (".json", ".npz"):
+        loaded = round_trip(track, suffix)
+        assert np.array_equal(loaded.gate_normal, track.gate_normal)
+        assert np.array_equal(loaded.gate_center, track.gate_center)
+
+def test_rotated_track_round_trip():
+    # Gates that run along the course only up to rounding stay undirected
+    base = default_track()
+    angle = 0.3
+
+    def rotate(point):
+        x, y = point[0] - 400, point[1] - 300
+        return (400 + x * math.cos(angle) - y * math.sin(angle), 300 + x * math.sin(angle) + y * math.cos(angle))
+
+    track = Track([(rotate(left), rotate(right)) for left, right in base.gates], start=rotate(base.start),
+                  start_angle=math.degrees(angle), finish_target=rotate(base.finish_target))
+    for suffix in (".json", ".npz"):
+        loaded = round_trip(track, suffix)
+        assert np.array_equal(loaded.gate_directed, track.gate_directed), suffix
+        assert np.allclose(loaded.gate_normal, track.gate_normal), suffix
+
+if __name__ == "__main__":
+    test_round_trip_keeps_gate_directions()
+    test_default_track_round_trip()
+    test_rotated_track_round_trip()
+    print("track tests passed")
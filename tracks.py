@@ -0,0 +1,300 @@
+import json
+import numpy as np
+
+class Track:
+    """A course: an ordered list of gates plus start pose and screen bounds.
+
+    All per-gate geometry the games need is computed once here and stored in
+    contiguous arrays, so stepping never recomputes it:
+
+    - gate_left, gate_right: (G, 2) post positions
+    - gate_center: (G + 1, 2) centers; the extra row is the target shown to
+      the agent once every gate has been passed (finish_target)
+    - gate_tangent: (G, 2) unit vectors from left to right post
+    - gate_normal: (G, 2) unit normals pointing in the driving direction
+    - gate_half_width: (G,) half the distance between the posts
+    - gate_directed: (G,) False where the course runs along the gate line, so
+      the gate can be crossed either way
+
+    gate_direction gives the driving direction per gate; rows of zeros (or
+    None for all) mean "from the previous gate, or the start, to this gate".
+    """
+
+    def __init__(self, gates, width=800, height=600, start=None, start_angle=0,
+                 finish_target=None, gate_direction=None, name="track"):
+        if len(gates) == 0:
+            raise ValueError("A track needs at least one gate")
+        self.name = name
+        self.width = width
+        self.height = height
+        self.start = tuple(start) if start is not None else (width // 2, height - 50)
+        self.start_angle = start_angle
+
+        # Gates as lists of tuples, as drawn by CheckpointGatesGame.render
+        self.gates = [(tuple(left), tuple(right)) for left, right in gates]
+        self.total_gates = len(self.gates)
+
+        self.gate_left = np.ascontiguousarray([left for left, _ in self.gates], dtype=np.float64)
+        self.gate_right = np.ascontiguousarray([right for _, right in self.gates], dtype=np.float64)
+        centers = (self.gate_left + self.gate_right) / 2
+        if finish_target is None:
+            finish_target = centers[-1]
+        self.finish_target = tuple(finish_target)
+        self.gate_center = np.ascontiguousarray(np.vstack([centers, [self.finish_target]]))
+
+        span = self.gate_right - self.gate_left
+        self.gate_half_width = np.hypot(span[:, 0], span[:, 1]) / 2
+        if np.any(self.gate_half_width == 0):
+            raise ValueError("Gate posts must not coincide")
+        self.gate_tangent = np.ascontiguousarray(span / (2 * self.gate_half_width[:, None]))
+        normal = np.stack([-self.gate_tangent[:, 1], self.gate_tangent[:, 0]], axis=1)
+
+        # Driving direction: explicit, or from the previous gate (or start)
+        approach_from = np.vstack([[self.start], centers[:-1]])
+        direction = centers - approach_from
+        if gate_direction is not None:
+            gate_direction = np.asarray(gate_direction, dtype=np.float64).reshape(-1, 2)
+            explicit = np.any(gate_direction != 0, axis=1)
+            direction[explicit] = gate_direction[explicit]
+        approach = np.einsum("ij,ij->i", direction, normal)
+        self.gate_directed = np.abs(approach) > 1e-9
+        # Gates crossable either way keep the unflipped normal (the tests
+        # are symmetric for them), so their rows do not hang on rounding
+        flip = self.gate_directed & (approach < 0)
+        self.gate_normal = np.ascontiguousarray(np.where(flip[:, None], -normal, normal))
+
+        # Plain-float frames for the scalar game:
+        # (left x, left y, right x, right y, center x, center y, tx, ty, nx, ny)
+        self.gate_frames = [
+            tuple(float(v) for v in (*self.gate_left[g], *self.gate_right[g], *centers[g],
+                                     *self.gate_tangent[g], *self.gate_normal[g]))
+            for g in range(self.total_gates)
+        ]
+
+    def explicit_directions(self):
+        """(G, 2) gate_direction rows that rebuild this track's gate normals
+        and directedness: the normal of directed gates, the tangent (along
+        the gate line) of the others"""
+        return np.where(self.gate_directed[:, None], self.gate_normal, self.gate_tangent)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "width": self.width,
+            "height": self.height,
+            "start": list(self.start),
+            "start_angle": self.start_angle,
+            "finish_target": [float(v) for v in self.finish_target],
+            "gates": [{"left": list(left), "right": list(right), "direction": [float(v) for v in direction]}
+                      for (left, right), direction in zip(self.gates, self.explicit_directions())],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        gates = [(gate["left"], gate["right"]) for gate in data["gates"]]
+        directions = [gate.get("direction") or (0, 0) for gate in data["gates"]]
+        return cls(
+            gates,
+            width=data.get("width", 800),
+            height=data.get("height", 600),
+            start=data.get("start"),
+            start_angle=data.get("start_angle", 0),
+            finish_target=data.get("finish_target"),
+            gate_direction=directions,
+            name=data.get("name", "track"),
+        )
+
+def make_gates(width, height):
+    """Build the checkpoint gate layout for a screen of the given size"""
+    return [
+        # Each gate is defined by two points (left post, right post)
+        ((width//2 - 30, height - 200), (width//2 + 30, height - 200)),  # Gate 1
+        ((width//2 + 150, height - 350), (width//2 + 210, height - 350)), # Gate 2 (right)
+        ((width//2 + 150, height//2), (width//2 + 210, height//2)),       # Gate 3 (right middle)
+        ((width//2 - 30, height//2), (width//2 + 30, height//2)),         # Gate 4 (center)
+        ((width//2 - 210, height//2), (width//2 - 150, height//2)),       # Gate 5 (left)
+        ((width//2 - 210, height - 350), (width//2 - 150, height - 350)), # Gate 6 (left high)
+        ((width//2 - 30, height - 450), (width//2 + 30, height - 450)),   # Gate 7 (finish)
+    ]
+
+def default_track(width=800, height=600):
+    """The original seven-gate course"""
+    return Track(make_gates(width, height), width, height,
+                 start=(width // 2, height - 50), finish_target=(width // 2, 0), name="default")
+
+def load_track(path):
+    """Load a track from a .json or .npz file (see save_track)"""
+    if str(path).endswith(".npz"):
+        with np.load(path) as data:
+            return Track(
+                list(zip(data["gate_left"].tolist(), data["gate_right"].tolist())),
+                width=int(data["width"]),
+                height=int(data["height"]),
+                start=data["start"].tolist(),
+                start_angle=float(data["start_angle"]),
+                finish_target=data["finish_target"].tolist() if "finish_target" in data else None,
+                gate_direction=data["gate_direction"] if "gate_direction" in data else None,
+                name=str(data["name"]) if "name" in data else "track",
+            )
+    with open(path) as f:
+        return Track.from_dict(json.load(f))
+
+def save_track(track, path):
+    """Save a track as .json (readable) or .npz (compact, for large courses)"""
+    if str(path).endswith(".npz"):
+        np.savez_compressed(
+            path,
+            name=track.name,
+            width=track.width,
+            height=track.height,
+            start=np.array(track.start),
+            start_angle=track.start_angle,
+            finish_target=np.array(track.finish_target),
+            gate_left=track.gate_left,
+            gate_right=track.gate_right,
+            gate_direction=track.explicit_directions(),
+        )
+    else:
+        with open(path, "w") as f:
+            json.dump(track.to_dict(), f, indent=2)
+
+class TrackBank:
+    """Tracks stacked into padded arrays, so each car of a batched engine can
+    drive its own course.
+
+    Every Track array gets a leading slot axis, e.g. gate_center is
+    (slots, max_gates + 1, 2), and a car on slot s at gate g reads
+    gate_center[s, g]. Rows past a track's last gate repeat its finish target
+    (centers) or last gate (the rest). Slots are handed out by slot() and
+    reused once no car drives their track any more; the arrays are rebuilt
+    only when the bank has to grow.
+    """
+
+    def __init__(self, tracks=(), capacity=1):
+        self.tracks = []
+        self.slots = {}  # id(track) -> slot
+        self.capacity = 0
+        self.max_gates = 0
+        self._allocate(max(capacity, len(tracks)), max((t.total_gates for t in tracks), default=1))
+        for track in tracks:
+            self.slot(track)
+
+    def _allocate(self, capacity, max_gates):
+        """(Re)build the arrays for at least capacity slots of max_gates gates"""
+        self.capacity = capacity
+        self.max_gates = max_gates
+        self.gate_left = np.zeros((capacity, max_gates, 2))
+        self.gate_right = np.zeros((capacity, max_gates, 2))
+        self.gate_center = np.zeros((capacity, max_gates + 1, 2))
+        self.gate_tangent = np.zeros((capacity, max_gates, 2))
+        self.gate_normal = np.zeros((capacity, max_gates, 2))
+        self.gate_half_width = np.ones((capacity, max_gates))
+        self.gate_directed = np.zeros((capacity, max_gates), dtype=bool)
+        self.total_gates = np.ones(capacity, dtype=np.int64)
+        self.start = np.zeros((capacity, 2))
+        self.start_angle = np.zeros(capacity)
+        for slot, track in enumerate(self.tracks):
+            if track is not None:
+                self._write(slot, track)
+
+    def _write(self, slot, track):
+        g = track.total_gates
+        for name in ("gate_left", "gate_right", "gate_tangent", "gate_normal", "gate_half_width", "gate_directed"):
+            source = getattr(track, name)
+            target = getattr(self, name)[slot]
+            target[:g] = source
+            target[g:] = source[-1]
+        self.gate_center[slot, :g + 1] = track.gate_center
+        self.gate_center[slot, g + 1:] = track.gate_center[-1]
+        self.total_gates[slot] = g
+        self.start[slot] = track.start
+        self.start_angle[slot] = track.start_angle
+
+    def slot(self, track, in_use=None):
+        """Slot holding track, adding it if needed.
+
+        in_use (slots still driven by some car) lets tracks that are no longer
+        driven be replaced instead of growing the bank.
+        """
+        slot = self.slots.get(id(track))
+        if slot is not None:
+            return slot
+        if in_use is not None and len(self.tracks) >= self.capacity:
+            used = set(np.asarray(in_use).tolist())
+            for free, old in enumerate(self.tracks):
+                if old is not None and free not in used:
+                    del self.slots[id(old)]
+                    self.tracks[free] = None
+        if None in self.tracks:
+            slot = self.tracks.index(None)
+            self.tracks[slot] = track
+        else:
+            slot = len(self.tracks)
+            self.tracks.append(track)
+        if slot >= self.capacity or track.total_gates > self.max_gates:
+            self._allocate(max(self.capacity, 2 * slot, slot + 1), max(self.max_gates, track.total_gates))
+        else:
+            self._write(slot, track)
+        self.slots[id(track)] = slot
+        return slot
+
+def generate_track(seed, difficulty=0.0, n_gates=None, width=800, height=600):
+    """Procedural course for a seed and a difficulty in [0, 1].
+
+    The course is a random walk from the default start: each gate lies
+    spacing px further along a heading that turns by up to max_turn degrees,
+    steering back towards the middle of the screen when it would leave it.
+    Harder courses have more gates, sharper turns and narrower gates. The same
+    arguments always give the same track.
+    """
+    rng = np.random.default_rng(seed)
+    difficulty = min(max(difficulty, 0.0), 1.0)
+    if n_gates is None:
+        n_gates = int(round(5 + 15 * difficulty))
+    max_turn = 25 + 65 * difficulty  # Degrees between successive gates
+    half_width = 35 - 17 * difficulty  # The default gates are 30
+    spacing = (110, 190)
+    edge = 30 + half_width + 20  # Keep posts clear of the clamped screen border
+    start = (width // 2, height - 50)
+
+    centers, headings = [], []
+    x, y = start
+    heading = 0.0  # Degrees, 0 = up the screen as car_angle
+    for _ in range(n_gates):
+        for attempt in range(20):
+            if attempt < 10:
+                turn = rng.uniform(-max_turn, max_turn)
+                candidate_heading = heading + turn
+            else:
+                # Head back towards the middle of the screen
+                toward_middle = np.degrees(np.arctan2(width / 2 - x, y - height / 2))
+                candidate_heading = toward_middle + rng.uniform(-max_turn, max_turn) / 2
+            distance = rng.uniform(*spacing)
+            rad = np.radians(candidate_heading)
+            nx = x + distance * np.sin(rad)
+            ny = y - distance * np.cos(rad)
+            inside = edge <= nx <= width - edge and edge <= ny <= height - edge
+            # Avoid stacking gates on top of earlier ones
+            clear = all(np.hypot(nx - cx, ny - cy) > spacing[0] * 0.6 for cx, cy in centers)
+            if inside and clear:
+                break
+        nx = min(max(nx, edge), width - edge)
+        ny = min(max(ny, edge), height - edge)
+        heading = candidate_heading
+        x, y = nx, ny
+        centers.append((x, y))
+        headings.append(heading)
+
+    gates, directions = [], []
+    for (cx, cy), heading in zip(centers, headings):
+        rad = np.radians(heading)
+        # Posts perpendicular to the heading, left post on the driver's left
+        ox, oy = half_width * np.cos(rad), half_width * np.sin(rad)
+        gates.append(((float(cx - ox), float(cy - oy)), (float(cx + ox), float(cy + oy))))
+        directions.append((np.sin(rad), -np.cos(rad)))
+
+    # Target shown after the last gate: a bit further along the last heading
+    rad = np.radians(headings[-1])
+    finish = (min(max(x + 100 * np.sin(rad), 0), width), min(max(y - 100 * np.cos(rad), 0), height))
+    return Track(gates, width, height, start=start, finish_target=finish,
+                 gate_direction=directions, name=f"generated-{seed}-{difficulty:.2f}")
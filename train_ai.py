@@ -1,34 +1,217 @@
+import argparse
+import functools
 from stable_baselines3 import PPO
-from stable_baselines3.common.env_util import make_vec_env
-from ai_env import CheckpointRacingEnv
-import matplotlib.pyplot as plt
-
-# Create environment
-env = make_vec_env(CheckpointRacingEnv, n_envs=1)
-
-# Create the AI model
-model = PPO(
-    "MlpPolicy",
-    env,
-    verbose=1,
-    learning_rate=3e-4,
-    n_steps=2048,
-    batch_size=64,
-    n_epochs=10,
-    gamma=0.99,
-    device="cpu"  # Use "cuda" if you have GPU
-)
-
-print("Starting checkpoint racing training...")
-print("The AI needs to learn to navigate between checkpoints in sequence.")
-print("Look for 'ep_rew_mean' to increase as the AI learns to reach more checkpoints.")
-
-# Train the model
-model.learn(total_timesteps=150000)  # More training time for complex task
-
-# Save the trained model
-model.save("checkpoint_racing_model")
-print("Training complete! Model saved as 'checkpoint_racing_model'")
-
-# Close environment
-env.close()
\ No newline at end of file
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import VecMonitor
+from vec_env import CheckpointRacingVecEnv
+from subproc_vec_env import SharedMemoryVecEnv
+from env_server import RemoteVecEnv
+from tracks import load_track
+from curriculum import CurriculumScheduler
+from actor_learner import ActorLearner
+from sensors import RaySensor
+from numpy_policy import export_policy
+from checkpointing import CheckpointCallback, CheckpointManager, load_checkpoint, restore
+from instrumentation import add_profiling_args, profiled, training_logger
+
+class ThroughputCallback(BaseCallback):
+    """Log environment steps/sec per worker after every rollout"""
+
+    def __init__(self, vec_env):
+        super().__init__()
+        self.vec_env = vec_env
+
+    def _on_rollout_end(self):
+        per_worker = self.vec_env.worker_throughput()
+        for i, steps_per_sec in enumerate(per_worker):
+            self.logger.record(f"throughput/worker_{i}_steps_per_sec", steps_per_sec)
+        self.logger.record("throughput/total_steps_per_sec", self.vec_env.total_throughput())
+
+    def _on_step(self):
+        return True
+
+class ProfileCallback(BaseCallback):
+    """Log the instrumentation timers after every rollout"""
+
+    def __init__(self, profiler):
+        super().__init__()
+        self.profiler = profiler
+
+    def _on_rollout_end(self):
+        self.profiler.record(self.logger)
+
+    def _on_step(self):
+        return True
+
+class CurriculumCallback(BaseCallback):
+    """Log the curriculum's difficulty levels after every rollout"""
+
+    def __init__(self, curriculum):
+        super().__init__()
+        self.curriculum = curriculum
+
+    def _on_rollout_end(self):
+        for key, value in self.curriculum.stats().items():
+            self.logger.record(f"curriculum/{key}", value)
+
+    def _on_step(self):
+        return True
+
+def make_env(workers, envs_per_worker, start_method, game_kwargs, env_server=None):
+    """Training VecEnv (VecMonitor provides the ep_rew_mean statistics)"""
+    if env_server:
+        vec_env = RemoteVecEnv(env_server, n_envs=envs_per_worker)
+    elif workers > 0:
+        vec_env = SharedMemoryVecEnv(
+            n_workers=workers,
+            envs_per_worker=envs_per_worker,
+            start_method=start_method,
+            **game_kwargs
+        )
+    else:
+        vec_env = CheckpointRacingVecEnv(n_envs=envs_per_worker, **game_kwargs)
+    return VecMonitor(vec_env)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the checkpoint racing AI with PPO")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Environment worker processes (0 = batched engine in this process)")
+    parser.add_argument("--envs-per-worker", type=int, default=8,
+                        help="Cars simulated by each worker's batched engine")
+    parser.add_argument("--start-method", choices=["fork", "forkserver", "spawn"], default="forkserver",
+                        help="multiprocessing start method for the workers")
+    parser.add_argument("--timesteps", type=int, default=150000)
+    parser.add_argument("--crossing", choices=["band", "swept"], default="band",
+                        help="Gate test: 20 px band (original) or swept segment (safe for large steps)")
+    parser.add_argument("--dt", type=float, default=1.0, help="Game time simulated per step")
+    parser.add_argument("--substeps", type=int, default=1, help="Physics ticks per step")
+    parser.add_argument("--frame-skip", type=int, default=1,
+                        help="Repeat each action for this many steps (rewards summed)")
+    parser.add_argument("--track", help="Track file (.json or .npz) instead of the default course")
+    parser.add_argument("--curriculum", type=int, default=0, metavar="LEVELS",
+                        help="Train on generated tracks of this many difficulty levels (0 = off)")
+    parser.add_argument("--rays", type=int, default=0,
+                        help="Add this many ray-cast distance readings to the observation")
+    parser.add_argument("--ray-fov", type=float, default=180.0, help="Degrees covered by the rays")
+    parser.add_argument("--actor-learner", action="store_true",
+                        help="Keep stepping environments with a slightly stale policy while PPO optimizes")
+    parser.add_argument("--queue-size", type=int, default=2,
+                        help="Rollouts the actor may run ahead of the learner (--actor-learner)")
+    parser.add_argument("--env-server", metavar="ADDRESS",
+                        help="Step environments in a running env_server.py (socket path or host:port); "
+                             "the game settings are the server's")
+    parser.add_argument("--checkpoint-dir", default="checkpoints", help="Directory for periodic checkpoints")
+    parser.add_argument("--checkpoint-every", type=int, default=0, metavar="TIMESTEPS",
+                        help="Checkpoint (from a background thread) this often, e.g. 16384 (default 0 = off)")
+    parser.add_argument("--keep-last", type=int, default=2, help="Newest checkpoints kept for resuming")
+    parser.add_argument("--keep-best", type=int, default=3, help="Best checkpoints (by gates passed) kept")
+    parser.add_argument("--eval-episodes", type=int, default=100,
+                        help="Headless episodes scoring each checkpoint (0 = no scoring)")
+    parser.add_argument("--resume", metavar="PATH",
+                        help="Continue from a checkpoint file, or the newest one in a checkpoint directory")
+    add_profiling_args(parser, "train")
+    parser.add_argument("--log-dir", default="logs",
+                        help="With --instrument: training metrics and timers as CSV (and TensorBoard) here")
+    args = parser.parse_args()
+    if args.actor_learner and (args.checkpoint_every or args.resume):
+        # The actor-learner loop runs no callbacks
+        parser.error("--checkpoint-every and --resume do not work with --actor-learner")
+    return args
+
+def main():
+    args = parse_args()
+
+    game_kwargs = dict(crossing=args.crossing, dt=args.dt, substeps=args.substeps,
+                       frame_skip=args.frame_skip)
+    if args.track:
+        game_kwargs["track"] = load_track(args.track)
+    if args.curriculum:
+        game_kwargs["curriculum"] = CurriculumScheduler(levels=args.curriculum)
+    if args.rays:
+        game_kwargs["sensor"] = RaySensor(args.rays, fov=args.ray_fov)
+
+    # Create environment
+    callbacks = []
+    if args.actor_learner:
+        # The environments live in the actor process; the model's env only
+        # supplies the spaces and is never stepped
+        env_fn = functools.partial(make_env, args.workers, args.envs_per_worker, args.start_method, game_kwargs,
+                                   args.env_server)
+        n_envs = args.envs_per_worker if args.env_server else max(args.workers, 1) * args.envs_per_worker
+        env = VecMonitor(CheckpointRacingVecEnv(n_envs=n_envs, sensor=game_kwargs.get("sensor")))
+    else:
+        env = make_env(args.workers, args.envs_per_worker, args.start_method, game_kwargs, args.env_server)
+    vec_env = env.venv
+    if args.env_server:
+        print(f"Stepping {env.num_envs} environments in the server at {args.env_server}")
+    elif args.workers > 0:
+        print(f"Running {vec_env.num_envs} environments in {args.workers} worker processes ({args.start_method})")
+        if not args.actor_learner:
+            callbacks.append(ThroughputCallback(vec_env))
+    elif args.curriculum and not args.actor_learner:
+        # Worker processes keep their schedulers to themselves
+        callbacks.append(CurriculumCallback(vec_env.game.curriculum))
+
+    # Create the AI model
+    model = PPO(
+        "MlpPolicy",
+        env,
+        verbose=1,
+        learning_rate=3e-4,
+        n_steps=max(2048 // env.num_envs, 1),  # Same 2048 transitions per update
+        batch_size=64,
+        n_epochs=10,
+        gamma=0.99,
+        device="cpu"  # Use "cuda" if you have GPU
+    )
+
+    manager = None
+    if args.checkpoint_every:
+        eval_kwargs = {key: value for key, value in game_kwargs.items() if key != "curriculum"}
+        manager = CheckpointManager(args.checkpoint_dir, keep_last=args.keep_last, keep_best=args.keep_best,
+                                    eval_episodes=args.eval_episodes, eval_kwargs=eval_kwargs)
+        callbacks.append(CheckpointCallback(manager, args.checkpoint_every))
+    if args.resume:
+        restore(model, load_checkpoint(args.resume))
+        print(f"Resuming from {args.resume} at {model.num_timesteps} timesteps")
+
+    print("Starting checkpoint racing training...")
+    print("The AI needs to learn to navigate between checkpoints in sequence.")
+    print("Look for 'ep_rew_mean' to increase as the AI learns to reach more checkpoints.")
+
+    # Train the model
+    def train(profiler):
+        if args.actor_learner:
+            actor_learner = ActorLearner(model, env_fn, queue_size=args.queue_size, start_method=args.start_method)
+            actor_learner.learn(total_timesteps=args.timesteps)
+        else:
+            if profiler is not None:
+                model.set_logger(training_logger(args.log_dir))
+                print(f"Logging training metrics and phase timers to {args.log_dir}")
+                callbacks.append(ProfileCallback(profiler))
+            # More training time for complex task; a resumed run does the rest
+            model.learn(total_timesteps=args.timesteps - model.num_timesteps, callback=callbacks,
+                        reset_num_timesteps=not args.resume)
+
+    profiled(args, "train", train)
+    if manager is not None:
+        manager.close()
+        best = manager.best()
+        if best:
+            print(f"Best checkpoint: {best[0]['file']} ({best[0]['mean_gates_passed']:.2f} gates passed on average)")
+
+    if args.workers > 0 and not args.actor_learner and not args.env_server:
+        for i, steps_per_sec in enumerate(vec_env.worker_throughput()):
+            print(f"Worker {i}: {steps_per_sec:,.0f} env steps/sec")
+        print(f"Total: {vec_env.total_throughput():,.0f} env steps/sec")
+
+    # Save the trained model
+    model.save("checkpoint_racing_model")
+    export_policy(model, "checkpoint_racing_model.npz")  # Torch-free copy for test_ai.py and friends
+    print("Training complete! Model saved as 'checkpoint_racing_model' (.zip and NumPy .npz)")
+
+    # Close environment
+    env.close()
+
+if __name__ == "__main__":
+    main()
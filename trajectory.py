@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+# Column dtypes and per-transition shapes (obs width is set per recording)
+COLUMNS = {
+    "obs": np.float32,
+    "action": np.int8,
+    "reward": np.float32,
+    "done": np.bool_,
+    "truncated": np.bool_,
+    "env": np.int32,
+    "pose": np.float32,  # x, y, angle, speed of the car seen in obs
+}
+
+class TrajectoryWriter:
+    """Append transitions to columnar, chunked .npy shards from a background thread.
+
+    Rows are buffered in preallocated column arrays of shard_size rows; a full
+    buffer is handed to the writer thread (through a queue of max_pending
+    shards, so memory stays bounded) which saves each column as
+    <column>_<shard>.npy and then rewrites index.json. The index only ever
+    lists complete shards, so a recording can be read while it grows or after
+    a crash. Transitions of all environments are interleaved in step order;
+    the env column tells them apart.
+    """
+
+    def __init__(self, directory, obs_size, shard_size=65536, max_pending=4):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.shapes = {"obs": (obs_size,), "pose": (4,)}
+        os.makedirs(directory, exist_ok=True)
+
+        self.index = {
+            "columns": {name: {"dtype": np.dtype(dtype).str, "shape": list(self.shapes.get(name, ()))}
+                        for name, dtype in COLUMNS.items()},
+            "shards": [],
+            "rows": 0,
+        }
+        self.buffer = self._allocate()
+        self.filled = 0
+        self.shards_started = 0
+        self.error = None
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def _allocate(self):
+        return {name: np.zeros((self.shard_size,) + self.shapes.get(name, ()), dtype=dtype)
+                for name, dtype in COLUMNS.items()}
+
+    def add(self, obs, actions, rewards, dones, truncated=None, poses=None, envs=None):
+        """Append one step of every environment: (N, obs) observations, (N,)
+        actions, rewards, dones and truncation flags, (N, 4) poses and env ids
+        (default 0..N-1)"""
+        obs = np.asarray(obs)
+        n = len(obs)
+        columns = {
+            "obs": obs,
+            "action": actions,
+            "reward": rewards,
+            "done": dones,
+            "truncated": truncated if truncated is not None else False,
+            "env": envs if envs is not None else np.arange(n),
+            "pose": poses if poses is not None else 0,
+        }
+        start = 0
+        while start < n:
+            rows = min(n - start, self.shard_size - self.filled)
+            for name, values in columns.items():
+                values = np.asarray(values)
+                self.buffer[name][self.filled:self.filled + rows] = values[start:start + rows] if values.ndim else values
+            self.filled += rows
+            start += rows
+            if self.filled == self.shard_size:
+                self.flush()
+
+    def flush(self):
+        """Hand the buffered rows (if any) to the writer thread as a shard"""
+        if self.error is not None:
+            raise self.error
+        if self.filled == 0:
+            return
+        shard = {name: column[:self.filled] for name, column in self.buffer.items()}
+        self.pending.put((self.shards_started, shard))
+        self.shards_started += 1
+        self.buffer = self._allocate()
+        self.filled = 0
+
+    def _writer(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            number, shard = item
+            try:
+                for name, column in shard.items():
+                    np.save(os.path.join(self.directory, f"{name}_{number:06d}.npy"), column)
+                rows = len(shard["obs"])
+                self.index["shards"].append({"shard": number, "rows": rows})
+                self.index["rows"] += rows
+                # Replace the index atomically: readers never see a partial one
+                path = os.path.join(self.directory, "index.json")
+                with open(path + ".tmp", "w") as f:
+                    json.dump(self.index, f, indent=1)
+                os.replace(path + ".tmp", path)
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        """Write the remaining rows and wait for the writer thread"""
+        self.flush()
+        self.pending.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TrajectoryDataset:
+    """Read a TrajectoryWriter recording without loading it into memory.
+
+    Every shard column is opened as a read-only memory map on first use, so
+    only the pages actually touched are read from disk. iter_batches()
+    streams the transitions in recorded order; sample() draws random
+    transitions from all shards.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "index.json")) as f:
+            self.index = json.load(f)
+        self.columns = list(self.index["columns"])
+        rows = [shard["rows"] for shard in self.index["shards"]]
+        self.offsets = np.concatenate([[0], np.cumsum(rows)]).astype(np.int64)
+        self.maps = {}
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def column(self, name, shard):
+        """Memory map of one column of the shard-th shard"""
+        key = (name, shard)
+        if key not in self.maps:
+            number = self.index["shards"][shard]["shard"]
+            self.maps[key] = np.load(os.path.join(self.directory, f"{name}_{number:06d}.npy"), mmap_mode="r")
+        return self.maps[key]
+
+    def __getitem__(self, i):
+        """Transition i as a dict of column values"""
+        if i < 0:
+            i += len(self)
+        shard = int(np.searchsorted(self.offsets, i, "right")) - 1
+        return {name: self.column(name, shard)[i - self.offsets[shard]] for name in self.columns}
+
+    def iter_batches(self, batch_size=4096, columns=None):
+        """Yield dicts of consecutive rows, batch_size rows at a time (the last
+        batch of each shard may be shorter)"""
+        columns = columns or self.columns
+        for shard in range(len(self.index["shards"])):
+            rows = self.offsets[shard + 1] - self.offsets[shard]
+            for start in range(0, rows, batch_size):
+                yield {name: np.array(self.column(name, shard)[start:start + batch_size]) for name in columns}
+
+    def sample(self, batch_size, rng=None, columns=None):
+        """A dict of batch_size transitions drawn uniformly with replacement"""
+        rng = rng if rng is not None else np.random.default_rng()
+        columns = columns or self.columns
+        indices = np.sort(rng.integers(0, len(self), batch_size))
+        shards = np.searchsorted(self.offsets, indices, "right") - 1
+        batch = {}
+        for name in columns:
+            info = self.index["columns"][name]
+            batch[name] = np.empty((batch_size,) + tuple(info["shape"]), dtype=np.dtype(info["dtype"]))
+        # Sorted indices: one fancy-indexed read per shard
+        for shard in np.unique(shards):
+            rows = np.flatnonzero(shards == shard)
+            local = indices[rows] - self.offsets[shard]
+            for name in columns:
+                batch[name][rows] = self.column(name, shard)[local]
+        return batch
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Record transitions of the trained AI for offline use")
+    parser.add_argument("--model", default="checkpoint_racing_model")
+    parser.add_argument("--steps", type=int, default=1000000, help="Transitions to record")
+    parser.add_argument("--envs", type=int, default=256, help="Environments run in parallel")
+    parser.add_argument("--stochastic", action="store_true",
+                        help="Sample actions instead of taking the most likely one")
+    parser.add_argument("--shard-size", type=int, default=65536, help="Transitions per shard")
+    parser.add_argument("--out", default="trajectories")
+    return parser.parse_args()
+
+def main():
+    from stable_baselines3 import PPO
+    from vec_env import CheckpointRacingVecEnv
+
+    args = parse_args()
+    model = PPO.load(args.model, device="cpu")
+    env = CheckpointRacingVecEnv(n_envs=args.envs)
+
+    started = time.perf_counter()
+    recorded = 0
+    obs = env.reset()
+    with TrajectoryWriter(args.out, env.observation_space.shape[0], shard_size=args.shard_size) as writer:
+        while recorded < args.steps:
+            poses = np.stack([env.game.car_x, env.game.car_y, env.game.car_angle, env.game.car_speed], axis=1)
+            actions, _ = model.predict(obs, deterministic=not args.stochastic)
+            next_obs, rewards, dones, infos = env.step(actions)
+            truncated = np.array([info.get("TimeLimit.truncated", False) for info in infos])
+            writer.add(obs, actions, rewards, dones, truncated, poses)
+            recorded += len(obs)
+            obs = next_obs
+    elapsed = time.perf_counter() - started
+    print(f"Recorded {recorded} transitions to {args.out} in {elapsed:.1f}s "
+          f"({recorded / elapsed:,.0f} transitions/sec)")
+
+if __name__ == "__main__":
+    main()
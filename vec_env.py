@@ -0,0 +1,116 @@
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from batched_game import BatchedCheckpointGatesGame
+from sensors import observation_bounds
+
+class CheckpointRacingVecEnv(VecEnv):
+    """SB3 VecEnv that steps every environment in one batched engine call.
+
+    Behaves like make_vec_env(CheckpointRacingEnv, n_envs) - same observations,
+    rewards, max_steps truncation and auto-reset with terminal_observation in
+    infos - without one Python game object (and pygame window) per environment.
+    Extra keyword arguments (crossing, dt, substeps, frame_skip, track,
+    curriculum, sensor, race_size, collider) go to the engine; max_steps counts
+    game ticks, so it is unaffected by frame_skip. With race_size, environments
+    are the cars of shared races and one policy drives them all (self-play);
+    finished episodes report their collisions in infos.
+    """
+
+    def __init__(self, n_envs=1, max_steps=3000, **game_kwargs):
+        self.game = BatchedCheckpointGatesGame(n_envs, **game_kwargs)
+        self.env_kwargs = game_kwargs  # For replay.ActionLog
+        self.render_mode = None
+
+        # Same spaces as CheckpointRacingEnv (gymnasium, as SB3 expects)
+        action_space = spaces.Discrete(5)
+        low, high = observation_bounds(self.game.sensor)
+        observation_space = spaces.Box(low=low, high=high, dtype=np.float32)
+        super().__init__(n_envs, observation_space, action_space)
+
+        self.max_steps = max_steps  # Enough time (in game ticks) to complete the course
+        self.current_step = np.zeros(n_envs, dtype=np.int64)
+        self.actions = None
+
+        # Step buffers filled in place by the engine
+        self._obs = np.zeros((n_envs, len(low)), dtype=np.float32)
+        self._rewards = np.zeros(n_envs, dtype=np.float32)
+        self._game_done = np.zeros(n_envs, dtype=bool)
+        self._truncated = np.zeros(n_envs, dtype=bool)
+        self._dones = np.zeros(n_envs, dtype=bool)
+
+    def reset(self):
+        """Reset every environment and return the (n_envs, obs size) observations"""
+        seeds = [seed for seed in self._seeds if seed is not None]
+        if seeds:
+            # Same global seeding as CheckpointRacingEnv.seed
+            np.random.seed(seeds[0])
+        self._reset_seeds()
+        self._reset_options()
+        self.current_step[:] = 0
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        return self.game.reset().astype(np.float32)
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        self.game.step_into(self.actions, self._obs, self._rewards, self._game_done)
+        self.current_step += self.game.ticks
+
+        # End episode if max steps reached
+        np.greater_equal(self.current_step, self.max_steps, out=self._truncated)
+        np.logical_or(self._game_done, self._truncated, out=self._dones)
+
+        infos = [{} for _ in range(self.num_envs)]
+        done_indices = np.flatnonzero(self._dones)
+        if len(done_indices):
+            for i in done_indices:
+                infos[i]["terminal_observation"] = self._obs[i].copy()
+                infos[i]["TimeLimit.truncated"] = bool(self._truncated[i])
+                infos[i]["gates_passed"] = int(self.game.gates_passed[i])
+                infos[i]["steps_taken"] = int(self.game.steps_taken[i])
+                if self.game.collider is not None:
+                    infos[i]["collisions"] = int(self.game.collisions[i])
+
+            # Auto-reset finished environments
+            self.current_step[done_indices] = 0
+            self.game.reset_cars(done_indices)
+            self.game.observe_into(done_indices, self._obs)
+
+        # Copies: SB3 keeps the returned arrays across steps
+        return self._obs.copy(), self._rewards.copy(), self._dones.copy(), infos
+
+    def get_state_snapshot(self, indices=None):
+        """(CAR_STATE records, step counts) of the selected environments"""
+        if indices is None:
+            indices = np.arange(self.num_envs)
+        return self.game.get_state_snapshot(indices), self.current_step[indices].copy()
+
+    def restore(self, snapshot, indices=None):
+        """Return the selected environments (all by default) to a
+        get_state_snapshot() state, e.g. to warm-start episodes mid-course;
+        returns their observations"""
+        if indices is None:
+            indices = np.arange(self.num_envs)
+        cars, steps = snapshot
+        self.game.restore(cars, indices)
+        self.current_step[indices] = steps
+        self.game.observe_into(indices, self._obs)
+        return self._obs[indices].copy()
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        method = getattr(self, method_name)
+        return [method(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]